@@ -7,6 +7,7 @@ from oslo_utils import uuidutils
 from nectar_tools.audit import base
 from nectar_tools import auth
 from nectar_tools import eol
+from nectar_tools.expiry import archiver
 from nectar_tools.expiry import expiry_states
 
 LOG = logging.getLogger(__name__)
@@ -48,13 +49,15 @@ class ClusterAuditor(base.Auditor):
         self.client = auth.get_magnum_client(sess=self.ks_session)
         self.k_client = auth.get_keystone_client(sess=self.ks_session)
         self.varroa_client = auth.get_varroa_client(sess=self.ks_session)
+        self.cluster_index = archiver.ClusterIndex(self.client)
         self._risk_types = None
 
     def _delete_cluster(self, cluster):
-        self.repair(
-            f"{cluster.uuid}: - Deleting cluster",
-            lambda: self.client.clusters.delete(cluster.uuid),
-        )
+        def _delete():
+            self.client.clusters.delete(cluster.uuid)
+            self.cluster_index.invalidate(cluster.project_id)
+
+        self.repair(f"{cluster.uuid}: - Deleting cluster", _delete)
 
     # Case: CAPI clusters with a stuck loadbalancer
     def _fix_cluster_loadbalancer(self, cluster):
@@ -135,7 +138,7 @@ class ClusterAuditor(base.Auditor):
         kubernetes = eol.Product('kubernetes')
         today = datetime.date.today()
 
-        clusters = self.client.clusters.list(detail=True)
+        clusters = self.cluster_index.get_all_clusters()
         for cluster in clusters:
             if (
                 'DELETE' in cluster.status
@@ -203,7 +206,7 @@ class ClusterAuditor(base.Auditor):
         )
 
     def check_status(self):
-        clusters = self.client.clusters.list(detail=True)
+        clusters = self.cluster_index.get_all_clusters()
         for cluster in clusters:
             project = self.k_client.projects.get(cluster.project_id)
 
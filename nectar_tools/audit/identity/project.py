@@ -2,6 +2,7 @@ import logging
 
 
 from nectar_tools.audit.identity import base
+from nectar_tools import auth
 from nectar_tools.expiry import archiver
 from nectar_tools import utils
 
@@ -12,11 +13,16 @@ LOG = logging.getLogger(__name__)
 class ProjectAuditor(base.IdentityAuditor):
     def check_deleted_no_instances(self):
         projects = utils.list_resources(self.k_client.projects.list)
+        instance_index = archiver.InstanceIndex(
+            auth.get_nova_client(self.ks_session)
+        )
         for project in projects:
             status = getattr(project, 'expiry_status', None)
             if status == 'deleted':
                 nova_archiver = archiver.NovaArchiver(
-                    project, ks_session=self.ks_session
+                    project,
+                    ks_session=self.ks_session,
+                    instance_index=instance_index,
                 )
                 instances = nova_archiver._all_instances()
                 if instances:
@@ -1,9 +1,12 @@
+import collections
 import logging
+import threading
 
 from blazarclient import client as blazarclient
 from cinderclient import client as cinderclient
 from cloudkittyclient import client as cloudkittyclient
 from designateclient import client as designateclient
+from freshdesk.v2 import api as fd_api
 import glanceclient
 from gnocchiclient import client as gnocchiclient
 from heatclient import client as heatclient
@@ -26,10 +29,102 @@ from varroaclient import client as varroaclient
 from warreclient import client as warreclient
 
 from nectar_tools.config import configurable
+from nectar_tools import ratelimit
 
 
 LOG = logging.getLogger(__name__)
 
+# Clients kept by the registry before the least recently used are dropped
+MAX_CLIENTS = 100
+
+
+class ClientRegistry:
+    """Process-wide cache of service clients
+
+    Clients are keyed by service name, API version, session and any extra
+    scoping arguments so that every archiver, notifier and auditor using
+    the same session shares a single client instance.  Callers without a
+    session share the default sessions kept here, see
+    get_default_session().  The least recently used clients are dropped
+    once there are more than max_clients, so a long running process
+    creating new sessions doesn't keep every client it has made.
+    """
+
+    def __init__(self, max_clients=MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._clients = collections.OrderedDict()
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def get(self, key, factory):
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                self.reused += 1
+                return client
+        # Build outside the lock, client construction may hit the network
+        client = factory()
+        with self._lock:
+            existing = self._clients.setdefault(key, client)
+            if existing is client:
+                self.created += 1
+                while len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            else:
+                self.reused += 1
+            return existing
+
+    def get_session(self, system_scope, factory):
+        with self._lock:
+            sess = self._sessions.get(system_scope)
+        if sess is None:
+            sess = factory()
+            with self._lock:
+                sess = self._sessions.setdefault(system_scope, sess)
+        return sess
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._sessions.clear()
+            self.created = 0
+            self.reused = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'created': self.created,
+                'reused': self.reused,
+            }
+
+    def values(self):
+        with self._lock:
+            return list(self._clients.values())
+
+
+CLIENTS = ClientRegistry()
+
+
+def log_client_stats():
+    stats = CLIENTS.stats()
+    LOG.debug(
+        "Client registry: %(created)s clients created, %(reused)s reused",
+        stats,
+    )
+    for cached in CLIENTS.values():
+        session = getattr(cached, '_session', None)
+        if isinstance(session, ratelimit.RateLimitedSession):
+            LOG.debug(
+                "%(client)s: %(throttled_requests)s requests throttled for "
+                "%(throttled_seconds).1fs, %(rate_limited)s rate limited",
+                dict(session.stats(), client=type(cached).__module__),
+            )
+    return stats
+
 
 @configurable('openstack.client', env_prefix='OS')
 def get_session(
@@ -64,151 +159,268 @@ def get_session(
     return conn.session
 
 
+def get_default_session(system_scope='project'):
+    """Session shared by every caller that doesn't have its own
+
+    A new session per call would also mean new clients per call, as the
+    clients are cached by session.
+    """
+    if system_scope == 'project':
+        return CLIENTS.get_session(system_scope, get_session)
+    return CLIENTS.get_session(
+        system_scope, lambda: get_session(system_scope=system_scope)
+    )
+
+
 def get_keystone_client(sess=None):
     if not sess:
-        sess = get_session()
-    return client.Client(session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('keystone', '3', sess), lambda: client.Client(session=sess)
+    )
 
 
 def get_allocation_client(sess=None):
     if not sess:
-        sess = get_session()
-    return allocationclient.Client(1, session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('allocation', 1, sess),
+        lambda: allocationclient.Client(1, session=sess),
+    )
 
 
 def get_nova_client(sess=None):
     if not sess:
-        sess = get_session()
-    return novaclient.Client('2.87', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('nova', '2.87', sess), lambda: novaclient.Client('2.87', session=sess)
+    )
 
 
 def get_cinder_client(sess=None):
     if not sess:
-        sess = get_session()
-    return cinderclient.Client('3', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('cinder', '3', sess), lambda: cinderclient.Client('3', session=sess)
+    )
 
 
 def get_manila_client(sess=None):
     if not sess:
-        sess = get_session()
-    return manilaclient.Client('2.40', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('manila', '2.40', sess),
+        lambda: manilaclient.Client('2.40', session=sess),
+    )
 
 
 def get_glance_client(sess=None):
     if not sess:
-        sess = get_session()
-    return glanceclient.Client('2', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('glance', '2', sess), lambda: glanceclient.Client('2', session=sess)
+    )
 
 
 def get_neutron_client(sess=None):
     if not sess:
-        sess = get_session()
-    return neutronclient.Client('2.0', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('neutron', '2.0', sess),
+        lambda: neutronclient.Client('2.0', session=sess),
+    )
 
 
 def get_trove_client(sess=None):
     if not sess:
-        sess = get_session()
-    return troveclient.Client('1.0', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('trove', '1.0', sess), lambda: troveclient.Client('1.0', session=sess)
+    )
 
 
 def get_designate_client(sess=None, project_id=None, all_projects=False):
+    """Return a Designate client, acting for project_id if given
+
+    Clients for a project aren't cached, the caller keeps its own.
+    """
     if not sess:
-        sess = get_session()
-    return designateclient.Client(
-        '2',
-        session=sess,
-        sudo_project_id=project_id,
-        all_projects=all_projects,
+        sess = get_default_session()
+
+    def _make_client():
+        return designateclient.Client(
+            '2',
+            session=sess,
+            sudo_project_id=project_id,
+            all_projects=all_projects,
+        )
+
+    if project_id:
+        return _make_client()
+    d_client = CLIENTS.get(
+        ('designate', '2', sess, all_projects), _make_client
     )
+    # Callers switch to admin by clearing sudo_project_id on the client's
+    # session, so restore the scope a shared client was created with.
+    d_client.session.sudo_project_id = None
+    return d_client
 
 
 def get_gnocchi_client(sess=None):
     if not sess:
-        sess = get_session()
-    return gnocchiclient.Client('1', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('gnocchi', '1', sess), lambda: gnocchiclient.Client('1', session=sess)
+    )
+
 
+def get_swift_client(sess=None, project_id=None, shared=True):
+    """Return a Swift client, scoped to project_id if given
 
-def get_swift_client(sess=None, project_id=None):
+    Clients for a project aren't cached, the caller keeps its own.
+
+    :param bool shared: Return the cached client, pass False for a new
+        connection when it will be used from another thread
+    """
     if not sess:
-        sess = get_session()
-    os_opts = {}
-    if project_id:
-        endpoint = sess.get_endpoint(service_type='object-store')
-        auth_project = sess.get_project_id()
-        endpoint = endpoint.replace(
-            f'AUTH_{auth_project}', f'AUTH_{project_id}'
-        )
-        os_opts['object_storage_url'] = f'{endpoint}'
-    return swiftclient.Connection(session=sess, os_options=os_opts)
+        sess = get_default_session()
+
+    def _make_client():
+        os_opts = {}
+        if project_id:
+            endpoint = sess.get_endpoint(service_type='object-store')
+            auth_project = sess.get_project_id()
+            endpoint = endpoint.replace(
+                f'AUTH_{auth_project}', f'AUTH_{project_id}'
+            )
+            os_opts['object_storage_url'] = f'{endpoint}'
+        return swiftclient.Connection(session=sess, os_options=os_opts)
+
+    if project_id or not shared:
+        return _make_client()
+    return CLIENTS.get(('swift', '1', sess), _make_client)
 
 
 def get_openstacksdk(sess=None):
     if not sess:
-        sess = get_session()
-    return sdkconnection.Connection(session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('openstacksdk', None, sess),
+        lambda: sdkconnection.Connection(session=sess),
+    )
 
 
 def get_murano_client(sess=None):
     if not sess:
-        sess = get_session()
-    return muranoclient.Client(
-        version='1', session=sess, service_type='application-catalog'
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('murano', '1', sess),
+        lambda: muranoclient.Client(
+            version='1', session=sess, service_type='application-catalog'
+        ),
     )
 
 
 def get_placement_client(sess=None):
     if not sess:
-        sess = get_session()
-    return placementclient.Client(version='1', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('placement', '1', sess),
+        lambda: placementclient.Client(version='1', session=sess),
+    )
 
 
 def get_manuka_client(sess=None):
     if not sess:
-        sess = get_session()
-    return manukaclient.Client(version='1', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('manuka', '1', sess),
+        lambda: manukaclient.Client(version='1', session=sess),
+    )
 
 
 def get_magnum_client(sess=None):
     if not sess:
-        sess = get_session()
-    return magnumclient.Client(version='1', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('magnum', '1', sess),
+        lambda: magnumclient.Client(version='1', session=sess),
+    )
 
 
 def get_heat_client(sess=None):
     if not sess:
-        sess = get_session()
-    return heatclient.Client(version='1', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('heat', '1', sess),
+        lambda: heatclient.Client(version='1', session=sess),
+    )
 
 
 def get_cloudkitty_client(sess=None):
     if not sess:
-        sess = get_session()
-    return cloudkittyclient.Client(version='2', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('cloudkitty', '2', sess),
+        lambda: cloudkittyclient.Client(version='2', session=sess),
+    )
 
 
 def get_warre_client(sess=None):
     if not sess:
-        sess = get_session()
-    return warreclient.Client(version='1', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('warre', '1', sess),
+        lambda: warreclient.Client(version='1', session=sess),
+    )
 
 
 def get_taynac_client(sess=None):
     if not sess:
-        sess = get_session()
-    return taynacclient.Client(version='1', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('taynac', '1', sess),
+        lambda: taynacclient.Client(version='1', session=sess),
+    )
 
 
 def get_blazar_client(sess=None):
     if not sess:
-        sess = get_session()
-    return blazarclient.Client(session=sess, service_type='reservation')
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('blazar', None, sess),
+        lambda: blazarclient.Client(session=sess, service_type='reservation'),
+    )
 
 
 def get_varroa_client(sess=None):
     if not sess:
-        sess = get_session()
-    return varroaclient.Client(version='1', session=sess)
+        sess = get_default_session()
+    return CLIENTS.get(
+        ('varroa', '1', sess),
+        lambda: varroaclient.Client(version='1', session=sess),
+    )
+
+
+def get_freshdesk_client(domain, api_key, rate_limit=None):
+    """FreshDesk client shared by every notifier, paced to its rate limit
+
+    :param int rate_limit: requests per minute to start at, until FreshDesk
+        reports the account's limit
+    """
+
+    def factory():
+        api = fd_api.API(domain, api_key)
+        session = ratelimit.RateLimitedSession(
+            int(rate_limit or ratelimit.DEFAULT_RATE_LIMIT)
+        )
+        # As set up by fd_api.API
+        session.auth = (api_key, 'unused_with_api_key')
+        session.headers['Content-Type'] = 'application/json'
+        api._session = session
+        return api
+
+    return CLIENTS.get(('freshdesk', domain, api_key), factory)
 
 
 @configurable('kubernetes_client', env_prefix='KUBE')
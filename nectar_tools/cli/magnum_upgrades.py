@@ -58,6 +58,9 @@ class MagnumDatastoreUpgradesCmd(cmd_base.CmdBase):
             dry_run=not self.args.no_dry_run,
         )
         self.limit = self.args.limit
+        self.user_index = None
+        if not self.args.cluster:
+            self.user_index = utils.ProjectUserIndex(self.k_client)
         self.action = self.args.action.lower()
         if self.action not in ['notify', 'upgrade', 'report']:
             print("Acion not valid, choices upgrade,notify")
@@ -181,7 +184,9 @@ class MagnumDatastoreUpgradesCmd(cmd_base.CmdBase):
             'project': project,
             'date': self.args.date,
         }
-        recipient, cc = utils.get_project_recipients(self.k_client, project)
+        recipient, cc = utils.get_project_recipients(
+            self.k_client, project, index=self.user_index
+        )
         if re.search(near_eol_version_re, cluster_template.name):
             stage = 'near-eol-upgrade'
         else:
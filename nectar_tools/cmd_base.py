@@ -1,6 +1,8 @@
 from nectar_tools import auth
 from nectar_tools import config
+from nectar_tools import events
 from nectar_tools import log
+from nectar_tools import notifier
 from nectar_tools import sentry
 
 
@@ -9,6 +11,9 @@ OSLO_CONF = config.OSLO_CONF
 
 
 class CmdBase:
+    # Directories under templates compiled by --precompile-templates
+    TEMPLATE_DIRS = []
+
     def __init__(self, log_filename=None):
         self.parser = CONFIG.get_parser()
         self.add_args()
@@ -23,7 +28,14 @@ class CmdBase:
         if self.args.no_dry_run:
             self.dry_run = False
 
-        self.session = auth.get_session()
+        if self.args.no_events:
+            events.disable()
+
+        if self.args.precompile_templates:
+            for template_dir in self.TEMPLATE_DIRS:
+                notifier.precompile_templates(template_dir)
+
+        self.session = auth.get_default_session()
         self.k_client = auth.get_keystone_client(self.session)
 
     def add_args(self):
@@ -34,3 +46,13 @@ class CmdBase:
             help='Perform the actual actions, default is to \
                               only show what would happen',
         )
+        self.parser.add_argument(
+            '--no-events',
+            action='store_true',
+            help="Don't send audit events to the message queue",
+        )
+        self.parser.add_argument(
+            '--precompile-templates',
+            action='store_true',
+            help="Compile the command's notification templates at startup",
+        )
@@ -0,0 +1,63 @@
+import logging
+import threading
+
+from oslo_context import context
+import oslo_messaging
+
+from nectar_tools import config
+
+
+CONF = config.CONFIG
+LOG = logging.getLogger(__name__)
+OSLO_CONF = config.OSLO_CONF
+OSLO_CONTEXT = context.RequestContext()
+
+_lock = threading.Lock()
+_notifier = None
+_enabled = True
+
+
+def disable():
+    """Turn off event sending for this process"""
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    """Forget the shared notifier and re-enable events"""
+    global _notifier, _enabled
+    with _lock:
+        _notifier = None
+        _enabled = True
+
+
+def get_notifier():
+    """Return the process-wide event notifier
+
+    The notification transport is created, and the audit queues declared,
+    the first time an event is sent rather than once per expirer or
+    manager.  Returns None when events are disabled.
+    """
+    global _notifier
+    if not _enabled:
+        return None
+    with _lock:
+        if _notifier is None:
+            transport = oslo_messaging.get_notification_transport(OSLO_CONF)
+            target = oslo_messaging.Target(
+                exchange='openstack', topic='notifications'
+            )
+            for queue in CONF.events.notifier_queues.split(','):
+                transport._driver.listen_for_notifications(
+                    [(target, 'audit')], queue, 1, 1
+                )
+            _notifier = oslo_messaging.Notifier(transport, 'expiry')
+    return _notifier
+
+
+def send(event_type, payload):
+    notifier = get_notifier()
+    if notifier is None:
+        LOG.debug('Events disabled, not sending %s', event_type)
+        return
+    notifier.audit(OSLO_CONTEXT, event_type, payload)
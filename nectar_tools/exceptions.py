@@ -31,6 +31,14 @@ class DeleteFailure(Exception):
     pass
 
 
+class ArchiverFailure(Exception):
+    def __init__(self, phase, errors):
+        # errors maps service name to its exception, or None if skipped
+        self.phase = phase
+        self.errors = errors
+        super().__init__(f"{phase} failed for {', '.join(sorted(errors))}")
+
+
 class LimitReached(Exception):
     pass
 
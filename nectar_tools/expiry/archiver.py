@@ -1,6 +1,11 @@
+from concurrent import futures
+import contextvars
+import json
 import logging
 import re
+import threading
 import time
+from urllib import parse
 
 from designateclient import exceptions as designate_exc
 import glanceclient.exc as glance_exc
@@ -23,12 +28,347 @@ CONF = config.CONFIG
 LOG = logging.getLogger(__name__)
 
 
+def _iter_servers(n_client, search_opts, label):
+    """Yield servers a page at a time, following markers
+
+    A page that fails with a 504 error is retried a couple of times.
+
+    :param dict search_opts: options for servers.list
+    :param str label: prefix for log messages (usually a project ID)
+    """
+    # The Nova list servers fails occasionally with a 504 error
+    # e.g. due to transient DB connection issues.  Retry a couple
+    # of times as a workaround.
+    MAX_RETRIES = 2
+    marker = None
+    while True:
+        opts = dict(search_opts)
+        if marker:
+            opts["marker"] = marker
+        for retry in range(MAX_RETRIES + 1):
+            try:
+                result = n_client.servers.list(search_opts=opts)
+                break
+            except nova_exc.ClientException as e:
+                if e.code != 504:
+                    raise e
+                if retry == MAX_RETRIES:
+                    LOG.info(
+                        "%s: 'nova list' still failing after %s retries; "
+                        "giving up",
+                        label,
+                        retry,
+                    )
+                    raise e
+                LOG.info(
+                    "%s: Retrying 'nova list' after an HTTP %s error",
+                    label,
+                    e.code,
+                )
+        if not result:
+            return
+        yield from result
+        marker = result[-1].id
+
+
+def _list_servers(n_client, search_opts, label):
+    """List servers, following markers and retrying 504 errors
+
+    :param dict search_opts: options for servers.list
+    :param str label: prefix for log messages (usually a project ID)
+    """
+    return list(_iter_servers(n_client, search_opts, label))
+
+
+class InstanceIndex:
+    """Cloud-wide snapshot of instances by project and by image
+
+    Loaded on first use from one all tenants server listing, replacing a
+    listing per project (or per image).  A project invalidated after its
+    instances have been changed is listed again on its own the next time
+    it is looked up.  Safe to share between threads.
+    """
+
+    def __init__(self, n_client):
+        self.n_client = n_client
+        self._lock = threading.Lock()
+        self._by_project = None
+        self._by_image = None
+        self._stale = set()
+
+    @staticmethod
+    def _image_id(instance):
+        # Boot from volume instances have no image
+        image = instance.image
+        return image.get('id') if image else None
+
+    def _add(self, instance):
+        self._by_project.setdefault(instance.tenant_id, []).append(instance)
+        image_id = self._image_id(instance)
+        if image_id:
+            self._by_image.setdefault(image_id, {})[instance.id] = instance
+
+    def _load(self):
+        if self._by_project is not None:
+            return
+        LOG.debug("Loading instances for all projects")
+        self._by_project = {}
+        self._by_image = {}
+        for instance in _list_servers(
+            self.n_client, {'all_tenants': True}, 'all'
+        ):
+            self._add(instance)
+        LOG.debug(
+            "Indexed instances for %d projects and %d images",
+            len(self._by_project),
+            len(self._by_image),
+        )
+
+    def _refresh(self, project_id):
+        for instance in self._by_project.pop(project_id, []):
+            image_id = self._image_id(instance)
+            if image_id:
+                self._by_image.get(image_id, {}).pop(instance.id, None)
+        instances = _list_servers(
+            self.n_client,
+            {'all_tenants': True, 'tenant_id': project_id},
+            project_id,
+        )
+        for instance in instances:
+            self._add(instance)
+        self._stale.discard(project_id)
+
+    def get_project_instances(self, project_id):
+        with self._lock:
+            self._load()
+            if project_id in self._stale:
+                self._refresh(project_id)
+            return list(self._by_project.get(project_id, []))
+
+    def get_image_instances(self, image_id):
+        with self._lock:
+            self._load()
+            for project_id in list(self._stale):
+                self._refresh(project_id)
+            return list(self._by_image.get(image_id, {}).values())
+
+    def get_image_instance_count(self, image_id):
+        with self._lock:
+            self._load()
+            for project_id in list(self._stale):
+                self._refresh(project_id)
+            return len(self._by_image.get(image_id, {}))
+
+    def invalidate(self, project_id):
+        """Mark a project's instances as changed since they were listed"""
+        with self._lock:
+            if self._by_project is not None:
+                self._stale.add(project_id)
+
+
+class ImageBootIndex:
+    """When each image was last booted by a since deleted instance
+
+    Loaded on first use from one all tenants listing of the instances
+    deleted since changes_since, replacing a listing per image.  Only the
+    latest boot time of each image is kept.  Safe to share between
+    threads.
+    """
+
+    def __init__(self, n_client, changes_since):
+        self.n_client = n_client
+        self.changes_since = changes_since
+        self._lock = threading.Lock()
+        self._last_boot = None
+
+    def _load(self):
+        if self._last_boot is not None:
+            return
+        LOG.debug("Loading instances deleted since %s", self.changes_since)
+        last_boot = {}
+        search_opts = {
+            'all_tenants': True,
+            'deleted': True,
+            'changes-since': self.changes_since.isoformat(),
+        }
+        for instance in _iter_servers(self.n_client, search_opts, 'all'):
+            image_id = InstanceIndex._image_id(instance)
+            if image_id and instance.created > last_boot.get(image_id, ''):
+                last_boot[image_id] = instance.created
+        LOG.debug("Indexed last boot of %d images", len(last_boot))
+        self._last_boot = last_boot
+
+    def get_last_boot(self, image_id):
+        """The creation time of the image's latest deleted instance"""
+        with self._lock:
+            self._load()
+            return self._last_boot.get(image_id)
+
+
+class ArchiveImageIndex:
+    """Cloud-wide snapshot of instance archive images
+
+    Loaded on first use from one listing of ``nectar_archive`` images and
+    indexed by owner, by the instance they were made from and by archive
+    name, replacing a glance listing per project (or per instance).  An
+    owner invalidated after its archives have been changed is listed again
+    on its own the next time it is looked up.  Safe to share between
+    threads.
+    """
+
+    def __init__(self, g_client):
+        self.g_client = g_client
+        self._lock = threading.Lock()
+        self._by_owner = None
+        self._by_instance = None
+        self._by_name = None
+        self._stale = set()
+
+    def _add(self, image):
+        owner = getattr(image, 'owner', None)
+        self._by_owner.setdefault(owner, []).append(image)
+        instance_id = getattr(image, 'instance_uuid', None)
+        if instance_id:
+            self._by_instance.setdefault((owner, instance_id), []).append(
+                image
+            )
+        # The first match wins, as with a scan of the listing
+        self._by_name.setdefault((owner, image.name), image)
+
+    def _load(self):
+        if self._by_owner is not None:
+            return
+        LOG.debug("Loading archive images for all projects")
+        self._by_owner = {}
+        self._by_instance = {}
+        self._by_name = {}
+        for image in self.g_client.images.list(
+            filters={'nectar_archive': 'True'}
+        ):
+            self._add(image)
+        LOG.debug(
+            "Indexed %d archive images for %d projects",
+            len(self._by_name),
+            len(self._by_owner),
+        )
+
+    def _get(self, owner):
+        self._load()
+        if owner in self._stale:
+            for image in self._by_owner.pop(owner, []):
+                instance_id = getattr(image, 'instance_uuid', None)
+                self._by_instance.pop((owner, instance_id), None)
+                self._by_name.pop((owner, image.name), None)
+            for image in self.g_client.images.list(
+                filters={'owner_id': owner, 'nectar_archive': 'True'}
+            ):
+                self._add(image)
+            self._stale.discard(owner)
+        return self._by_owner.get(owner, [])
+
+    def get_project_images(self, owner):
+        with self._lock:
+            return list(self._get(owner))
+
+    def get_instance_images(self, owner, instance_id):
+        """Archive images with an instance_uuid of instance_id"""
+        with self._lock:
+            self._get(owner)
+            return list(self._by_instance.get((owner, instance_id), []))
+
+    def get_archive(self, owner, instance_id):
+        """The archive image named after instance_id, or None"""
+        with self._lock:
+            self._get(owner)
+            return self._by_name.get((owner, f'{instance_id}_archive'))
+
+    def invalidate(self, owner):
+        """Mark an owner's archives as changed since they were listed"""
+        with self._lock:
+            if self._by_owner is not None:
+                self._stale.add(owner)
+
+
+class ClusterIndex:
+    """Cloud-wide snapshot of Magnum clusters
+
+    Magnum can't filter its cluster listing by project, so every lookup
+    used to be a detailed listing of the whole cloud.  The listing is now
+    loaded once on first use and grouped by project.  Once a project is
+    invalidated after its clusters have been changed, the next lookup of
+    it lists the cloud again.  Safe to share between threads.
+    """
+
+    def __init__(self, m_client):
+        self.m_client = m_client
+        self._lock = threading.Lock()
+        self._by_project = None
+        self._stale = set()
+
+    def _load(self):
+        LOG.debug("Loading COE clusters for all projects")
+        by_project = {}
+        for cluster in self.m_client.clusters.list(detail=True):
+            by_project.setdefault(cluster.project_id, []).append(cluster)
+        self._by_project = by_project
+        self._stale.clear()
+        LOG.debug(
+            "Indexed %d COE clusters for %d projects",
+            sum(len(c) for c in by_project.values()),
+            len(by_project),
+        )
+
+    def get_project_clusters(self, project_id):
+        with self._lock:
+            if self._by_project is None or project_id in self._stale:
+                self._load()
+            return list(self._by_project.get(project_id, []))
+
+    def get_all_clusters(self):
+        with self._lock:
+            if self._by_project is None or self._stale:
+                self._load()
+            return [c for cs in self._by_project.values() for c in cs]
+
+    def invalidate(self, project_id):
+        """Mark a project's clusters as changed since they were listed"""
+        with self._lock:
+            if self._by_project is not None:
+                self._stale.add(project_id)
+
+
 class Archiver:
     def __init__(self, ks_session=None, dry_run=False):
         self.k_client = auth.get_keystone_client(ks_session)
         self.g_client = auth.get_glance_client(ks_session)
         self.dry_run = dry_run
         self.ks_session = ks_session
+        self._listings = {}
+        self.listings_saved = 0
+
+    def _list(self, key, list_method):
+        """Return the project's listing named key
+
+        list_method is only called the first time, after that the listing
+        is reused until _invalidate_listing() is called for key. Archivers
+        must invalidate a listing once they have changed the resources in
+        it.
+        """
+        if key in self._listings:
+            self.listings_saved += 1
+            LOG.debug(
+                "%s: Reusing %s listing, %d calls saved",
+                self.project.id,
+                key,
+                self.listings_saved,
+            )
+            return self._listings[key]
+        listing = list(list_method())
+        self._listings[key] = listing
+        return listing
+
+    def _invalidate_listing(self, key):
+        self._listings.pop(key, None)
 
     def is_archive_successful(self):
         return True
@@ -89,36 +429,150 @@ class Archiver:
         :param str status (optional): The state of the resource when it is
                                       deleted
         :param int timeout (optional): max time to poll (in seconds)
-                                       should be a power of 2
         :param str error_status (optional): The state of the resource when it
                                             fails to delete
         """
-        delay = 5
-        total = 0
+        tracker = DeletionTracker(
+            delete_method,
+            check_method,
+            not_found_exception,
+            state_property=state_property,
+            status=status,
+            error_status=error_status,
+            timeout=timeout,
+        )
+        tracker.delete(resource_id)
+        tracker.wait()
+
+
+class DeletionTracker:
+    """Delete several resources and wait for all of them to go
+
+    Every delete is issued up front by ``delete()``; ``wait()`` then polls
+    the outstanding resources with a capped exponential backoff until they
+    are all gone, have failed or the timeout is reached.  When a
+    ``list_method`` is given one listing per round checks every resource,
+    otherwise each is checked with ``check_method``.
+    """
+
+    INITIAL_DELAY = 1
+    MAX_DELAY = 30
+
+    def __init__(
+        self,
+        delete_method,
+        check_method,
+        not_found_exception,
+        state_property=None,
+        status=None,
+        error_status=None,
+        list_method=None,
+        timeout=240,
+        label=None,
+    ):
+        """
+        :param func delete_method: Method used to delete a resource
+        :param func check_method: Method used to check if a resource exists
+        :param exception not_found_exception: Exception raised when the
+                                              resource does not exist
+        :param str state_property (optional): Name of the state property for
+                                              the resource
+        :param str status (optional): The state of a resource when it is
+                                      deleted
+        :param str error_status (optional): The state of a resource when it
+                                            fails to delete
+        :param func list_method (optional): Method returning all the
+                                            remaining resources at once
+        :param int timeout (optional): max time to poll (in seconds)
+        :param str label (optional): prefix for log messages
+        """
+        self.delete_method = delete_method
+        self.check_method = check_method
+        self.not_found_exception = not_found_exception
+        self.state_property = state_property
+        self.status = status
+        self.error_status = error_status
+        self.list_method = list_method
+        self.timeout = timeout
+        self.label = label
+        self.started = {}
+        self.latencies = {}
+        self.failed = []
+
+    def delete(self, resource_id):
+        self.started[resource_id] = time.monotonic()
         try:
-            delete_method(resource_id)
-        except not_found_exception:
-            return
+            self.delete_method(resource_id)
+        except self.not_found_exception:
+            self._done(resource_id)
 
-        while total <= timeout:
-            try:
-                res = check_method(resource_id)
-            except not_found_exception:
-                return
-            if state_property:
-                current_state = getattr(res, state_property)
-                if current_state == status:
-                    return
-                elif current_state == error_status:
-                    raise exceptions.DeleteFailure()
-            time.sleep(delay)
-            total = total + delay
-
-        delete_method_name = ".".join(
-            [delete_method.__module__, delete_method.__name__]
+    def _done(self, resource_id):
+        latency = time.monotonic() - self.started.pop(resource_id)
+        self.latencies[resource_id] = latency
+        LOG.debug(
+            "%s: %s deleted after %.1fs", self.label, resource_id, latency
         )
-        msg = f'{delete_method_name} for {resource_id} timed out'
-        raise exceptions.TimeoutError(msg)
+
+    def _check(self, resource_id, resource):
+        if resource is None:
+            self._done(resource_id)
+        elif self.state_property:
+            current_state = getattr(resource, self.state_property)
+            if current_state == self.status:
+                self._done(resource_id)
+            elif current_state == self.error_status:
+                del self.started[resource_id]
+                self.failed.append(resource_id)
+
+    def _poll(self):
+        if self.list_method is not None:
+            remaining = {r.id: r for r in self.list_method()}
+            for resource_id in list(self.started):
+                self._check(resource_id, remaining.get(resource_id))
+            return
+        for resource_id in list(self.started):
+            try:
+                resource = self.check_method(resource_id)
+            except self.not_found_exception:
+                resource = None
+            self._check(resource_id, resource)
+
+    def wait(self):
+        """Wait for the deletes, returns each resource's delete latency
+
+        Raises DeleteFailure if any resource reached error_status and
+        TimeoutError if any are left when the timeout is reached.
+        """
+        waited = 0
+        delay = self.INITIAL_DELAY
+        while self.started:
+            self._poll()
+            if not self.started or waited >= self.timeout:
+                break
+            step = min(delay, self.timeout - waited)
+            time.sleep(step)
+            waited += step
+            delay = min(delay * 2, self.MAX_DELAY)
+
+        if self.latencies:
+            LOG.info(
+                "%s: %d deleted, slowest after %.1fs",
+                self.label,
+                len(self.latencies),
+                max(self.latencies.values()),
+            )
+        if self.failed:
+            raise exceptions.DeleteFailure(
+                f"{', '.join(self.failed)} failed to delete"
+            )
+        if self.started:
+            delete_method_name = ".".join(
+                [self.delete_method.__module__, self.delete_method.__name__]
+            )
+            ids = ', '.join(self.started)
+            msg = f'{delete_method_name} for {ids} timed out'
+            raise exceptions.TimeoutError(msg)
+        return self.latencies
 
 
 class JupyterHubVolumeArchiver(Archiver):
@@ -259,12 +713,21 @@ class ImageArchiver(Archiver):
 
 
 class NovaArchiver(Archiver):
-    def __init__(self, project, ks_session=None, dry_run=False):
+    def __init__(
+        self,
+        project,
+        ks_session=None,
+        dry_run=False,
+        instance_index=None,
+        archive_index=None,
+    ):
         super().__init__(ks_session, dry_run)
         self.n_client = auth.get_nova_client(self.ks_session)
         self.project = project
         self.images = None
         self.instances = None
+        self.instance_index = instance_index
+        self.archive_index = archive_index
 
     def is_archive_successful(self):
         instances = self._all_instances()
@@ -352,6 +815,7 @@ class NovaArchiver(Archiver):
         for instance in instances:
             self._lock_instance(instance)
             self._stop_instance(instance)
+        self._instances_changed()
 
     def archive_resources(self):
         instances = self._all_instances()
@@ -360,6 +824,8 @@ class NovaArchiver(Archiver):
                 self._delete_instance(instance)
             else:
                 self._archive_instance(instance)
+        self._instances_changed()
+        self._archives_changed()
 
     def delete_resources(self, force=False):
         instances = self._all_instances()
@@ -368,6 +834,7 @@ class NovaArchiver(Archiver):
                 self._delete_instance(instance)
             else:
                 LOG.warning("Instance %s has no archive", instance.id)
+        self._instances_changed()
 
     def enable_resources(self):
         instances = self._all_instances()
@@ -379,6 +846,7 @@ class NovaArchiver(Archiver):
             locked_reason = instance.locked_reason == EXPIRY_METADATA_KEY
             if not security and (locked_metadata or locked_reason):
                 self._unlock_instance(instance)
+        self._instances_changed()
 
     def delete_archives(self):
         """Delete all image snapshots"""
@@ -397,48 +865,30 @@ class NovaArchiver(Archiver):
                     image.name,
                     image.id,
                 )
+        self._archives_changed()
 
     def _all_instances(self):
         if self.instances is None:
-            # The Nova list servers fails occasionally with a 504 error
-            # e.g. due to transient DB connection issues.  Retry a couple
-            # of times as a workaround.
-            MAX_RETRIES = 2
-            for retry in range(MAX_RETRIES + 1):
-                try:
-                    instances = []
-                    marker = None
-                    opts = {"all_tenants": True, 'tenant_id': self.project.id}
-
-                    while True:
-                        if marker:
-                            opts["marker"] = marker
-                        result = self.n_client.servers.list(search_opts=opts)
-                        if not result:
-                            break  # ... the paging loop
-                        instances.extend(result)
-                        marker = instances[-1].id
-                    self.instances = instances
-                    break  # ... the retry loop
-                except nova_exc.ClientException as e:
-                    if e.code != 504:
-                        raise e
-                    if retry == MAX_RETRIES:
-                        LOG.info(
-                            "%s: 'nova list' still failing after "
-                            "%s retries; giving up",
-                            self.project.id,
-                            retry,
-                        )
-                        raise e
-                    LOG.info(
-                        "%s: Retrying 'nova list' after an HTTP %s error",
-                        self.project.id,
-                        e.code,
-                    )
-
+            if self.instance_index is not None:
+                self.instances = self.instance_index.get_project_instances(
+                    self.project.id
+                )
+            else:
+                self.instances = _list_servers(
+                    self.n_client,
+                    {"all_tenants": True, 'tenant_id': self.project.id},
+                    self.project.id,
+                )
         return self.instances
 
+    def _instances_changed(self):
+        if self.instance_index is not None and not self.dry_run:
+            self.instance_index.invalidate(self.project.id)
+
+    def _archives_changed(self):
+        if self.archive_index is not None and not self.dry_run:
+            self.archive_index.invalidate(self.project.id)
+
     def _archive_instance(self, instance):
         # Increment the archive attempt counter
         attempts = int(instance.metadata.get('archive_attempts', 0))
@@ -620,6 +1070,8 @@ class NovaArchiver(Archiver):
 
     def _get_image_by_instance_id(self, instance_id):
         """Get an archive image by instance_id"""
+        if self.archive_index is not None:
+            return self.archive_index.get_archive(self.project.id, instance_id)
         image_name = f'{instance_id}_archive'
         images = self._get_project_images()
         for image in images:
@@ -628,22 +1080,34 @@ class NovaArchiver(Archiver):
 
     def _get_project_images(self):
         if self.images is None:
-            images = [
-                i
-                for i in self.g_client.images.list(
-                    filters={
-                        'owner_id': self.project.id,
-                        'nectar_archive': 'True',
-                    }
-                )
-            ]
+            if self.archive_index is not None:
+                images = self.archive_index.get_project_images(self.project.id)
+            else:
+                images = [
+                    i
+                    for i in self.g_client.images.list(
+                        filters={
+                            'owner_id': self.project.id,
+                            'nectar_archive': 'True',
+                        }
+                    )
+                ]
             self.images = images
         return self.images
 
 
 class ZoneInstanceArchiver(NovaArchiver):
-    def __init__(self, project, ks_session=None, dry_run=False):
-        super().__init__(project, ks_session, dry_run)
+    def __init__(
+        self,
+        project,
+        ks_session=None,
+        dry_run=False,
+        instance_index=None,
+        archive_index=None,
+    ):
+        super().__init__(
+            project, ks_session, dry_run, instance_index, archive_index
+        )
         self.a_client = auth.get_allocation_client(ks_session)
         self.allocation = self.a_client.allocations.get(project.allocation_id)
 
@@ -654,7 +1118,10 @@ class ZoneInstanceArchiver(NovaArchiver):
 
     def _all_instances(self):
         instances = utils.get_out_of_zone_instances(
-            self.ks_session, self.allocation, self.project
+            self.ks_session,
+            self.allocation,
+            self.project,
+            instance_index=self.instance_index,
         )
         return instances
 
@@ -663,13 +1130,18 @@ class ZoneInstanceArchiver(NovaArchiver):
             instances = self._all_instances()
             archived_images = []
             for instance in instances:
-                images = self.g_client.images.list(
-                    filters={
-                        'owner_id': self.project.id,
-                        'nectar_archive': 'True',
-                        'instance_uuid': instance.id,
-                    }
-                )
+                if self.archive_index is not None:
+                    images = self.archive_index.get_instance_images(
+                        self.project.id, instance.id
+                    )
+                else:
+                    images = self.g_client.images.list(
+                        filters={
+                            'owner_id': self.project.id,
+                            'nectar_archive': 'True',
+                            'instance_uuid': instance.id,
+                        }
+                    )
                 archived_images.extend(images)
             self.images = archived_images
         return self.images
@@ -990,10 +1462,16 @@ class ProjectImagesArchiver(ImageArchiver):
         Archiver.__init__(self, ks_session, dry_run)
         self.project = project
 
-    def is_delete_successful(self):
-        images = list(
-            self.g_client.images.list(filters={'owner': self.project.id})
+    def _list_images(self):
+        return self._list(
+            'images',
+            lambda: self.g_client.images.list(
+                filters={'owner': self.project.id}
+            ),
         )
+
+    def is_delete_successful(self):
+        images = self._list_images()
         if not images:
             return True
         LOG.debug("%s: %d project images remain", self.project.id, len(images))
@@ -1003,9 +1481,7 @@ class ProjectImagesArchiver(ImageArchiver):
         if not force:
             return
 
-        images = list(
-            self.g_client.images.list(filters={'owner': self.project.id})
-        )
+        images = self._list_images()
         for image in images:
             if image.visibility != 'private':
                 LOG.warning(
@@ -1015,15 +1491,17 @@ class ProjectImagesArchiver(ImageArchiver):
                 )
             else:
                 self._delete_image(image)
+        if not self.dry_run:
+            self._invalidate_listing('images')
 
     def restrict_resources(self, force=False):
         if not force:
             return
-        images = list(
-            self.g_client.images.list(filters={'owner': self.project.id})
-        )
+        images = self._list_images()
         for image in images:
             self._restrict_image(image)
+        if not self.dry_run:
+            self._invalidate_listing('images')
 
     def stop_resources(self):
         raise NotImplementedError
@@ -1031,6 +1509,10 @@ class ProjectImagesArchiver(ImageArchiver):
 
 class SwiftArchiver(Archiver):
     SWIFT_QUOTA_KEY = 'x-account-meta-quota-bytes'
+    # Swift's bulk middleware default for max_deletes_per_request
+    BULK_DELETE_MAX = 10000
+    # Concurrent deletes when the bulk middleware isn't available
+    DELETE_WORKERS = 10
 
     def __init__(self, project, ks_session=None, dry_run=False):
         super().__init__(ks_session, dry_run)
@@ -1038,6 +1520,8 @@ class SwiftArchiver(Archiver):
         self.s_client = auth.get_swift_client(
             ks_session, project_id=self.project.id
         )
+        self._bulk_delete_limit = None
+        self._local = threading.local()
 
     def is_delete_successful(self):
         _, containers = self.s_client.get_account()
@@ -1061,8 +1545,7 @@ class SwiftArchiver(Archiver):
         if not force:
             return
 
-        account, containers = self.s_client.get_account()
-        for c in containers:
+        for c in self._list_containers():
             container_stat, objects = self.s_client.get_container(c['name'])
             if 'x-container-read' in container_stat:
                 read_acl = container_stat['x-container-read']
@@ -1073,27 +1556,73 @@ class SwiftArchiver(Archiver):
                     read_acl,
                 )
                 continue
-            self._delete_container(c, objects)
+            self._delete_container(
+                c, self._list_objects(c['name'], first_page=objects)
+            )
 
-    def _delete_container(self, container, objects):
-        for obj in objects:
-            if not self.dry_run:
-                LOG.debug(
-                    "%s: Deleting object %s/%s",
-                    self.project.id,
-                    container['name'],
-                    obj['name'],
-                )
-                try:
-                    self.s_client.delete_object(container['name'], obj['name'])
-                except Exception:
-                    LOG.info(
-                        "%s: Failed to delete object %s/%s",
-                        self.project.id,
-                        container['name'],
-                        obj['name'],
-                    )
+    def _list_containers(self):
+        """Yield every container in the account, one page at a time"""
+        marker = None
+        while True:
+            _, page = self.s_client.get_account(marker=marker)
+            if not page:
+                return
+            yield from page
+            marker = page[-1]['name']
+
+    def _list_objects(self, container, first_page=None):
+        """Yield every object in a container, one page at a time
+
+        :param list first_page: Objects already fetched with the container
+            headers, listing continues after the last of these
+        """
+        page = first_page
+        if page is None:
+            _, page = self.s_client.get_container(container)
+        while page:
+            yield from page
+            _, page = self.s_client.get_container(
+                container, marker=page[-1]['name']
+            )
+
+    def _get_bulk_delete_limit(self):
+        """Return how many objects one bulk-delete request may remove
+
+        Returns 0 when the cluster doesn't advertise the bulk middleware.
+        """
+        if self._bulk_delete_limit is None:
+            try:
+                info = self.s_client.get_capabilities()
+            except swift_exc.ClientException:
+                info = {}
+            bulk = info.get('bulk_delete')
+            if bulk is None:
+                self._bulk_delete_limit = 0
             else:
+                self._bulk_delete_limit = min(
+                    bulk.get(
+                        'max_deletes_per_request',
+                        SwiftArchiver.BULK_DELETE_MAX,
+                    ),
+                    SwiftArchiver.BULK_DELETE_MAX,
+                )
+        return self._bulk_delete_limit
+
+    def _delete_container(self, container, objects):
+        if not self.dry_run:
+            batch_size = (
+                self._get_bulk_delete_limit() or SwiftArchiver.BULK_DELETE_MAX
+            )
+            batch = []
+            for obj in objects:
+                batch.append(obj['name'])
+                if len(batch) >= batch_size:
+                    self._delete_objects(container['name'], batch)
+                    batch = []
+            if batch:
+                self._delete_objects(container['name'], batch)
+        else:
+            for obj in objects:
                 LOG.info(
                     "%s: Would delete object %s/%s",
                     self.project.id,
@@ -1120,6 +1649,92 @@ class SwiftArchiver(Archiver):
                 container['name'],
             )
 
+    def _delete_objects(self, container, names):
+        if self._get_bulk_delete_limit():
+            try:
+                self._bulk_delete(container, names)
+                return
+            except swift_exc.ClientException as e:
+                LOG.warning(
+                    "%s: Bulk delete failed, deleting objects one by one: %s",
+                    self.project.id,
+                    e,
+                )
+                self._bulk_delete_limit = 0
+        self._delete_objects_concurrently(container, names)
+
+    def _bulk_delete(self, container, names):
+        LOG.debug(
+            "%s: Bulk deleting %d objects from %s",
+            self.project.id,
+            len(names),
+            container,
+        )
+        data = b''.join(
+            parse.quote(f'/{container}/{name}').encode('utf-8') + b'\n'
+            for name in names
+        )
+        _, body = self.s_client.post_account(
+            headers={
+                'Accept': 'application/json',
+                'Content-Type': 'text/plain',
+            },
+            query_string='bulk-delete',
+            data=data,
+        )
+        if not body:
+            raise swift_exc.ClientException(
+                'No content received on bulk delete, '
+                'is the bulk middleware enabled?'
+            )
+        result = json.loads(body)
+        for path, status in result.get('Errors', []):
+            LOG.info(
+                "%s: Failed to delete object %s: %s",
+                self.project.id,
+                parse.unquote(path).lstrip('/'),
+                status,
+            )
+
+    def _get_worker_client(self):
+        # swiftclient connections aren't safe to share between threads
+        client = getattr(self._local, 's_client', None)
+        if client is None:
+            client = auth.get_swift_client(
+                self.ks_session, project_id=self.project.id, shared=False
+            )
+            self._local.s_client = client
+        return client
+
+    def _delete_object(self, container, name):
+        LOG.debug(
+            "%s: Deleting object %s/%s", self.project.id, container, name
+        )
+        try:
+            self._get_worker_client().delete_object(container, name)
+        except Exception:
+            LOG.info(
+                "%s: Failed to delete object %s/%s",
+                self.project.id,
+                container,
+                name,
+            )
+
+    def _delete_objects_concurrently(self, container, names):
+        workers = min(SwiftArchiver.DELETE_WORKERS, len(names))
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            results = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self._delete_object,
+                    container,
+                    name,
+                )
+                for name in names
+            ]
+            for f in results:
+                f.result()
+
 
 class DesignateArchiver(Archiver):
     def __init__(self, project, ks_session=None, dry_run=False):
@@ -1253,17 +1868,25 @@ class DesignateArchiver(Archiver):
 
 
 class MagnumArchiver(Archiver):
-    def __init__(self, project, ks_session=None, dry_run=False):
+    def __init__(
+        self, project, ks_session=None, dry_run=False, cluster_index=None
+    ):
         super().__init__(ks_session, dry_run)
         self.project = project
         self.m_client = auth.get_magnum_client(ks_session)
+        self.cluster_index = cluster_index
 
-    def is_delete_successful(self):
-        clusters = [
+    def _get_clusters(self):
+        if self.cluster_index is not None:
+            return self.cluster_index.get_project_clusters(self.project.id)
+        return [
             c
             for c in self.m_client.clusters.list(detail=True)
             if c.project_id == self.project.id
         ]
+
+    def is_delete_successful(self):
+        clusters = self._get_clusters()
         if not clusters:
             return True
         LOG.debug("%s: %d COE clusters remain", self.project.id, len(clusters))
@@ -1303,28 +1926,30 @@ class MagnumArchiver(Archiver):
         if not force:
             return
 
-        # TODO(ade): needs fixing since it's a generator of all clusters
-        clusters = self.m_client.clusters.list(detail=True)
+        clusters = self._get_clusters()
+        tracker = DeletionTracker(
+            self.m_client.clusters.delete,
+            self.m_client.clusters.get,
+            magnum_exc.NotFound,
+            label=self.project.id,
+        )
         for cluster in clusters:
-            if cluster.project_id == self.project.id:
-                if self.dry_run:
-                    LOG.info(
-                        "%s: Would delete COE cluster %s",
-                        self.project.id,
-                        cluster.uuid,
-                    )
-                else:
-                    LOG.info(
-                        "%s: Deleting COE cluster %s",
-                        self.project.id,
-                        cluster.uuid,
-                    )
-                    self.remove_resource(
-                        self.m_client.clusters.delete,
-                        self.m_client.clusters.get,
-                        cluster.uuid,
-                        magnum_exc.NotFound,
-                    )
+            if self.dry_run:
+                LOG.info(
+                    "%s: Would delete COE cluster %s",
+                    self.project.id,
+                    cluster.uuid,
+                )
+            else:
+                LOG.info(
+                    "%s: Deleting COE cluster %s",
+                    self.project.id,
+                    cluster.uuid,
+                )
+                tracker.delete(cluster.uuid)
+        if clusters and not self.dry_run and self.cluster_index is not None:
+            self.cluster_index.invalidate(self.project.id)
+        tracker.wait()
 
 
 class ManilaArchiver(Archiver):
@@ -1333,11 +1958,20 @@ class ManilaArchiver(Archiver):
         self.project = project
         self.m_client = auth.get_manila_client(ks_session)
 
-    def is_delete_successful(self):
-        shares = self.m_client.shares.list(
-            detailed=False,
-            search_opts={"all_tenants": "1", "project_id": self.project.id},
+    def _list_shares(self):
+        return self._list(
+            'manila shares',
+            lambda: self.m_client.shares.list(
+                detailed=True,
+                search_opts={
+                    "all_tenants": "1",
+                    "project_id": self.project.id,
+                },
+            ),
         )
+
+    def is_delete_successful(self):
+        shares = self._list_shares()
         if not shares:
             return True
         LOG.debug("%s: %d manila shares remain", self.project.id, len(shares))
@@ -1361,10 +1995,7 @@ class ManilaArchiver(Archiver):
         if not force:
             return
 
-        shares = self.m_client.shares.list(
-            detailed=True,
-            search_opts={"all_tenants": "1", "project_id": self.project.id},
-        )
+        shares = self._list_shares()
         for share in shares:
             if self.dry_run:
                 LOG.info(
@@ -1373,6 +2004,7 @@ class ManilaArchiver(Archiver):
             else:
                 LOG.info("%s: Deleting share %s", self.project.id, share.id)
                 self.m_client.shares.delete(share)
+                self._invalidate_listing('manila shares')
 
 
 class MuranoArchiver(Archiver):
@@ -1449,8 +2081,16 @@ class TroveArchiver(Archiver):
         self.project = project
         self.t_client = auth.get_trove_client(ks_session)
 
+    def _list_dbs(self):
+        return self._list(
+            'trove instances',
+            lambda: self.t_client.mgmt_instances.list(
+                project_id=self.project.id
+            ),
+        )
+
     def is_delete_successful(self):
-        dbs = self.t_client.mgmt_instances.list(project_id=self.project.id)
+        dbs = self._list_dbs()
         if not dbs:
             return True
         LOG.debug("%s: %d trove instances remain", self.project.id, len(dbs))
@@ -1465,7 +2105,7 @@ class TroveArchiver(Archiver):
             LOG.info("%s: Would zero trove quota", self.project.id)
 
     def stop_resources(self):
-        dbs = self.t_client.mgmt_instances.list(project_id=self.project.id)
+        dbs = self._list_dbs()
         for db in dbs:
             if self.dry_run:
                 LOG.info(
@@ -1485,6 +2125,7 @@ class TroveArchiver(Archiver):
                         db.id,
                     )
                     self.t_client.mgmt_instances.stop(db.id)
+                    self._invalidate_listing('trove instances')
             else:
                 LOG.warning(
                     "%s: Nova instance not found for trove db %s",
@@ -1496,7 +2137,7 @@ class TroveArchiver(Archiver):
         if not force:
             return
 
-        dbs = self.t_client.mgmt_instances.list(project_id=self.project.id)
+        dbs = self._list_dbs()
 
         for db in dbs:
             if self.dry_run:
@@ -1510,6 +2151,7 @@ class TroveArchiver(Archiver):
                     "%s: Deleting trove instance %s", self.project.id, db.id
                 )
                 self.t_client.instances.delete(db)
+                self._invalidate_listing('trove instances')
 
 
 class WarreArchiver(Archiver):
@@ -1537,7 +2179,7 @@ class WarreArchiver(Archiver):
         # Deleting the project's limits reverts it to the registered default
         # (the baseline for projects without a reservation allocation), the
         # same way provisioning removes reservation quota.
-        system_session = auth.get_session(system_scope='all')
+        system_session = auth.get_default_session(system_scope='all')
         k_client = auth.get_keystone_client(system_session)
         service = k_client.services.list(type='nectar-reservation').pop()
         limits = k_client.limits.list(
@@ -1589,10 +2231,16 @@ class HeatArchiver(Archiver):
         self.project = project
         self.h_client = auth.get_heat_client(ks_session)
 
-    def is_delete_successful(self):
-        stacks = list(
-            self.h_client.stacks.list(filters={'tenant': self.project.id})
+    def _list_stacks(self):
+        return self._list(
+            'heat stacks',
+            lambda: self.h_client.stacks.list(
+                filters={'tenant': self.project.id}
+            ),
         )
+
+    def is_delete_successful(self):
+        stacks = self._list_stacks()
         if not stacks:
             return True
         LOG.debug("%s: %d heat stacks remain", self.project.id, len(stacks))
@@ -1602,7 +2250,18 @@ class HeatArchiver(Archiver):
         if not force:
             return
 
-        stacks = self.h_client.stacks.list(filters={'tenant': self.project.id})
+        stacks = self._list_stacks()
+        tracker = DeletionTracker(
+            self.h_client.stacks.delete,
+            self.h_client.stacks.get,
+            heat_exc.HTTPNotFound,
+            state_property='stack_status',
+            status='DELETE_COMPLETE',
+            list_method=lambda: self.h_client.stacks.list(
+                filters={'tenant': self.project.id}
+            ),
+            label=self.project.id,
+        )
 
         for stack in stacks:
             if self.dry_run:
@@ -1613,52 +2272,137 @@ class HeatArchiver(Archiver):
                 LOG.info(
                     "%s: Deleting heat stack %s", self.project.id, stack.id
                 )
-                self.remove_resource(
-                    self.h_client.stacks.delete,
-                    self.h_client.stacks.get,
-                    stack.id,
-                    heat_exc.HTTPNotFound,
-                    state_property='stack_status',
-                    status='DELETE_COMPLETE',
-                )
+                tracker.delete(stack.id)
+        if stacks and not self.dry_run:
+            self._invalidate_listing('heat stacks')
+        tracker.wait()
+
+
+# Services whose resources have to be removed before a service's own can be.
+# Heat stacks belong to murano environments, magnum clusters and trove
+# instances; all of those and load balancers sit on nova instances and
+# neutron networks.
+ARCHIVER_DEPENDENCIES = {
+    'heat': ('murano', 'magnum', 'trove'),
+    'nova': ('murano', 'magnum', 'trove', 'heat'),
+    'zoneinstance': ('murano', 'magnum', 'trove', 'heat'),
+    'cinder': ('nova', 'zoneinstance'),
+    'octavia': ('murano', 'magnum', 'heat'),
+    'neutron_basic': ('octavia', 'nova', 'zoneinstance'),
+    'neutron': ('octavia', 'nova', 'zoneinstance'),
+}
+
+
+def _all_dependencies(name, dependencies=ARCHIVER_DEPENDENCIES):
+    """Every service name has to wait for, directly or through another
+
+    So the order holds when a service in between isn't configured, e.g.
+    neutron still goes after trove without nova.
+    """
+    found = set()
+    todo = list(dependencies.get(name, ()))
+    while todo:
+        dep = todo.pop()
+        if dep not in found:
+            found.add(dep)
+            todo.extend(dependencies.get(dep, ()))
+    return found
 
 
 class ResourceArchiver:
-    def __init__(self, project, archivers, ks_session=None, dry_run=False):
-        enabled = []
+    def __init__(
+        self,
+        project,
+        archivers,
+        ks_session=None,
+        dry_run=False,
+        instance_index=None,
+        archive_index=None,
+        cluster_index=None,
+    ):
+        self.project = project
+        self.archiver_names = archivers
+        self.ks_session = ks_session
+        self.dry_run = dry_run
+        self.instance_index = instance_index
+        self.archive_index = archive_index
+        self.cluster_index = cluster_index
+        self._services = None
+
+    @property
+    def services(self):
+        """The service archivers by service name, created on first use
+
+        Most projects never get past status evaluation, so the archivers
+        (and their clients) are not built until a phase method needs them.
+        """
+        if self._services is None:
+            self._services = self._create_archivers(self.archiver_names)
+        return self._services
+
+    @property
+    def archivers(self):
+        return list(self.services.values())
+
+    def _create_archivers(self, names):
+        project = self.project
+        ks_session = self.ks_session
+        dry_run = self.dry_run
+        enabled = {}
         # project scope archiver, could be multiple archivers
-        # Ordering here can matter (eg. octavia goes before neutron)
-        if 'murano' in archivers:
-            enabled.append(MuranoArchiver(project, ks_session, dry_run))
-        if 'magnum' in archivers:
-            enabled.append(MagnumArchiver(project, ks_session, dry_run))
-        if 'trove' in archivers:
-            enabled.append(TroveArchiver(project, ks_session, dry_run))
-        if 'heat' in archivers:
-            enabled.append(HeatArchiver(project, ks_session, dry_run))
-        if 'nova' in archivers:
-            enabled.append(NovaArchiver(project, ks_session, dry_run))
-        if 'zoneinstance' in archivers:
-            enabled.append(ZoneInstanceArchiver(project, ks_session, dry_run))
-        if 'cinder' in archivers:
-            enabled.append(CinderArchiver(project, ks_session, dry_run))
-        if 'octavia' in archivers:
-            enabled.append(OctaviaArchiver(project, ks_session, dry_run))
-        if 'neutron_basic' in archivers:
-            enabled.append(NeutronBasicArchiver(project, ks_session, dry_run))
-        if 'neutron' in archivers:
-            enabled.append(NeutronArchiver(project, ks_session, dry_run))
-        if 'projectimages' in archivers:
-            enabled.append(ProjectImagesArchiver(project, ks_session, dry_run))
-        if 'swift' in archivers:
-            enabled.append(SwiftArchiver(project, ks_session, dry_run))
-        if 'designate' in archivers:
-            enabled.append(DesignateArchiver(project, ks_session, dry_run))
-        if 'manila' in archivers:
-            enabled.append(ManilaArchiver(project, ks_session, dry_run))
-        if 'warre' in archivers:
-            enabled.append(WarreArchiver(project, ks_session, dry_run))
-        self.archivers = enabled
+        # Phases that run one service at a time use this order; the others
+        # follow ARCHIVER_DEPENDENCIES (eg. octavia goes before neutron)
+        if 'murano' in names:
+            enabled['murano'] = MuranoArchiver(project, ks_session, dry_run)
+        if 'magnum' in names:
+            enabled['magnum'] = MagnumArchiver(
+                project, ks_session, dry_run, self.cluster_index
+            )
+        if 'trove' in names:
+            enabled['trove'] = TroveArchiver(project, ks_session, dry_run)
+        if 'heat' in names:
+            enabled['heat'] = HeatArchiver(project, ks_session, dry_run)
+        if 'nova' in names:
+            enabled['nova'] = NovaArchiver(
+                project,
+                ks_session,
+                dry_run,
+                self.instance_index,
+                self.archive_index,
+            )
+        if 'zoneinstance' in names:
+            enabled['zoneinstance'] = ZoneInstanceArchiver(
+                project,
+                ks_session,
+                dry_run,
+                self.instance_index,
+                self.archive_index,
+            )
+        if 'cinder' in names:
+            enabled['cinder'] = CinderArchiver(project, ks_session, dry_run)
+        if 'octavia' in names:
+            enabled['octavia'] = OctaviaArchiver(project, ks_session, dry_run)
+        if 'neutron_basic' in names:
+            enabled['neutron_basic'] = NeutronBasicArchiver(
+                project, ks_session, dry_run
+            )
+        if 'neutron' in names:
+            enabled['neutron'] = NeutronArchiver(project, ks_session, dry_run)
+        if 'projectimages' in names:
+            enabled['projectimages'] = ProjectImagesArchiver(
+                project, ks_session, dry_run
+            )
+        if 'swift' in names:
+            enabled['swift'] = SwiftArchiver(project, ks_session, dry_run)
+        if 'designate' in names:
+            enabled['designate'] = DesignateArchiver(
+                project, ks_session, dry_run
+            )
+        if 'manila' in names:
+            enabled['manila'] = ManilaArchiver(project, ks_session, dry_run)
+        if 'warre' in names:
+            enabled['warre'] = WarreArchiver(project, ks_session, dry_run)
+        return enabled
 
     def is_archive_successful(self):
         success = True
@@ -1702,26 +2446,77 @@ class ResourceArchiver:
             except NotImplementedError:
                 continue
 
+    def _run_phase(self, phase, **kwargs):
+        """Run a phase on every archiver, following ARCHIVER_DEPENDENCIES
+
+        Services run concurrently once the services they depend on have
+        finished.  A failure does not stop independent services; services
+        depending on a failed one are skipped.  Raises ArchiverFailure
+        listing every service that failed once the phase is over.
+        """
+        services = self.services
+        waiting = {
+            name: {dep for dep in _all_dependencies(name) if dep in services}
+            for name in services
+        }
+        finished = set()
+        errors = {}
+        running = {}
+        with futures.ThreadPoolExecutor(
+            max_workers=max(len(services), 1)
+        ) as executor:
+            while waiting or running:
+                for name, deps in list(waiting.items()):
+                    failed = sorted(deps & set(errors))
+                    if failed:
+                        LOG.warning(
+                            "%s: Skipping %s %s as %s failed",
+                            self.project.id,
+                            name,
+                            phase,
+                            ', '.join(failed),
+                        )
+                        errors[name] = None
+                        del waiting[name]
+                    elif deps <= finished:
+                        # Keep any log buffering of the calling thread
+                        context = contextvars.copy_context()
+                        future = executor.submit(
+                            context.run,
+                            getattr(services[name], phase),
+                            **kwargs,
+                        )
+                        running[future] = name
+                        del waiting[name]
+                if not running:
+                    continue
+                done, _ = futures.wait(
+                    running, return_when=futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                    except NotImplementedError:
+                        pass
+                    except Exception as e:
+                        LOG.exception(
+                            "%s: %s %s failed", self.project.id, name, phase
+                        )
+                        errors[name] = e
+                        continue
+                    finished.add(name)
+        if errors:
+            raise exceptions.ArchiverFailure(phase, errors)
+
     def stop_resources(self):
-        for archiver in self.archivers:
-            try:
-                archiver.stop_resources()
-            except NotImplementedError:
-                continue
+        self._run_phase('stop_resources')
 
     def archive_resources(self):
-        for archiver in self.archivers:
-            try:
-                archiver.archive_resources()
-            except NotImplementedError:
-                continue
+        self._run_phase('archive_resources')
 
     def delete_resources(self, force=False):
-        for archiver in self.archivers:
-            try:
-                archiver.delete_resources(force=force)
-            except NotImplementedError:
-                continue
+        self._run_phase('delete_resources', force=force)
         # When force-deleting (the project is being deleted) also remove the
         # project's quota for any service whose client supports it.
         if force:
@@ -9,8 +9,11 @@ import sys
 from nectar_tools import auth
 from nectar_tools import cmd_base
 from nectar_tools import config
+from nectar_tools import utils
 
 from nectar_tools.expiry.manager import account as expirer
+from nectar_tools.expiry import notifier as expiry_notifier
+from nectar_tools.expiry import outbox
 
 
 CONFIG = config.CONFIG
@@ -18,6 +21,8 @@ LOG = logging.getLogger(__name__)
 
 
 class AccountExpiryCmd(cmd_base.CmdBase):
+    TEMPLATE_DIRS = ['expiry/accounts']
+
     def __init__(self):
         super().__init__(log_filename='account-expiry.log')
 
@@ -30,13 +35,20 @@ class AccountExpiryCmd(cmd_base.CmdBase):
         elif self.args.all or self.args.filename:
             now = datetime.datetime.now()
             six_months_ago = now - relativedelta(months=6)
-            accounts = self.m_client.users.list(
-                last_login__lt=six_months_ago, expiry_status='active'
+            # Listed in full before processing starts, as processing moves
+            # accounts out of the filtered set and the next links page by
+            # offset, so a later page would skip the accounts moving up
+            accounts = utils.iter_accounts(
+                self.m_client,
+                last_login__lt=six_months_ago,
+                expiry_status='active',
             )
 
             if self.args.filename:
                 wanted_accounts = self.read_file(self.args.filename)
                 accounts = [i for i in accounts if i.id in wanted_accounts]
+            else:
+                accounts = list(accounts)
 
             if self.args.force_disable:
                 LOG.error("Cannot use --force-disable with --all")
@@ -93,6 +105,14 @@ class AccountExpiryCmd(cmd_base.CmdBase):
             help='Skip this many accounts \
                                  before processing',
         )
+        self.parser.add_argument(
+            '--shard',
+            type=utils.parse_shard,
+            default=None,
+            metavar='INDEX/COUNT',
+            help='Only process the accounts in this shard, numbered from 0. '
+            'Use to split a run over several hosts.',
+        )
 
     def process_accounts(self):
         LOG.info("Processing accounts")
@@ -103,6 +123,8 @@ class AccountExpiryCmd(cmd_base.CmdBase):
         processed = 0
 
         for account in self.accounts:
+            if not utils.in_shard(account.id, self.args.shard):
+                continue
             offset_count += 1
             if offset is None or offset_count > offset:
                 try:
@@ -119,12 +141,16 @@ class AccountExpiryCmd(cmd_base.CmdBase):
             if limit > 0 and processed >= limit:
                 break
         LOG.info("Processed %s accounts", processed)
+        auth.log_client_stats()
         return processed
 
 
 def main():
     cmd = AccountExpiryCmd()
-    cmd.process_accounts()
+    with outbox.running(
+        expiry_notifier.deliver, session=cmd.session, dry_run=cmd.dry_run
+    ):
+        cmd.process_accounts()
 
 
 if __name__ == '__main__':
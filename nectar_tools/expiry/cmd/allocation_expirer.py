@@ -1,10 +1,29 @@
 #!/usr/bin/env python
 
+import datetime
+
+from nectar_tools import auth
+from nectar_tools import utils
+
 from nectar_tools.expiry.cmd import base
 from nectar_tools.expiry import expirer
+from nectar_tools.expiry import notifier as expiry_notifier
+from nectar_tools.expiry import outbox
+from nectar_tools.expiry import prefilter
 
 
 class AllocationExpiryCmd(base.ProjectExpiryBaseCmd):
+    TEMPLATE_DIRS = ['expiry/allocations']
+
+    def setup_run(self, resume=None):
+        super().setup_run(resume=resume)
+        # Allocations for multi-project runs come from a few listings
+        self.allocation_index = None
+        if len(self.projects) > 1:
+            self.allocation_index = utils.AllocationIndex(
+                auth.get_allocation_client(self.session)
+            )
+
     @staticmethod
     def valid_project(project):
         return not expirer.PT_RE.match(project.name)
@@ -21,6 +40,16 @@ class AllocationExpiryCmd(base.ProjectExpiryBaseCmd):
             ),
         )
 
+    def may_need_action(self, project):
+        # Without the prefetched allocations there is nothing cheap to check
+        if self.allocation_index is None:
+            return True
+        return prefilter.allocation_may_need_action(
+            project,
+            self.allocation_index.peek_current(project.id),
+            datetime.datetime.now(),
+        )
+
     def get_expirer(self, project):
         return expirer.AllocationExpirer(
             project=project,
@@ -29,6 +58,11 @@ class AllocationExpiryCmd(base.ProjectExpiryBaseCmd):
             disable_project=True,
             force_no_allocation=self.args.ignore_no_allocation,
             force_delete=self.args.force_delete,
+            user_index=self.user_index,
+            allocation_index=self.allocation_index,
+            instance_index=self.instance_index,
+            archive_index=self.archive_index,
+            cluster_index=self.cluster_index,
         )
 
 
@@ -42,7 +76,15 @@ def main():
         cmd.set_admin()
         return
 
-    cmd.process_projects()
+    with outbox.running(
+        expiry_notifier.deliver, session=cmd.session, dry_run=cmd.dry_run
+    ):
+        if cmd.args.daemon:
+            cmd.schedule_projects()
+            return
+
+        cmd.setup_run(resume=cmd.args.resume)
+        cmd.process_projects()
 
 
 if __name__ == '__main__':
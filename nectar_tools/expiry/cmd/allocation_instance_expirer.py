@@ -2,11 +2,30 @@
 
 import prettytable
 
+from nectar_tools import auth
+from nectar_tools import utils
+
 from nectar_tools.expiry.cmd import base
 from nectar_tools.expiry import expirer
+from nectar_tools.expiry import notifier as expiry_notifier
+from nectar_tools.expiry import outbox
 
 
 class AllocationInstanceExpiryCmd(base.ProjectExpiryBaseCmd):
+    TEMPLATE_DIRS = ['expiry/allocation_instances']
+    STATUS_KEY = expirer.AllocationInstanceExpirer.STATUS_KEY
+    NEXT_STEP_KEY = expirer.AllocationInstanceExpirer.NEXT_STEP_KEY
+    UPDATED_AT_KEY = expirer.AllocationInstanceExpirer.UPDATED_AT_KEY
+
+    def setup_run(self, resume=None):
+        super().setup_run(resume=resume)
+        # Allocations for multi-project runs come from a few listings
+        self.allocation_index = None
+        if len(self.projects) > 1:
+            self.allocation_index = utils.AllocationIndex(
+                auth.get_allocation_client(self.session)
+            )
+
     @staticmethod
     def valid_project(project):
         # rule out following projects:
@@ -29,6 +48,10 @@ class AllocationInstanceExpiryCmd(base.ProjectExpiryBaseCmd):
             ks_session=self.session,
             dry_run=self.dry_run,
             force_delete=self.args.force_delete,
+            user_index=self.user_index,
+            allocation_index=self.allocation_index,
+            instance_index=self.instance_index,
+            archive_index=self.archive_index,
         )
 
     def print_status(self):
@@ -77,7 +100,15 @@ def main():
         cmd.print_status()
         return
 
-    cmd.process_projects()
+    with outbox.running(
+        expiry_notifier.deliver, session=cmd.session, dry_run=cmd.dry_run
+    ):
+        if cmd.args.daemon:
+            cmd.schedule_projects()
+            return
+
+        cmd.setup_run(resume=cmd.args.resume)
+        cmd.process_projects()
 
 
 if __name__ == '__main__':
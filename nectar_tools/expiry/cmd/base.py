@@ -1,13 +1,22 @@
 import argparse
+import collections
+from concurrent import futures
+import datetime
 import logging
 import prettytable
+import time
 
+from nectar_tools import auth
 from nectar_tools import cmd_base
 from nectar_tools import config
 from nectar_tools import exceptions
+from nectar_tools import log
 from nectar_tools import utils
 
+from nectar_tools.expiry import archiver
 from nectar_tools.expiry import expiry_states
+from nectar_tools.expiry import journal
+from nectar_tools.expiry import scheduler
 
 
 CONFIG = config.CONFIG
@@ -15,9 +24,22 @@ LOG = logging.getLogger(__name__)
 
 
 class ProjectExpiryBaseCmd(cmd_base.CmdBase):
+    # Project properties the --daemon scheduler reads
+    STATUS_KEY = 'expiry_status'
+    NEXT_STEP_KEY = 'expiry_next_step'
+    UPDATED_AT_KEY = 'expiry_updated_at'
+
     def __init__(self):
         super().__init__(log_filename='expiry.log')
 
+        self._wanted_projects = None
+        if self.args.filename:
+            self._wanted_projects = utils.read_file(self.args.filename)
+        self.projects = self.list_projects()
+        # Made by setup_run(), only once there are projects to process
+        self.journal = None
+
+    def list_projects(self):
         projects = []
         if self.args.project_id:
             project = self.k_client.projects.get(self.args.project_id)
@@ -28,12 +50,54 @@ class ProjectExpiryBaseCmd(cmd_base.CmdBase):
                 enabled=True,
                 domain=self.args.domain,
             )
-            if self.args.filename:
-                wanted_projects = utils.read_file(self.args.filename)
-
-                projects = [p for p in projects if p.id in wanted_projects]
+            if self._wanted_projects is not None:
+                projects = [
+                    p for p in projects if p.id in self._wanted_projects
+                ]
             projects.sort(key=lambda p: p.name.split('-')[-1].zfill(5))
-        self.projects = projects
+        return projects
+
+    def setup_run(self, resume=None):
+        """Create the listings and journal shared by one pass over projects
+
+        :param str resume: ID of a journaled run to carry on with
+        """
+        # Recipients and COE clusters for multi-project runs come from one
+        # cloud-wide listing each
+        self.user_index = None
+        self.cluster_index = None
+        if len(self.projects) > 1:
+            self.user_index = utils.ProjectUserIndex(self.k_client)
+            self.cluster_index = archiver.ClusterIndex(
+                auth.get_magnum_client(self.session)
+            )
+
+        self.instance_index = None
+        if self.args.preload_instances:
+            self.instance_index = archiver.InstanceIndex(
+                auth.get_nova_client(self.session)
+            )
+        self.archive_index = None
+        if self.args.preload_archives:
+            self.archive_index = archiver.ArchiveImageIndex(
+                auth.get_glance_client(self.session)
+            )
+
+        self.start_journal(resume=resume)
+
+    def start_journal(self, resume=None):
+        """Start a new journaled run, or carry on with resume
+
+        The --daemon scheduler starts one for each batch of due projects,
+        reusing the listings from its last full pass.
+        """
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = journal.get_journal(
+            self.args.journal or CONFIG.get('journal', {}).get('path'),
+            resume=resume,
+            command=type(self).__name__,
+        )
 
     def print_status(self):
         pt = prettytable.PrettyTable(
@@ -61,27 +125,134 @@ class ProjectExpiryBaseCmd(cmd_base.CmdBase):
         self.pre_process_projects()
 
         limit = self.args.limit
+        self.prefiltered = 0
+        projects = self._eligible_projects()
+        if self.args.workers > 1:
+            processed = self._process_projects_concurrently(
+                projects, limit, self.args.workers
+            )
+        else:
+            processed = 0
+            for p in projects:
+                if self._process_project(p):
+                    processed += 1
+                if limit > 0 and processed >= limit:
+                    break
+        LOG.info(
+            "Processed %s projects, %s skipped by the pre-filter",
+            processed,
+            self.prefiltered,
+        )
+        if self.journal is not None:
+            LOG.info(
+                "Run %s outcomes: %s",
+                self.journal.run_id,
+                self.journal.summary(),
+            )
+        auth.log_client_stats()
+        return processed
+
+    def schedule_projects(self):
+        """Keep processing projects as their next steps fall due"""
+        if not (self.args.all or self.args.filename):
+            self.parser.error('--daemon needs --all or --filename')
+        scheduler.Scheduler(
+            self,
+            poll_interval=datetime.timedelta(minutes=self.args.poll_minutes),
+            reconcile_interval=datetime.timedelta(
+                hours=self.args.reconcile_hours
+            ),
+        ).run()
+
+    def may_need_action(self, project):
+        """Cheap check of a project's metadata before building its expirer
+
+        Only return False if the expirer would certainly do nothing today.
+        """
+        return True
+
+    def _eligible_projects(self):
+        """Yield the valid projects left after skipping --offset of them
+
+        Projects already finished in a resumed run are skipped first, and
+        projects the pre-filter rules out last.
+        """
         offset = self.args.offset
         offset_count = 0
-        processed = 0
-
         for p in self.projects:
-            if self.valid_project(p):
+            if self.journal is not None and self.journal.is_finished(p.id):
+                continue
+            if self.valid_project(p) and utils.in_shard(p.id, self.args.shard):
                 offset_count += 1
                 if offset is None or offset_count > offset:
-                    try:
-                        LOG.debug("------------------")
-                        ex = self.get_expirer(p)
-                        if ex.process():
-                            processed += 1
-                    except exceptions.InvalidProject:
-                        pass
-                    except Exception:
-                        LOG.exception('Exception processing project %s', p.id)
+                    if self.args.force_delete or self.may_need_action(p):
+                        yield p
+                    else:
+                        self.prefiltered += 1
 
-                if limit > 0 and processed >= limit:
-                    break
-        LOG.info("Processed %s projects", processed)
+    def _process_project(self, project):
+        """Process a project, returns True if any action was taken"""
+        started_at = datetime.datetime.now(datetime.UTC)
+        start = time.monotonic()
+        outcome = journal.SKIPPED
+        error = None
+        try:
+            LOG.debug("------------------")
+            ex = self.get_expirer(project)
+            if ex.process():
+                outcome = journal.PROCESSED
+        except exceptions.InvalidProject:
+            pass
+        except Exception as e:
+            LOG.exception('Exception processing project %s', project.id)
+            outcome = journal.ERROR
+            error = repr(e)
+        if self.journal is not None:
+            self.journal.record(
+                project.id,
+                outcome,
+                started_at,
+                time.monotonic() - start,
+                error,
+            )
+        return outcome == journal.PROCESSED
+
+    def _process_projects_concurrently(self, projects, limit, workers):
+        # Only this thread updates the counters.  Never have more projects
+        # in flight than could still count towards the limit, so the limit
+        # is honoured exactly.  Each project's log output is held back and
+        # written out in the order the projects were submitted.
+        processed = 0
+        in_flight = set()
+        submitted = collections.deque()
+        projects = iter(projects)
+        with log.OrderedLogBuffer() as log_buffer:
+            with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                while True:
+                    while len(in_flight) < workers and (
+                        limit <= 0 or processed + len(in_flight) < limit
+                    ):
+                        project = next(projects, None)
+                        if project is None:
+                            break
+                        future = executor.submit(
+                            log_buffer.capture, self._process_project, project
+                        )
+                        in_flight.add(future)
+                        submitted.append(future)
+                    if not in_flight:
+                        break
+
+                    done, in_flight = futures.wait(
+                        in_flight, return_when=futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        result, _ = future.result()
+                        if result:
+                            processed += 1
+                    while submitted and submitted[0].done():
+                        _, records = submitted.popleft().result()
+                        log_buffer.flush(records)
         return processed
 
     def add_args(self):
@@ -110,6 +281,65 @@ class ProjectExpiryBaseCmd(cmd_base.CmdBase):
             default=None,
             help='Skip this many projects before processing.',
         )
+        self.parser.add_argument(
+            '-w',
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of projects to process concurrently.',
+        )
+        self.parser.add_argument(
+            '--shard',
+            type=utils.parse_shard,
+            default=None,
+            metavar='INDEX/COUNT',
+            help='Only process the projects in this shard, numbered from 0. '
+            'Use to split a run over several hosts.',
+        )
+        self.parser.add_argument(
+            '--journal',
+            metavar='PATH',
+            help='SQLite file to record each project\'s outcome in, '
+            'defaults to the path in the [journal] config section.',
+        )
+        self.parser.add_argument(
+            '--resume',
+            metavar='RUN_ID',
+            help='Carry on with an earlier journaled run, skipping the '
+            'projects it already finished.',
+        )
+        self.parser.add_argument(
+            '--daemon',
+            action='store_true',
+            help='Keep running, processing projects only when their next '
+            'step is due, with a full pass every --reconcile-hours.',
+        )
+        self.parser.add_argument(
+            '--poll-minutes',
+            type=int,
+            default=60,
+            help='How often --daemon checks keystone for changed and due '
+            'projects.',
+        )
+        self.parser.add_argument(
+            '--reconcile-hours',
+            type=int,
+            default=24,
+            help='How often --daemon processes every project.',
+        )
+        self.parser.add_argument(
+            '--preload-instances',
+            action='store_true',
+            help='List the instances of every project in one call and '
+            'share the result, rather than listing each project separately.',
+        )
+        self.parser.add_argument(
+            '--preload-archives',
+            action='store_true',
+            help='List the instance archive images of every project in one '
+            'call and share the result, rather than listing each project '
+            'separately.',
+        )
         project_group.add_argument(
             '--all', action='store_true', help='Run over all projects'
         )
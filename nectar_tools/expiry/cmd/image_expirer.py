@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import argparse
+import datetime
 import logging
 import prettytable
 
@@ -8,9 +9,13 @@ from nectar_tools import auth
 from nectar_tools import cmd_base
 from nectar_tools import config
 from nectar_tools import exceptions
+from nectar_tools import utils
 
+from nectar_tools.expiry import archiver
 from nectar_tools.expiry import expirer
 from nectar_tools.expiry import expiry_states
+from nectar_tools.expiry import notifier as expiry_notifier
+from nectar_tools.expiry import outbox
 
 
 CONFIG = config.CONFIG
@@ -18,6 +23,8 @@ LOG = logging.getLogger(__name__)
 
 
 class ImageExpiryCmd(cmd_base.CmdBase):
+    TEMPLATE_DIRS = ['expiry/images']
+
     def __init__(self):
         super().__init__(log_filename='image-expiry.log')
 
@@ -46,6 +53,21 @@ class ImageExpiryCmd(cmd_base.CmdBase):
             LOG.error("Need to provide image id(s) or use option --all")
         self.images = images
 
+        # Recipients, running instances and recent boots for multi-image
+        # runs come from cloud-wide listings
+        self.user_index = None
+        self.instance_index = None
+        self.boot_index = None
+        if len(images) > 1:
+            n_client = auth.get_nova_client(self.session)
+            self.user_index = utils.ProjectUserIndex(self.k_client)
+            self.instance_index = archiver.InstanceIndex(n_client)
+            self.boot_index = archiver.ImageBootIndex(
+                n_client,
+                datetime.datetime.now()
+                - datetime.timedelta(days=expirer.THREE_YEARS_IN_DAYS),
+            )
+
     @staticmethod
     def valid_image(image):
         if image.visibility != 'private':
@@ -88,6 +110,9 @@ class ImageExpiryCmd(cmd_base.CmdBase):
             ks_session=self.session,
             dry_run=self.dry_run,
             force_delete=self.args.force_delete,
+            user_index=self.user_index,
+            instance_index=self.instance_index,
+            boot_index=self.boot_index,
         )
 
     @staticmethod
@@ -135,6 +160,14 @@ class ImageExpiryCmd(cmd_base.CmdBase):
             help='Skip this many images \
                                  before processing',
         )
+        self.parser.add_argument(
+            '--shard',
+            type=utils.parse_shard,
+            default=None,
+            metavar='INDEX/COUNT',
+            help='Only process the images in this shard, numbered from 0. '
+            'Use to split a run over several hosts.',
+        )
         self.parser.add_argument(
             '-s',
             '--status',
@@ -182,7 +215,9 @@ class ImageExpiryCmd(cmd_base.CmdBase):
         processed = 0
 
         for image in self.images:
-            if self.valid_image(image):
+            if self.valid_image(image) and utils.in_shard(
+                image.id, self.args.shard
+            ):
                 offset_count += 1
                 if offset is None or offset_count > offset:
                     try:
@@ -199,6 +234,7 @@ class ImageExpiryCmd(cmd_base.CmdBase):
                 if limit > 0 and processed >= limit:
                     break
         LOG.info("Processed %s images", processed)
+        auth.log_client_stats()
         return processed
 
 
@@ -210,7 +246,10 @@ def main():
     if cmd.args.set_admin:
         cmd.set_admin()
         return
-    cmd.process_images()
+    with outbox.running(
+        expiry_notifier.deliver, session=cmd.session, dry_run=cmd.dry_run
+    ):
+        cmd.process_images()
 
 
 if __name__ == '__main__':
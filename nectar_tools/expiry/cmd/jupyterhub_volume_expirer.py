@@ -2,13 +2,17 @@
 
 import logging
 import prettytable
+import sys
 
 from nectar_tools import auth
 from nectar_tools import cmd_base
 from nectar_tools import config
+from nectar_tools import utils
 
 from nectar_tools.expiry import expiry_states
 from nectar_tools.expiry.manager import jupyterhub as expirer
+from nectar_tools.expiry import notifier as expiry_notifier
+from nectar_tools.expiry import outbox
 
 
 CONF = config.CONFIG
@@ -22,6 +26,8 @@ UPDATED_AT_KEY = 'nectar.org.au/expiry_updated_at'
 
 
 class JupyterHubVolumeExpiryCmd(cmd_base.CmdBase):
+    TEMPLATE_DIRS = ['expiry/jupyterhub_volume']
+
     def __init__(self):
         super().__init__(log_filename='jupyterhub-volume-expiry.log')
 
@@ -29,19 +35,32 @@ class JupyterHubVolumeExpiryCmd(cmd_base.CmdBase):
         self.kube_ns = CONF.kubernetes_client.namespace
 
         pvcs = []
+        self.pvc_source = None
         if self.args.pvc_id:
             pvc = self.kube_client.read_namespaced_persistent_volume_claim(
                 self.args.pvc_id, self.kube_ns
             )
             pvcs.append(pvc)
         elif self.args.all:
-            pvcs = self.kube_client.list_namespaced_persistent_volume_claim(
-                self.kube_ns, label_selector='hub.jupyter.org/username'
-            ).items
+            # Listed a page at a time as they are processed
+            self.pvc_source = expirer.PVCSource(
+                self.kube_client,
+                self.kube_ns,
+                state_path=self.args.incremental,
+            )
+            pvcs = self.pvc_source
         else:
             LOG.error("Need to provide PVC name(s) or use option --all")
+        if self.args.incremental and not self.args.all:
+            LOG.error("--incremental can only be used with --all")
+            sys.exit(1)
         self.pvcs = pvcs
 
+        # Hub activity for multi-PVC runs comes from one paginated listing
+        self.last_activity = None
+        if self.args.all and not self.args.set_admin:
+            self.last_activity = expirer.get_last_activity_map()
+
     @staticmethod
     def valid_pvc(pvc):
         # TODO(andy) Check if mounted?
@@ -75,7 +94,10 @@ class JupyterHubVolumeExpiryCmd(cmd_base.CmdBase):
 
     def get_expirer(self, pvc):
         return expirer.JupyterHubVolumeExpirer(
-            pvc=pvc, dry_run=self.dry_run, force_delete=self.args.force_delete
+            pvc=pvc,
+            dry_run=self.dry_run,
+            force_delete=self.args.force_delete,
+            last_activity=self.last_activity,
         )
 
     @staticmethod
@@ -115,6 +137,14 @@ class JupyterHubVolumeExpiryCmd(cmd_base.CmdBase):
             help='Skip this many PVCs \
                                  before processing',
         )
+        self.parser.add_argument(
+            '--shard',
+            type=utils.parse_shard,
+            default=None,
+            metavar='INDEX/COUNT',
+            help='Only process the PVCs in this shard, numbered from 0. '
+            'Use to split a run over several hosts.',
+        )
         self.parser.add_argument(
             '-s',
             '--status',
@@ -133,6 +163,14 @@ class JupyterHubVolumeExpiryCmd(cmd_base.CmdBase):
             help="Delete an pvc no matter what state \
                                  it's in",
         )
+        self.parser.add_argument(
+            '--incremental',
+            metavar='STATE_FILE',
+            default=None,
+            help='Only process the PVCs added or changed since the last '
+            'run that used this state file (with --all only). Steps that '
+            'fall due without a PVC changing still need a full run.',
+        )
 
     def set_admin(self):
         """Set status to admin for specified list of PVCs."""
@@ -157,9 +195,12 @@ class JupyterHubVolumeExpiryCmd(cmd_base.CmdBase):
         offset = self.args.offset
         offset_count = 0
         processed = 0
+        failed = 0
 
         for pvc in self.pvcs:
-            if self.valid_pvc(pvc):
+            if self.valid_pvc(pvc) and utils.in_shard(
+                pvc.metadata.name, self.args.shard
+            ):
                 offset_count += 1
                 if offset is None or offset_count > offset:
                     try:
@@ -168,6 +209,7 @@ class JupyterHubVolumeExpiryCmd(cmd_base.CmdBase):
                         if ex.process():
                             processed += 1
                     except Exception:
+                        failed += 1
                         LOG.exception(
                             'Exception processing JupyterHub PVC %s',
                             pvc.metadata.name,
@@ -175,6 +217,17 @@ class JupyterHubVolumeExpiryCmd(cmd_base.CmdBase):
                 if limit > 0 and processed >= limit:
                     break
         LOG.info("Processed %s PVCs", processed)
+        if self.pvc_source is not None and not self.dry_run:
+            if failed:
+                # Keep the old state so the next run sees them again
+                LOG.warning(
+                    "Not saving %s, %s PVCs failed",
+                    self.args.incremental,
+                    failed,
+                )
+            else:
+                self.pvc_source.save_state()
+        auth.log_client_stats()
         return processed
 
 
@@ -186,7 +239,10 @@ def main():
     if cmd.args.set_admin:
         cmd.set_admin()
         return
-    cmd.process_pvcs()
+    with outbox.running(
+        expiry_notifier.deliver, session=cmd.session, dry_run=cmd.dry_run
+    ):
+        cmd.process_pvcs()
 
 
 if __name__ == '__main__':
@@ -1,16 +1,41 @@
 #!/usr/bin/env python
 
+import datetime
 import logging
 
+from nectar_tools import auth
+from nectar_tools import config
 from nectar_tools.expiry.cmd import base
 from nectar_tools.expiry import expirer
+from nectar_tools.expiry import notifier as expiry_notifier
+from nectar_tools.expiry import outbox
+from nectar_tools.expiry import prefilter
+from nectar_tools.expiry import usage
 from nectar_tools import utils
 
 
+CONFIG = config.CONFIG
 LOG = logging.getLogger(__name__)
 
 
 class PTExpiryCmd(base.ProjectExpiryBaseCmd):
+    TEMPLATE_DIRS = ['expiry/pts']
+
+    def setup_run(self, resume=None):
+        super().setup_run(resume=resume)
+        # Usage and owner accounts for multi-project runs come from one
+        # all tenants usage listing and one account listing
+        self.usage_index = None
+        self.account_index = None
+        if len(self.projects) > 1:
+            self.usage_index = usage.UsageIndex(
+                auth.get_nova_client(self.session),
+                cache_path=CONFIG.get('usage', {}).get('cache_path'),
+            )
+            self.account_index = utils.AccountIndex(
+                auth.get_manuka_client(self.session)
+            )
+
     @staticmethod
     def valid_project(project):
         return expirer.PT_RE.match(project.name)
@@ -24,6 +49,14 @@ class PTExpiryCmd(base.ProjectExpiryBaseCmd):
             help="Also disable project in keystone",
         )
 
+    def may_need_action(self, project):
+        # Owners are filled in by pre_process_projects
+        if getattr(project, 'owner', None) is None:
+            return False
+        return prefilter.project_may_need_action(
+            project, datetime.datetime.now()
+        )
+
     def get_expirer(self, project):
         return expirer.PTExpirer(
             project=project,
@@ -31,6 +64,11 @@ class PTExpiryCmd(base.ProjectExpiryBaseCmd):
             dry_run=self.dry_run,
             disable_project=self.args.disable_project,
             force_delete=self.args.force_delete,
+            instance_index=self.instance_index,
+            archive_index=self.archive_index,
+            cluster_index=self.cluster_index,
+            usage_index=self.usage_index,
+            account_index=self.account_index,
         )
 
     def pre_process_projects(self):
@@ -56,7 +94,15 @@ def main():
     if cmd.args.status:
         cmd.print_status()
         return
-    cmd.process_projects()
+    with outbox.running(
+        expiry_notifier.deliver, session=cmd.session, dry_run=cmd.dry_run
+    ):
+        if cmd.args.daemon:
+            cmd.schedule_projects()
+            return
+
+        cmd.setup_run(resume=cmd.args.resume)
+        cmd.process_projects()
 
 
 if __name__ == '__main__':
@@ -7,24 +7,22 @@ from dateutil.relativedelta import relativedelta
 from nectarallocationclient import exceptions as allocation_exceptions
 from nectarallocationclient import states as allocation_states
 from nectarallocationclient.v1 import allocations
-from oslo_context import context
-import oslo_messaging
 
 from nectar_tools import auth
 from nectar_tools.common import service_units
 from nectar_tools import config
+from nectar_tools import events
 from nectar_tools import exceptions
 from nectar_tools import utils
 
 from nectar_tools.expiry import archiver
 from nectar_tools.expiry import expiry_states
 from nectar_tools.expiry import notifier as expiry_notifier
+from nectar_tools.expiry import prefilter
 
 
 CONF = config.CONFIG
 LOG = logging.getLogger(__name__)
-OSLO_CONF = config.OSLO_CONF
-OSLO_CONTEXT = context.RequestContext()
 
 DATE_FORMAT = '%Y-%m-%d'
 DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
@@ -78,7 +76,13 @@ class Expirer:
     UPDATED_AT_KEY = 'expiry_updated_at'
 
     def __init__(
-        self, resource_type, resource, notifier, ks_session=None, dry_run=False
+        self,
+        resource_type,
+        resource,
+        notifier,
+        ks_session=None,
+        dry_run=False,
+        user_index=None,
     ):
         self.k_client = auth.get_keystone_client(ks_session)
         self.g_client = auth.get_glance_client(ks_session)
@@ -90,18 +94,9 @@ class Expirer:
         self.members = None
         self.resource_type = resource_type
         self.resource = resource
+        self.user_index = user_index
         self._project = None
 
-        transport = oslo_messaging.get_notification_transport(OSLO_CONF)
-        self.event_notifier = oslo_messaging.Notifier(transport, 'expiry')
-        target = oslo_messaging.Target(
-            exchange='openstack', topic='notifications'
-        )
-        for queue in CONF.events.notifier_queues.split(','):
-            transport._driver.listen_for_notifications(
-                [(target, 'audit')], queue, 1, 1
-            )
-
     @property
     def project(self):
         if self._project is None:
@@ -111,14 +106,20 @@ class Expirer:
     def _get_project_managers(self):
         if self.managers is None:
             self.managers = utils.get_project_users(
-                self.k_client, self.project, role=CONF.keystone.manager_role_id
+                self.k_client,
+                self.project,
+                role=CONF.keystone.manager_role_id,
+                index=self.user_index,
             )
         return self.managers
 
     def _get_project_members(self):
         if self.members is None:
             self.members = utils.get_project_users(
-                self.k_client, self.project, role=CONF.keystone.member_role_id
+                self.k_client,
+                self.project,
+                role=CONF.keystone.member_role_id,
+                index=self.user_index,
             )
         return self.members
 
@@ -130,7 +131,9 @@ class Expirer:
         return {}
 
     def _get_recipients(self):
-        return utils.get_project_recipients(self.k_client, self.project)
+        return utils.get_project_recipients(
+            self.k_client, self.project, index=self.user_index
+        )
 
     def _send_notification(self, stage, extra_context={}, tags=[]):
         if self.get_status() == expiry_states.DELETED:
@@ -171,7 +174,7 @@ class Expirer:
         if self.dry_run:
             LOG.info('%s: Would send event %s', self.resource.id, event_type)
             return
-        self.event_notifier.audit(OSLO_CONTEXT, event_type, payload)
+        events.send(event_type, payload)
 
     def delete_resources(self, force=False):
         resources = self.archiver.delete_resources(force=force)
@@ -329,15 +332,25 @@ class ProjectExpirer(Expirer):
         ks_session=None,
         dry_run=False,
         disable_project=False,
+        user_index=None,
+        instance_index=None,
+        archive_index=None,
+        cluster_index=None,
     ):
-        super().__init__('project', project, notifier, ks_session, dry_run)
+        super().__init__(
+            'project', project, notifier, ks_session, dry_run, user_index
+        )
         self.project_set_defaults()
         self.disable_project = disable_project
+        self.instance_index = instance_index
         self.archiver = archiver.ResourceArchiver(
             project,
             archivers=archivers,
             ks_session=ks_session,
             dry_run=dry_run,
+            instance_index=instance_index,
+            archive_index=archive_index,
+            cluster_index=cluster_index,
         )
         self.a_client = auth.get_allocation_client(ks_session)
 
@@ -569,6 +582,11 @@ class AllocationExpirer(ProjectExpirer):
         ],
         template_dir='allocations',
         subject='Nectar Project Allocation Renewal - ',
+        user_index=None,
+        allocation_index=None,
+        instance_index=None,
+        archive_index=None,
+        cluster_index=None,
     ):
         notifier = expiry_notifier.ExpiryNotifier(
             resource_type='project',
@@ -582,18 +600,37 @@ class AllocationExpirer(ProjectExpirer):
         )
 
         super().__init__(
-            project, archivers, notifier, ks_session, dry_run, disable_project
+            project,
+            archivers,
+            notifier,
+            ks_session,
+            dry_run,
+            disable_project,
+            user_index,
+            instance_index,
+            archive_index,
+            cluster_index,
         )
 
         self.force_no_allocation = force_no_allocation
         self.force_delete = force_delete
+        self.allocation_index = allocation_index
         self.allocation = self.get_allocation()
 
     def get_current_allocation(self):
+        if self.allocation_index is not None:
+            return self.allocation_index.get_current(self.project.id)
         return self.a_client.allocations.get_current(
             project_id=self.project.id
         )
 
+    def get_last_approved_allocation(self):
+        if self.allocation_index is not None:
+            return self.allocation_index.get_last_approved(self.project.id)
+        return self.a_client.allocations.get_last_approved(
+            project_id=self.project.id
+        )
+
     def get_allocation(self):
         try:
             allocation = self.get_current_allocation()
@@ -635,9 +672,7 @@ class AllocationExpirer(ProjectExpirer):
             )
 
             if mod_time < cutoff:
-                approved = self.a_client.allocations.get_last_approved(
-                    project_id=self.project.id
-                )
+                approved = self.get_last_approved_allocation()
                 if approved:
                     LOG.debug(
                         "%s: Allocation has old unapproved application, "
@@ -675,20 +710,9 @@ class AllocationExpirer(ProjectExpirer):
         The notice period is either 30 days, or the number of days from 80% of
         the length of the allocation until the end -- whichever is shorter.
         """
-        allocation_start = datetime.datetime.strptime(
-            self.allocation.start_date, DATE_FORMAT
+        return prefilter.get_notice_period_days(
+            self.allocation.start_date, self.allocation.end_date
         )
-        allocation_end = datetime.datetime.strptime(
-            self.allocation.end_date, DATE_FORMAT
-        )
-
-        allocation_days = (allocation_end - allocation_start).days
-        notice_days = int(allocation_days - (allocation_days * 0.8))
-
-        if notice_days > 30:
-            return 30
-
-        return notice_days
 
     def get_expiry_date(self):
         allocation_end = datetime.datetime.strptime(
@@ -784,7 +808,9 @@ class AllocationExpirer(ProjectExpirer):
         return True
 
     def _get_recipients(self):
-        return utils.get_allocation_recipients(self.k_client, self.allocation)
+        return utils.get_allocation_recipients(
+            self.k_client, self.allocation, index=self.user_index
+        )
 
     def _get_notification_context(self):
         managers = self._get_project_managers()
@@ -849,6 +875,11 @@ class PTExpirer(ProjectExpirer):
         dry_run=False,
         disable_project=False,
         force_delete=False,
+        instance_index=None,
+        archive_index=None,
+        cluster_index=None,
+        usage_index=None,
+        account_index=None,
     ):
         archivers = [
             'nova',
@@ -869,11 +900,21 @@ class PTExpirer(ProjectExpirer):
         )
 
         super().__init__(
-            project, archivers, notifier, ks_session, dry_run, disable_project
+            project,
+            archivers,
+            notifier,
+            ks_session,
+            dry_run,
+            disable_project,
+            instance_index=instance_index,
+            archive_index=archive_index,
+            cluster_index=cluster_index,
         )
         self.n_client = auth.get_nova_client(ks_session)
         self.m_client = auth.get_manuka_client(ks_session)
         self.force_delete = force_delete
+        self.usage_index = usage_index
+        self.account_index = account_index
 
     def should_process(self):
         status = self.get_status()
@@ -931,7 +972,10 @@ class PTExpirer(ProjectExpirer):
 
     def is_pt_too_old(self):
         user_id = self.project.owner.id
-        account = self.m_client.users.get(user_id)
+        if self.account_index is not None:
+            account = self.account_index.get(user_id)
+        else:
+            account = self.m_client.users.get(user_id)
         six_months_ago = self.now - relativedelta(months=6)
         return account.registered_at < six_months_ago
 
@@ -939,8 +983,11 @@ class PTExpirer(ProjectExpirer):
         limit = USAGE_LIMIT_HOURS
         start = datetime.datetime(2011, 1, 1)
         end = self.now + relativedelta(days=1)
-        usage = self.n_client.usage.get(self.project.id, start, end)
-        cpu_hours = getattr(usage, 'total_vcpus_usage', None)
+        if self.usage_index is not None:
+            cpu_hours = self.usage_index.get_vcpu_hours(self.project.id)
+        else:
+            usage = self.n_client.usage.get(self.project.id, start, end)
+            cpu_hours = getattr(usage, 'total_vcpus_usage', None)
 
         if cpu_hours is None:
             raise exceptions.NoUsageError()
@@ -968,7 +1015,15 @@ class AllocationInstanceExpirer(AllocationExpirer):
     EVENT_PREFIX = 'expiry.allocation.instance'
 
     def __init__(
-        self, project, ks_session=None, dry_run=False, force_delete=False
+        self,
+        project,
+        ks_session=None,
+        dry_run=False,
+        force_delete=False,
+        user_index=None,
+        allocation_index=None,
+        instance_index=None,
+        archive_index=None,
     ):
         archivers = ['zoneinstance']
 
@@ -980,6 +1035,10 @@ class AllocationInstanceExpirer(AllocationExpirer):
             archivers=archivers,
             template_dir='allocation_instances',
             subject="Nectar Allocation Instances Expiry - ",
+            user_index=user_index,
+            allocation_index=allocation_index,
+            instance_index=instance_index,
+            archive_index=archive_index,
         )
 
         self._instances = None
@@ -988,7 +1047,10 @@ class AllocationInstanceExpirer(AllocationExpirer):
     def instances(self):
         if self._instances is None:
             self._instances = utils.get_out_of_zone_instances(
-                self.ks_session, self.allocation, self.project
+                self.ks_session,
+                self.allocation,
+                self.project,
+                instance_index=self.instance_index,
             )
         return self._instances
 
@@ -1132,7 +1194,14 @@ class ImageExpirer(Expirer):
     EVENT_PREFIX = 'expiry.image'
 
     def __init__(
-        self, image, ks_session=None, dry_run=False, force_delete=False
+        self,
+        image,
+        ks_session=None,
+        dry_run=False,
+        force_delete=False,
+        user_index=None,
+        instance_index=None,
+        boot_index=None,
     ):
         notifier = expiry_notifier.ExpiryNotifier(
             resource_type='image',
@@ -1154,7 +1223,11 @@ class ImageExpirer(Expirer):
         self.image_set_defaults()
         self.g_client = auth.get_glance_client(ks_session)
         self.n_client = auth.get_nova_client(ks_session)
-        super().__init__('image', image, notifier, ks_session, dry_run)
+        self.instance_index = instance_index
+        self.boot_index = boot_index
+        super().__init__(
+            'image', image, notifier, ks_session, dry_run, user_index
+        )
 
     def get_project(self):
         if not hasattr(self.image, 'owner'):
@@ -1198,8 +1271,15 @@ class ImageExpirer(Expirer):
     def _has_no_running_instance(self):
         search_opts = {'image': self.image.id, 'all_tenants': True}
         try:
-            instances = self.n_client.servers.list(search_opts=search_opts)
-            if len(instances):
+            if self.instance_index is not None:
+                count = self.instance_index.get_image_instance_count(
+                    self.image.id
+                )
+            else:
+                count = len(
+                    self.n_client.servers.list(search_opts=search_opts)
+                )
+            if count:
                 LOG.debug("Image %s: Has running instances", self.image.id)
                 return False
             return True
@@ -1221,8 +1301,12 @@ class ImageExpirer(Expirer):
             'changes-since': changes_since,
         }
         try:
-            instances = self.n_client.servers.list(search_opts=search_opts)
-            if len(instances):
+            # The index covers the default window, set by ImageExpiryCmd
+            if self.boot_index is not None and days == THREE_YEARS_IN_DAYS:
+                booted = self.boot_index.get_last_boot(self.image.id)
+            else:
+                booted = self.n_client.servers.list(search_opts=search_opts)
+            if booted:
                 LOG.debug("Image %s: Has been booted recently", self.image.id)
                 return False
             return True
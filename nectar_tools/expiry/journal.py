@@ -0,0 +1,144 @@
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+
+
+LOG = logging.getLogger(__name__)
+
+PROCESSED = 'processed'
+SKIPPED = 'skipped'
+ERROR = 'error'
+
+# Outcomes that don't need to be retried when a run is resumed
+FINISHED = (PROCESSED, SKIPPED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    command TEXT,
+    started_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resources (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    resource_id TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    duration REAL NOT NULL,
+    error TEXT,
+    PRIMARY KEY (run_id, resource_id)
+);
+"""
+
+
+class RunJournal:
+    """Record of what an expiry run has done, kept in a local SQLite file
+
+    Each resource's outcome is committed as soon as it is handled, so an
+    interrupted run can be resumed without repeating the resources it had
+    already finished.  Safe to share between threads.
+    """
+
+    def __init__(self, path, run_id=None, command=None):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+        if run_id is None:
+            self.run_id = uuid.uuid4().hex
+            with self._conn:
+                self._conn.execute(
+                    'INSERT INTO runs (run_id, command, started_at) '
+                    'VALUES (?, ?, ?)',
+                    (self.run_id, command, _now()),
+                )
+            self.finished = set()
+        else:
+            row = self._conn.execute(
+                'SELECT command FROM runs WHERE run_id = ?', (run_id,)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f'Run {run_id} not found in journal {path}')
+            if command and row[0] != command:
+                raise ValueError(f'Run {run_id} was made by {row[0]}')
+            self.run_id = run_id
+            self.finished = set(
+                r[0]
+                for r in self._conn.execute(
+                    'SELECT resource_id FROM resources '
+                    'WHERE run_id = ? AND outcome IN (?, ?)',
+                    (run_id,) + FINISHED,
+                )
+            )
+
+    def is_finished(self, resource_id):
+        return resource_id in self.finished
+
+    def record(self, resource_id, outcome, started_at, duration, error=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO resources (run_id, resource_id, '
+                'outcome, started_at, duration, error) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    self.run_id,
+                    resource_id,
+                    outcome,
+                    started_at.isoformat(),
+                    duration,
+                    error,
+                ),
+            )
+            if outcome in FINISHED:
+                self.finished.add(resource_id)
+
+    def summary(self):
+        """Count of resources by outcome for this run"""
+        with self._lock:
+            return dict(
+                self._conn.execute(
+                    'SELECT outcome, COUNT(*) FROM resources '
+                    'WHERE run_id = ? GROUP BY outcome',
+                    (self.run_id,),
+                ).fetchall()
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _now():
+    return datetime.datetime.now(datetime.UTC).isoformat()
+
+
+def get_journal(path=None, resume=None, command=None):
+    """Open the run journal, or return None if no path is configured
+
+    :param str path: SQLite file to keep the journal in
+    :param str resume: ID of a run to carry on with, rather than a new one
+    :param str command: Name of the command, a run can only be resumed by
+        the command that started it
+    """
+    if not path:
+        if resume:
+            raise ValueError('--resume needs a journal path')
+        return None
+    journal = RunJournal(path, run_id=resume, command=command)
+    if resume:
+        LOG.info(
+            "Resuming run %s from %s, %d done already",
+            journal.run_id,
+            path,
+            len(journal.finished),
+        )
+    else:
+        LOG.info("Recording run %s in %s", journal.run_id, path)
+    return journal
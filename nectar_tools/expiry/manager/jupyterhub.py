@@ -1,7 +1,12 @@
 import datetime
 import logging
+import os
+import threading
 
+from kubernetes.client.rest import ApiException as kube_api_exc
+from kubernetes import watch
 import requests
+from requests import adapters
 
 from nectar_tools import auth
 from nectar_tools import config
@@ -19,6 +24,180 @@ LOG = logging.getLogger(__name__)
 ONE_MONTH_IN_DAYS = 31
 SIX_MONTHS_IN_DAYS = 180
 
+# Connect and read timeouts for JupyterHub API calls, in seconds
+API_TIMEOUT = (10, 60)
+USERS_PAGE_SIZE = 200
+PAGINATION_MEDIA_TYPE = 'application/jupyterhub-pagination+json'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_api_session():
+    """Pooled HTTP session for the JupyterHub API, shared by the process"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = adapters.HTTPAdapter(pool_maxsize=10)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['Authorization'] = 'token ' + CONF.jupyterhub.token
+            _session = session
+        return _session
+
+
+def jupyterhub_api(path, params=None, headers=None):
+    url = CONF.jupyterhub.api_url + '/' + path
+    r = get_api_session().get(
+        url, params=params, headers=headers, timeout=API_TIMEOUT
+    )
+    r.raise_for_status()
+    return r.json()
+
+
+def parse_last_activity(value):
+    # The timestamp given from JHub can vary, so we just strip away
+    # everything except the date part
+    ts = value.split('T')[0]
+    return datetime.datetime.strptime(ts, '%Y-%m-%d')
+
+
+def get_last_activity_map(page_size=USERS_PAGE_SIZE):
+    """Last active date of every hub user by name
+
+    Read from the paginated /users listing, a page of page_size users at a
+    time.  Users that have never been active are left out.
+    """
+    last_activity = {}
+    offset = 0
+    while True:
+        body = jupyterhub_api(
+            'users',
+            params={'offset': offset, 'limit': page_size},
+            headers={'Accept': PAGINATION_MEDIA_TYPE},
+        )
+        if isinstance(body, list):
+            # Hubs before 2.0 return every user in one list
+            users, next_page = body, None
+        else:
+            users = body.get('items', [])
+            next_page = body.get('_pagination', {}).get('next')
+        for user in users:
+            if user.get('last_activity'):
+                last_activity[user['name']] = parse_last_activity(
+                    user['last_activity']
+                )
+        if not next_page:
+            LOG.debug("Loaded last activity of %d users", len(last_activity))
+            return last_activity
+        offset = next_page['offset']
+
+
+# PVCs per page when listing the namespace
+PVC_PAGE_SIZE = 500
+# How long to wait for further changes when watching since a previous run
+WATCH_TIMEOUT = 10
+PVC_LABEL_SELECTOR = 'hub.jupyter.org/username'
+
+
+class PVCSource:
+    """The hub user PVCs of a namespace, streamed for processing
+
+    PVCs are listed a page at a time.  With a state_path, the resource
+    version the listing was made at is kept there, and the next iteration
+    only returns the PVCs added or changed since, by watching from that
+    version.  A version too old to watch from falls back to a full listing.
+    """
+
+    def __init__(
+        self, kube_client, namespace, state_path=None, page_size=PVC_PAGE_SIZE
+    ):
+        self.kube_client = kube_client
+        self.namespace = namespace
+        self.state_path = state_path
+        self.page_size = page_size
+        self.resource_version = None
+        self.complete = False
+
+    def _read_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as f:
+            return f.read().strip() or None
+
+    def save_state(self):
+        """Record where this iteration got to, once it has been consumed"""
+        if not self.state_path or not self.complete:
+            return
+        if not self.resource_version:
+            return
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.resource_version)
+        os.replace(tmp_path, self.state_path)
+        LOG.debug("Saved PVC resource version %s", self.resource_version)
+
+    def _list(self):
+        _continue = None
+        while True:
+            kwargs = {'_continue': _continue} if _continue else {}
+            result = self.kube_client.list_namespaced_persistent_volume_claim(
+                self.namespace,
+                label_selector=PVC_LABEL_SELECTOR,
+                limit=self.page_size,
+                **kwargs,
+            )
+            yield from result.items
+            # Every page is from the version the first page was listed at
+            self.resource_version = result.metadata.resource_version
+            _continue = result.metadata._continue
+            if not _continue:
+                return
+
+    def _watch(self, resource_version):
+        changed = {}
+        w = watch.Watch()
+        for event in w.stream(
+            self.kube_client.list_namespaced_persistent_volume_claim,
+            self.namespace,
+            label_selector=PVC_LABEL_SELECTOR,
+            resource_version=resource_version,
+            allow_watch_bookmarks=True,
+            timeout_seconds=WATCH_TIMEOUT,
+        ):
+            pvc = event['object']
+            resource_version = pvc.metadata.resource_version
+            if event['type'] == 'DELETED':
+                changed.pop(pvc.metadata.name, None)
+            elif event['type'] in ('ADDED', 'MODIFIED'):
+                changed[pvc.metadata.name] = pvc
+        LOG.info("%d PVCs changed since the last run", len(changed))
+        self.resource_version = resource_version
+        return list(changed.values())
+
+    def __iter__(self):
+        self.complete = False
+        resource_version = self._read_state()
+        pvcs = None
+        if resource_version:
+            try:
+                pvcs = self._watch(resource_version)
+            except kube_api_exc as e:
+                if e.status != 410:
+                    raise
+                LOG.info(
+                    "PVC resource version %s has expired, listing all PVCs",
+                    resource_version,
+                )
+        if pvcs is None:
+            pvcs = self._list()
+        yield from pvcs
+        self.complete = True
+
 
 class JupyterHubVolumeExpirer(base.Expirer):
     STATUS_KEY = 'nectar.org.au/expiry_status'
@@ -29,7 +208,12 @@ class JupyterHubVolumeExpirer(base.Expirer):
     EVENT_PREFIX = 'expiry.jupyterhub.volume'
 
     def __init__(
-        self, pvc, ks_session=None, dry_run=False, force_delete=False
+        self,
+        pvc,
+        ks_session=None,
+        dry_run=False,
+        force_delete=False,
+        last_activity=None,
     ):
         patched_pvc = pvc
         patched_pvc.id = pvc.metadata.name
@@ -55,6 +239,8 @@ class JupyterHubVolumeExpirer(base.Expirer):
             'hub.jupyter.org/username'
         )
         self.force_delete = force_delete
+        self.last_activity = last_activity
+        self._last_active = None
         self.kube_client = auth.get_kube_client()
         self.kube_ns = CONF.kubernetes_client.namespace
 
@@ -116,19 +302,18 @@ class JupyterHubVolumeExpirer(base.Expirer):
 
     @staticmethod
     def _jupyterhub_api(path):
-        url = CONF.jupyterhub.api_url + '/' + path
-        token = CONF.jupyterhub.token
-        r = requests.get(url, headers={'Authorization': 'token ' + token})
-        r.raise_for_status()
-        return r.json()
+        return jupyterhub_api(path)
 
     def get_last_active_date(self):
-        hubuser = self._jupyterhub_api('/users/' + self.username)
-        # The timestamp given from JHub can vary, so we just strip away
-        # everything except the date part
-        ts = hubuser.get('last_activity').split('T')[0]
-        last_activity = datetime.datetime.strptime(ts, '%Y-%m-%d')
-        return last_activity
+        if self._last_active is None:
+            if self.last_activity and self.username in self.last_activity:
+                self._last_active = self.last_activity[self.username]
+            else:
+                hubuser = self._jupyterhub_api('/users/' + self.username)
+                self._last_active = parse_last_activity(
+                    hubuser.get('last_activity')
+                )
+        return self._last_active
 
     def get_warning_date(self):
         last_activity = self.get_last_active_date()
@@ -1,10 +1,13 @@
 import logging
+import types
 
 from nectar_tools import auth
 from nectar_tools import config
 from nectar_tools import exceptions
 from nectar_tools import notifier
 
+from nectar_tools.expiry import outbox
+
 
 CONF = config.CONFIG
 LOG = logging.getLogger(__name__)
@@ -44,6 +47,23 @@ class ExpiryNotifier(notifier.FreshDeskNotifier):
 
         ticket_id = self._get_ticket_id()
 
+        box = self._get_outbox()
+        if box is not None:
+            details = None
+            if ticket_id <= 0:
+                details = self._render_details(extra_context)
+            self._enqueue(
+                box,
+                action='message',
+                ticket_id=ticket_id,
+                owner=owner,
+                cc_emails=extra_recipients,
+                text=text,
+                details=details,
+                tags=['expiry'] + tags,
+            )
+            return
+
         if ticket_id > 0:
             self._update_ticket_requester(ticket_id, owner)
             self._update_ticket(ticket_id, text, cc_emails=extra_recipients)
@@ -57,17 +77,50 @@ class ExpiryNotifier(notifier.FreshDeskNotifier):
             )
             self._set_ticket_id(ticket_id)
 
-            try:
-                details = self.render_template(
-                    f'{self.resource_type}-details.tmpl', extra_context
-                )
-            except exceptions.TemplateNotFound:
-                LOG.debug("Details template not found, ignoring")
-            else:
+            details = self._render_details(extra_context)
+            if details is not None:
                 self._add_note_to_ticket(ticket_id, details)
 
+    def _render_details(self, extra_context):
+        try:
+            return self.render_template(
+                f'{self.resource_type}-details.tmpl', extra_context
+            )
+        except exceptions.TemplateNotFound:
+            LOG.debug("Details template not found, ignoring")
+            return None
+
+    def _get_outbox(self):
+        """The outbox to queue messages in, or None to send them now"""
+        if self.dry_run:
+            return None
+        return outbox.get_outbox()
+
+    def _enqueue(self, box, **payload):
+        payload.update(
+            resource_type=self.resource_type,
+            resource_id=self.resource.id,
+            group_id=self.group_id,
+            subject=self.subject,
+            ticket_id_key=self.ticket_id_key,
+        )
+        box.enqueue(f'{self.resource_type}/{self.resource.id}', payload)
+        LOG.debug(
+            "%s: Queued %s notification", self.resource.id, payload['action']
+        )
+
     def finish(self, message=None):
         ticket_id = self._get_ticket_id()
+
+        box = self._get_outbox()
+        if box is not None:
+            # Queued even without a ticket ID, as a message still in the
+            # outbox may be about to create the ticket
+            self._enqueue(
+                box, action='finish', ticket_id=ticket_id, message=message
+            )
+            return
+
         if ticket_id:
             if message:
                 self._add_note_to_ticket(ticket_id, message)
@@ -113,3 +166,63 @@ class ExpiryNotifier(notifier.FreshDeskNotifier):
                 return int(getattr(self.resource, self.ticket_id_key, 0))
         except ValueError:
             return 0
+
+
+def deliver(box, message, session=None):
+    """Send a message ExpiryNotifier queued in the outbox
+
+    The ticket created for a new message is saved in its payload straight
+    away, so a retry carries on with it rather than creating another.
+    """
+    payload = message.payload
+    n = ExpiryNotifier(
+        payload['resource_type'],
+        types.SimpleNamespace(id=payload['resource_id']),
+        '',
+        payload['group_id'],
+        payload['subject'],
+        ks_session=session,
+        ticket_id_key=payload['ticket_id_key'],
+    )
+
+    ticket_id = payload['ticket_id']
+    if ticket_id <= 0:
+        # The resource had no ticket when this was queued, look for one
+        # created for an earlier message since then
+        for earlier in box.sent_since(message):
+            if earlier['action'] == 'finish':
+                break
+            if earlier['ticket_id'] > 0:
+                ticket_id = earlier['ticket_id']
+                break
+
+    if payload['action'] == 'finish':
+        if ticket_id > 0:
+            if payload['message']:
+                n._add_note_to_ticket(ticket_id, payload['message'])
+            # Status 5 == Closed
+            LOG.info("%s: Closing ticket %s", n.resource.id, ticket_id)
+            n.api.tickets.update_ticket(ticket_id, status=5)
+    elif ticket_id > 0 and not payload.get('created'):
+        n._update_ticket_requester(ticket_id, payload['owner'])
+        n._update_ticket(
+            ticket_id, payload['text'], cc_emails=payload['cc_emails']
+        )
+    else:
+        if ticket_id <= 0:
+            ticket_id = n._create_ticket(
+                email=payload['owner'],
+                cc_emails=payload['cc_emails'],
+                description=payload['text'],
+                tags=payload['tags'],
+            )
+            payload.update(ticket_id=ticket_id, created=True)
+            box.save(message)
+        # Expiry finishing resets the resource's ticket ID, don't point it
+        # back at a ticket that is about to be closed
+        if not any(
+            later['action'] == 'finish' for later in box.queued_after(message)
+        ):
+            n._set_ticket_id(ticket_id)
+        if payload['details'] is not None:
+            n._add_note_to_ticket(ticket_id, payload['details'])
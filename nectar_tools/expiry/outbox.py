@@ -0,0 +1,340 @@
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from nectar_tools import config
+
+
+CONF = config.CONFIG
+LOG = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+WORKERS = 4
+MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubled for each one after that
+RETRY_DELAY = 30
+# Seconds to wait for the outbox to empty at the end of a run
+DRAIN_TIMEOUT = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    resource_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS messages_status
+    ON messages (status, resource_key, id);
+"""
+
+Message = collections.namedtuple(
+    'Message', ['id', 'resource_key', 'payload', 'attempts', 'created_at']
+)
+
+
+class Outbox:
+    """Notifications waiting to be sent, kept in a local SQLite file
+
+    A message is committed before enqueue returns, so one the process
+    didn't get to send is sent by the next run.  The messages of a
+    resource are handed out one at a time, in the order they were queued.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._in_flight = set()
+        self.opened_at = clock()
+
+    def enqueue(self, resource_key, payload):
+        with self._changed, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO messages (resource_key, payload, status, '
+                'created_at) VALUES (?, ?, ?, ?)',
+                (
+                    resource_key,
+                    json.dumps(payload),
+                    PENDING,
+                    self.clock(),
+                ),
+            )
+            self._changed.notify()
+        return cursor.lastrowid
+
+    def claim(self):
+        """Take the next message that is due, or None if there isn't one"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, resource_key, payload, attempts, created_at '
+                'FROM messages '
+                'WHERE id IN (SELECT MIN(id) FROM messages WHERE status = ? '
+                'GROUP BY resource_key) AND next_attempt <= ? ORDER BY id',
+                (PENDING, self.clock()),
+            ).fetchall()
+            for row in rows:
+                message = Message(*row)
+                if message.resource_key not in self._in_flight:
+                    self._in_flight.add(message.resource_key)
+                    return message._replace(
+                        payload=json.loads(message.payload)
+                    )
+        return None
+
+    def _update(self, message, **values):
+        columns = ', '.join(f'{column} = ?' for column in values)
+        with self._conn:
+            self._conn.execute(
+                f'UPDATE messages SET {columns} WHERE id = ?',
+                tuple(values.values()) + (message.id,),
+            )
+
+    def _release(self, message, **values):
+        with self._changed:
+            self._update(message, **values)
+            self._in_flight.discard(message.resource_key)
+            self._changed.notify_all()
+
+    def save(self, message):
+        """Record progress a retry should carry on from"""
+        with self._lock:
+            self._update(message, payload=json.dumps(message.payload))
+
+    def sent(self, message):
+        self._release(message, status=SENT, error=None, sent_at=self.clock())
+
+    def retry(self, message, error, delay):
+        self._release(
+            message,
+            attempts=message.attempts + 1,
+            next_attempt=self.clock() + delay,
+            error=error,
+        )
+
+    def failed(self, message, error):
+        self._release(
+            message, status=FAILED, attempts=message.attempts + 1, error=error
+        )
+
+    def sent_since(self, message):
+        """Payloads of its resource's messages sent since it was queued
+
+        Or since the outbox was opened if that was earlier, as the resource
+        message was made from may have been read before then.  These are
+        what message couldn't know about, e.g. a ticket created for an
+        earlier message.  Newest first.
+        """
+        with self._lock:
+            return [
+                json.loads(row[0])
+                for row in self._conn.execute(
+                    'SELECT payload FROM messages WHERE resource_key = ? '
+                    'AND status = ? AND sent_at >= ? ORDER BY id DESC',
+                    (
+                        message.resource_key,
+                        SENT,
+                        min(message.created_at, self.opened_at),
+                    ),
+                )
+            ]
+
+    def queued_after(self, message):
+        """Payloads of its resource's messages waiting to be sent after it"""
+        with self._lock:
+            return [
+                json.loads(row[0])
+                for row in self._conn.execute(
+                    'SELECT payload FROM messages WHERE resource_key = ? '
+                    'AND status = ? AND id > ? ORDER BY id',
+                    (message.resource_key, PENDING, message.id),
+                )
+            ]
+
+    def _pending(self):
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM messages WHERE status = ?', (PENDING,)
+        ).fetchone()[0]
+
+    def pending(self):
+        with self._lock:
+            return self._pending()
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds for every message to be done
+
+        Returns how many are still pending.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: not self._pending(), timeout)
+            return self._pending()
+
+    def wait(self, timeout, stopping=None):
+        """Wait up to timeout seconds for a message to be queued or done
+
+        :param stopping: Event to return straight away on once it is set,
+            see wake()
+        """
+        with self._changed:
+            if stopping is None or not stopping.is_set():
+                self._changed.wait(timeout)
+
+    def wake(self):
+        """Wake everyone waiting on the outbox"""
+        with self._changed:
+            self._changed.notify_all()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class OutboxSender:
+    """Sends the messages in an outbox on worker threads
+
+    :param deliver: Called with the outbox and a Message to send it.  A
+        message it raises an exception for is retried, with an increasing
+        delay, until max_attempts have failed.
+    """
+
+    def __init__(
+        self,
+        outbox,
+        deliver,
+        workers=WORKERS,
+        max_attempts=MAX_ATTEMPTS,
+        retry_delay=RETRY_DELAY,
+    ):
+        self.outbox = outbox
+        self.deliver = deliver
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f'outbox-{i}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            message = self.outbox.claim()
+            if message is None:
+                self.outbox.wait(1, self._stopping)
+            else:
+                self.send(message)
+
+    def send(self, message):
+        try:
+            self.deliver(self.outbox, message)
+        except Exception as e:
+            attempts = message.attempts + 1
+            if attempts >= self.max_attempts:
+                LOG.exception(
+                    "%s: Giving up on notification %s after %d attempts",
+                    message.resource_key,
+                    message.id,
+                    attempts,
+                )
+                self.outbox.failed(message, str(e))
+            else:
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                LOG.warning(
+                    "%s: Notification %s failed, retrying in %ss: %s",
+                    message.resource_key,
+                    message.id,
+                    delay,
+                    e,
+                )
+                self.outbox.retry(message, str(e), delay)
+        else:
+            self.outbox.sent(message)
+
+    def stop(self, timeout=DRAIN_TIMEOUT):
+        """Wait up to timeout seconds for the outbox to empty, then stop"""
+        self.outbox.drain(timeout)
+        self._stopping.set()
+        self.outbox.wake()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        pending = self.outbox.pending()
+        if pending:
+            LOG.warning(
+                "%d notifications left in %s for the next run",
+                pending,
+                self.outbox.path,
+            )
+
+
+_outbox = None
+
+
+def get_outbox():
+    """Return the process-wide outbox, or None if messages are sent inline"""
+    return _outbox
+
+
+@contextlib.contextmanager
+def running(deliver, session=None, path=None, dry_run=False):
+    """Queue notifications in the outbox while the block runs
+
+    Messages are sent in the background as they are queued, and the
+    outbox is drained before returning.  Without a path, from the [outbox]
+    config section if not given, or in a dry run, notifications are sent
+    inline as before.
+
+    :param deliver: Sends a message, called with the outbox, the message
+        and the session
+    """
+    global _outbox
+    settings = CONF.get('outbox', {})
+    path = path or settings.get('path')
+    if dry_run or not path:
+        yield None
+        return
+    box = Outbox(path)
+    sender = OutboxSender(
+        box,
+        functools.partial(deliver, session=session),
+        workers=int(settings.get('workers', WORKERS)),
+    )
+    pending = box.pending()
+    if pending:
+        LOG.info("Sending %d notifications left by an earlier run", pending)
+    sender.start()
+    _outbox = box
+    try:
+        yield box
+    finally:
+        _outbox = None
+        sender.stop(
+            timeout=float(settings.get('drain_timeout', DRAIN_TIMEOUT))
+        )
+        box.close()
@@ -0,0 +1,79 @@
+"""Cheap checks on project metadata made before building an expirer
+
+Each check only returns False when the expirer would certainly take no
+action today. Anything it can't rule out from the project's properties
+(and a prefetched allocation) is left to the expirer.
+"""
+
+import datetime
+
+from nectarallocationclient import states as allocation_states
+
+from nectar_tools.expiry import expiry_states
+
+
+DATE_FORMAT = '%Y-%m-%d'
+
+# States whose next step only happens once the next step date is reached
+WAIT_FOR_NEXT_STEP = [
+    expiry_states.WARNING,
+    expiry_states.RESTRICTED,
+    expiry_states.STOPPED,
+]
+
+
+def get_notice_period_days(start_date, end_date):
+    """The shorter of 30 days and the last 20% of the allocation"""
+    start = datetime.datetime.strptime(start_date, DATE_FORMAT)
+    end = datetime.datetime.strptime(end_date, DATE_FORMAT)
+    allocation_days = (end - start).days
+    return min(30, int(allocation_days - (allocation_days * 0.8)))
+
+
+def at_next_step(project, now, next_step_key='expiry_next_step'):
+    next_step = getattr(project, next_step_key, None)
+    if not next_step:
+        return True
+    try:
+        return datetime.datetime.strptime(next_step, DATE_FORMAT) <= now
+    except ValueError:
+        return True
+
+
+def project_may_need_action(
+    project,
+    now,
+    status_key='expiry_status',
+    next_step_key='expiry_next_step',
+):
+    status = getattr(project, status_key, None) or expiry_states.ACTIVE
+    if status == expiry_states.DELETED:
+        return False
+    if status in WAIT_FOR_NEXT_STEP:
+        return at_next_step(project, now, next_step_key)
+    return True
+
+
+def allocation_may_need_action(project, allocation, now):
+    """Whether an allocation expirer could act on the project today
+
+    :param allocation: The project's current allocation, or None when it
+        wasn't prefetched
+    """
+    status = getattr(project, 'expiry_status', None) or expiry_states.ACTIVE
+    if not project.enabled and status != expiry_states.DELETING:
+        return False
+    if status not in [expiry_states.ACTIVE, expiry_states.WARNING]:
+        return project_may_need_action(project, now)
+    if allocation is None or allocation.status != allocation_states.APPROVED:
+        return True
+    # Usage against a service unit budget can move the project on at any time
+    if allocation.get_allocated_cloudkitty_quota().get('budget'):
+        return True
+    if status == expiry_states.WARNING:
+        return at_next_step(project, now)
+    notice_days = get_notice_period_days(
+        allocation.start_date, allocation.end_date
+    )
+    end = datetime.datetime.strptime(allocation.end_date, DATE_FORMAT)
+    return end - datetime.timedelta(days=notice_days) < now
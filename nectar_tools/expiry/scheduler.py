@@ -0,0 +1,251 @@
+import datetime
+import heapq
+import itertools
+import logging
+import time
+
+from nectar_tools.expiry import expirer
+from nectar_tools.expiry import expiry_states
+from nectar_tools import utils
+
+
+LOG = logging.getLogger(__name__)
+
+# States that are left for the periodic full pass. Active projects move on
+# because of their allocation, usage or account, not a next step date.
+UNSCHEDULED_STATES = [
+    '',
+    None,
+    expiry_states.ACTIVE,
+    expiry_states.DELETED,
+    expiry_states.ADMIN,
+]
+
+# States that are handled as soon as they are seen
+IMMEDIATE_STATES = [expiry_states.RENEWED, expiry_states.DELETING]
+
+
+def get_due_date(
+    project,
+    now,
+    status_key='expiry_status',
+    next_step_key='expiry_next_step',
+):
+    """Return when a project's next expiry step is due
+
+    Returns None for projects only the full pass needs to look at.
+    """
+    status = getattr(project, status_key, None)
+    if status in UNSCHEDULED_STATES:
+        return None
+    if status in IMMEDIATE_STATES:
+        return now
+    next_step = getattr(project, next_step_key, None)
+    if not next_step:
+        return now
+    try:
+        return datetime.datetime.strptime(next_step, expirer.DATE_FORMAT)
+    except ValueError:
+        return now
+
+
+class DueQueue:
+    """Min-heap of projects ordered by the date their next step is due
+
+    Entries are replaced rather than removed, superseded ones are skipped
+    when they reach the top of the heap.
+    """
+
+    def __init__(
+        self,
+        status_key='expiry_status',
+        next_step_key='expiry_next_step',
+        updated_at_key='expiry_updated_at',
+    ):
+        self.status_key = status_key
+        self.next_step_key = next_step_key
+        self.updated_at_key = updated_at_key
+        self._heap = []
+        self._entries = {}
+        self._projects = {}
+        self._updated_at = {}
+        self._not_before = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _push(self, project_id, due):
+        not_before = self._not_before.get(project_id)
+        if not_before is not None and due < not_before:
+            due = not_before
+        entry = [due, next(self._counter), project_id, True]
+        old = self._entries.get(project_id)
+        if old is not None:
+            old[-1] = False
+        self._entries[project_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _remove(self, project_id):
+        old = self._entries.pop(project_id, None)
+        if old is not None:
+            old[-1] = False
+
+    def update(self, project, now):
+        """(Re)schedule a project from its expiry properties"""
+        self._projects[project.id] = project
+        self._updated_at[project.id] = getattr(
+            project, self.updated_at_key, None
+        )
+        due = get_due_date(project, now, self.status_key, self.next_step_key)
+        if due is None:
+            self._remove(project.id)
+        else:
+            self._push(project.id, due)
+
+    def rebuild(self, projects, now):
+        """Schedule exactly these projects"""
+        self._heap = []
+        self._entries = {}
+        self._projects = {}
+        self._updated_at = {}
+        for project in projects:
+            self.update(project, now)
+
+    def refresh(self, projects, now):
+        """Reschedule the projects whose expiry_updated_at has changed
+
+        Projects missing from the listing are dropped. Returns the number
+        of projects rescheduled.
+        """
+        changed = 0
+        seen = set()
+        for project in projects:
+            seen.add(project.id)
+            updated_at = getattr(project, self.updated_at_key, None)
+            if (
+                project.id not in self._projects
+                or updated_at != self._updated_at.get(project.id)
+            ):
+                self.update(project, now)
+                changed += 1
+        for project_id in set(self._projects) - seen:
+            self._remove(project_id)
+            del self._projects[project_id]
+            self._updated_at.pop(project_id, None)
+            self._not_before.pop(project_id, None)
+        return changed
+
+    def defer(self, project_id, until):
+        """Don't offer a project again before until
+
+        Stops a project whose step didn't change its next step date from
+        being handled on every wake up. Takes effect the next time the
+        project is scheduled.
+        """
+        self._not_before[project_id] = until
+
+    def next_due(self):
+        while self._heap and not self._heap[0][-1]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
+    def pop_due(self, now):
+        """Remove and return the projects due by now, earliest first"""
+        due = []
+        while True:
+            next_due = self.next_due()
+            if next_due is None or next_due > now:
+                return due
+            entry = heapq.heappop(self._heap)
+            del self._entries[entry[2]]
+            due.append(self._projects[entry[2]])
+
+
+class Scheduler:
+    """Run an expiry command only for the projects that are due
+
+    Every poll interval the project listing is refreshed, projects whose
+    expiry properties have changed are rescheduled and the ones that are
+    due are processed. Every reconcile interval all projects are processed,
+    as a normal run would, and the schedule is rebuilt from scratch.  The
+    cloud-wide listings made for a full pass are reused by the due batches
+    until the next one.
+    """
+
+    def __init__(self, cmd, poll_interval, reconcile_interval):
+        self.cmd = cmd
+        self.poll_interval = poll_interval
+        self.reconcile_interval = reconcile_interval
+        self.queue = DueQueue(
+            cmd.STATUS_KEY, cmd.NEXT_STEP_KEY, cmd.UPDATED_AT_KEY
+        )
+        self.last_reconcile = None
+
+    def _valid_projects(self, projects):
+        return [
+            p
+            for p in projects
+            if self.cmd.valid_project(p)
+            and utils.in_shard(p.id, self.cmd.args.shard)
+        ]
+
+    def _process(self, projects, now, full=False):
+        self.cmd.projects = projects
+        if full:
+            self.cmd.setup_run()
+        else:
+            # Keep the cloud-wide listings of the last full pass, a new
+            # one per batch would be the work this mode exists to avoid
+            self.cmd.start_journal()
+        self.cmd.process_projects()
+        retry = now + self.poll_interval
+        for project in projects:
+            self.queue.defer(project.id, retry)
+
+    def reconcile(self, now):
+        LOG.info("Processing all projects")
+        projects = self.cmd.list_projects()
+        self._process(projects, now, full=True)
+        self.queue.rebuild(self._valid_projects(projects), now)
+        self.last_reconcile = now
+        LOG.info(
+            "%d projects scheduled, next due %s",
+            len(self.queue),
+            self.queue.next_due(),
+        )
+
+    def refresh(self, now):
+        projects = self._valid_projects(self.cmd.list_projects())
+        changed = self.queue.refresh(projects, now)
+        LOG.debug("%d of %d projects rescheduled", changed, len(projects))
+
+    def process_due(self, now):
+        due = self.queue.pop_due(now)
+        if not due:
+            LOG.debug("No projects due, next at %s", self.queue.next_due())
+            return 0
+        LOG.info("Processing %d projects that are due", len(due))
+        self._process(due, now)
+        # The expirers update the projects' status and next step in place
+        for project in due:
+            self.queue.update(project, now)
+        return len(due)
+
+    def run_once(self, now=None):
+        now = now or datetime.datetime.now()
+        if (
+            self.last_reconcile is None
+            or now - self.last_reconcile >= self.reconcile_interval
+        ):
+            self.reconcile(now)
+        else:
+            self.refresh(now)
+            self.process_due(now)
+
+    def run(self):
+        while True:
+            self.run_once()
+            time.sleep(self.poll_interval.total_seconds())
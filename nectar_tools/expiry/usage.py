@@ -0,0 +1,127 @@
+import collections
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+
+
+LOG = logging.getLogger(__name__)
+
+# Usage is counted from before the first instance was booted
+EPOCH = datetime.datetime(2011, 1, 1)
+
+# Instances per page of the all tenants usage listing
+PAGE_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    end_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tenant_usage (
+    tenant_id TEXT PRIMARY KEY,
+    vcpu_hours REAL NOT NULL
+);
+"""
+
+
+def list_vcpu_hours(n_client, start, end, page_size=PAGE_SIZE):
+    """Total VCPU hours of each tenant between start and end
+
+    A tenant's usage can be split over pages, so the pages are added up.
+    """
+    totals = collections.defaultdict(float)
+    marker = None
+    while True:
+        page = n_client.usage.list(
+            start, end, detailed=True, marker=marker, limit=page_size
+        )
+        marker = None
+        for usage in page:
+            hours = getattr(usage, 'total_vcpus_usage', None)
+            if hours is not None:
+                totals[usage.tenant_id] += hours
+            servers = getattr(usage, 'server_usages', None)
+            if servers:
+                marker = servers[-1]['instance_id']
+        if marker is None:
+            return dict(totals)
+
+
+class UsageIndex:
+    """Total VCPU hours used by every project since EPOCH
+
+    Loaded on first use from one paginated all tenants usage listing,
+    replacing a usage query per project.  With a cache_path the totals are
+    kept in a local SQLite file along with when they were counted up to,
+    so later runs only list the usage since then.  Safe to share between
+    threads.
+    """
+
+    def __init__(self, n_client, cache_path=None):
+        self.n_client = n_client
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._usage = None
+
+    def _connect(self):
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.cache_path)
+        with conn:
+            conn.executescript(SCHEMA)
+        return conn
+
+    def _read_cache(self, conn):
+        row = conn.execute('SELECT end_at FROM snapshot').fetchone()
+        if row is None:
+            return {}, EPOCH
+        usage = dict(
+            conn.execute('SELECT tenant_id, vcpu_hours FROM tenant_usage')
+        )
+        return usage, datetime.datetime.fromisoformat(row[0])
+
+    def _write_cache(self, conn, usage, end):
+        with conn:
+            conn.execute('DELETE FROM tenant_usage')
+            conn.executemany(
+                'INSERT INTO tenant_usage (tenant_id, vcpu_hours) '
+                'VALUES (?, ?)',
+                usage.items(),
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO snapshot (id, end_at) VALUES (1, ?)',
+                (end.isoformat(),),
+            )
+
+    def _load(self):
+        if self._usage is not None:
+            return
+        # Nova takes naive times as UTC
+        end = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        conn = None
+        usage, start = {}, EPOCH
+        if self.cache_path:
+            conn = self._connect()
+            usage, start = self._read_cache(conn)
+        try:
+            LOG.debug("Loading usage of all projects since %s", start)
+            for tenant_id, hours in list_vcpu_hours(
+                self.n_client, start, end
+            ).items():
+                usage[tenant_id] = usage.get(tenant_id, 0) + hours
+            if conn is not None:
+                self._write_cache(conn, usage, end)
+        finally:
+            if conn is not None:
+                conn.close()
+        LOG.debug("Indexed usage of %d projects", len(usage))
+        self._usage = usage
+
+    def get_vcpu_hours(self, project_id):
+        """Total VCPU hours of a project, or None if it has no usage"""
+        with self._lock:
+            self._load()
+            return self._usage.get(project_id)
@@ -1,3 +1,4 @@
+import contextvars
 import logging.config
 from os import path
 
@@ -93,3 +94,72 @@ def setup(
             'propagate': False,
         }
     logging.config.dictConfig(config)
+
+
+class _BufferFilter(logging.Filter):
+    def __init__(self, handler, records):
+        super().__init__()
+        self.handler = handler
+        self.records = records
+
+    def filter(self, record):
+        records = self.records.get()
+        if records is None:
+            return True
+        # Format now, the args may change before the record is flushed
+        record.msg = record.getMessage()
+        record.args = None
+        records.append((self.handler, record))
+        return False
+
+
+class OrderedLogBuffer:
+    """Hold back log records made by worker threads
+
+    Records logged inside ``capture()`` are kept aside rather than written
+    out, and are only emitted by ``flush()``.  This lets the caller write
+    the output of concurrently processed items in a stable order.  Threads
+    started with a copy of the capturing thread's context (see
+    ``contextvars.copy_context``) log into the same buffer.
+    """
+
+    def __init__(self):
+        self._records = contextvars.ContextVar(
+            f'log_records_{id(self)}', default=None
+        )
+        self._filters = []
+
+    def __enter__(self):
+        loggers = [logging.getLogger()] + [
+            logger
+            for logger in logging.Logger.manager.loggerDict.values()
+            if isinstance(logger, logging.Logger)
+        ]
+        handlers = {h for logger in loggers for h in logger.handlers}
+        for handler in handlers:
+            buffer_filter = _BufferFilter(handler, self._records)
+            handler.addFilter(buffer_filter)
+            self._filters.append(buffer_filter)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for buffer_filter in self._filters:
+            buffer_filter.handler.removeFilter(buffer_filter)
+        self._filters = []
+        return False
+
+    def capture(self, func, *args, **kwargs):
+        """Call func, returning its result and the records it logged"""
+        records = []
+        token = self._records.set(records)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            self._records.reset(token)
+        return result, records
+
+    @staticmethod
+    def flush(records):
+        for handler, record in records:
+            if record.levelno >= handler.level:
+                handler.handle(record)
@@ -1,7 +1,7 @@
-from freshdesk.v2 import api as fd_api
 import jinja2
 import logging
 import os
+import threading
 
 from nectar_tools import auth
 from nectar_tools import config
@@ -11,6 +11,48 @@ from nectar_tools import exceptions
 CONF = config.CONFIG
 LOG = logging.getLogger(__name__)
 
+TEMPLATE_ROOT = os.path.join(os.path.dirname(__file__), 'templates')
+
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def get_template_environment(template_dir):
+    """Shared jinja2 environment for a directory under templates
+
+    Templates are compiled once per process and kept by the environment.
+    With bytecode_cache_dir set in the [templates] config section, the
+    compiled templates are also kept on disk for later runs.
+    """
+    path = os.path.realpath(os.path.join(TEMPLATE_ROOT, template_dir))
+    with _environments_lock:
+        env = _environments.get(path)
+        if env is None:
+            bytecode_cache = None
+            cache_dir = CONF.get('templates', {}).get('bytecode_cache_dir')
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+            # Templates don't change during a run, so don't check them
+            # for changes on every render
+            env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(path),
+                bytecode_cache=bytecode_cache,
+                auto_reload=False,
+            )
+            _environments[path] = env
+        return env
+
+
+def precompile_templates(template_dir):
+    """Compile every template in a directory ahead of rendering any"""
+    env = get_template_environment(template_dir)
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    LOG.debug("Compiled %d templates in %s", len(names), template_dir)
+    return len(names)
+
 
 class Notifier:
     def __init__(
@@ -35,17 +77,14 @@ class Notifier:
         return
 
     def render_template(self, tmpl, extra_context={}):
-        template_dir = os.path.realpath(
-            os.path.join(
-                os.path.dirname(__file__), 'templates', self.template_dir
-            )
-        )
-        env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir))
+        env = get_template_environment(self.template_dir)
         try:
             template = env.get_template(tmpl)
         except jinja2.TemplateNotFound:
             LOG.debug(
-                'Template "%s" not found. Looked in %s', tmpl, template_dir
+                'Template "%s" not found. Looked in %s',
+                tmpl,
+                env.loader.searchpath[0],
             )
             raise exceptions.TemplateNotFound()
         context = {self.resource_type: self.resource}
@@ -68,7 +107,11 @@ class FreshDeskNotifier(Notifier):
             resource_type, resource, template_dir, subject, dry_run
         )
 
-        self.api = fd_api.API(CONF.freshdesk.domain, CONF.freshdesk.key)
+        self.api = auth.get_freshdesk_client(
+            CONF.freshdesk.domain,
+            CONF.freshdesk.key,
+            rate_limit=CONF.freshdesk.get('rate_limit'),
+        )
         self.group_id = int(group_id)
 
     def _create_ticket(
@@ -8,12 +8,11 @@ from nectarclient_lib import exceptions as nc_exc
 import neutronclient
 import novaclient
 from openstack.load_balancer.v2 import quota as lb_quota
-from oslo_context import context
-import oslo_messaging
 import prettytable
 
 from nectar_tools import auth
 from nectar_tools import config
+from nectar_tools import events
 from nectar_tools import exceptions
 from nectar_tools.expiry import archiver
 from nectar_tools.expiry import expirer
@@ -23,8 +22,6 @@ from nectar_tools import utils
 
 CONF = config.CONFIG
 LOG = logging.getLogger(__name__)
-OSLO_CONF = config.OSLO_CONF
-OSLO_CONTEXT = context.RequestContext()
 
 
 class ProvisioningManager:
@@ -44,20 +41,10 @@ class ProvisioningManager:
         self.ks_session = ks_session
         self.k_client = auth.get_keystone_client(ks_session)
         if not system_session:
-            system_session = auth.get_session(system_scope='all')
+            system_session = auth.get_default_session(system_scope='all')
         self.k_client_sys = auth.get_keystone_client(system_session)
         self.a_client = auth.get_allocation_client(ks_session)
 
-        transport = oslo_messaging.get_notification_transport(OSLO_CONF)
-        self.event_notifier = oslo_messaging.Notifier(transport, 'expiry')
-        target = oslo_messaging.Target(
-            exchange='openstack', topic='notifications'
-        )
-        for queue in CONF.events.notifier_queues.split(','):
-            transport._driver.listen_for_notifications(
-                [(target, 'audit')], queue, 1, 1
-            )
-
     def send_event(self, allocation, event, extra_context={}):
         event_type = f'provisioning.{event}'
         event_notification = {'allocation': allocation.to_dict()}
@@ -65,7 +52,7 @@ class ProvisioningManager:
         if self.noop:
             LOG.info('%s: Would send event %s', allocation.id, event_type)
             return
-        self.event_notifier.audit(OSLO_CONTEXT, event_type, event_notification)
+        events.send(event_type, event_notification)
 
     def provision(self, allocation):
         if allocation.provisioned:
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+
+import requests
+
+
+LOG = logging.getLogger(__name__)
+
+# Requests per minute until the server reports its limit
+DEFAULT_RATE_LIMIT = 100
+# Attempts at a request rejected with a 429 before returning it
+MAX_ATTEMPTS = 5
+# Seconds to back off after a 429 without a Retry-After header
+DEFAULT_RETRY_AFTER = 60
+
+
+class TokenBucket:
+    """Paces calls to rate per second, allowing bursts of up to capacity
+
+    Tokens are reserved ahead, so concurrent callers queue up behind each
+    other rather than all waking at once.  Safe to share between threads.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.not_before = self.updated
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token, returning the seconds to wait before using it"""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.tokens -= 1
+            wait = 0
+            if self.tokens < 0:
+                wait = -self.tokens / self.rate
+            return max(wait, self.not_before - now)
+
+    def update(self, remaining, total=None):
+        """Match what the server says is left of its per-minute limit"""
+        with self._lock:
+            self._refill(self.clock())
+            if total:
+                self.rate = total / 60
+                self.capacity = total
+            self.tokens = min(self.tokens, remaining)
+
+    def pause(self, seconds):
+        """Hold everyone off for seconds, e.g. after being rate limited"""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0)
+            self.not_before = max(self.not_before, now + seconds)
+
+
+def _header_int(response, name):
+    try:
+        return int(response.headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class RateLimitedSession(requests.Session):
+    """HTTP session that keeps within a per-minute API rate limit
+
+    Requests are paced by a token bucket, which follows the server's
+    X-RateLimit-Total and X-RateLimit-Remaining headers.  429 responses
+    are retried after their Retry-After time.  The time spent waiting is
+    counted, see stats().
+    """
+
+    def __init__(self, rate_limit=DEFAULT_RATE_LIMIT, sleep=time.sleep):
+        super().__init__()
+        self.bucket = TokenBucket(rate_limit / 60, rate_limit)
+        self.sleep = sleep
+        self._stats_lock = threading.Lock()
+        self.throttled_seconds = 0.0
+        self.throttled_requests = 0
+        self.rate_limited = 0
+
+    def _wait(self, seconds):
+        if seconds <= 0:
+            return
+        with self._stats_lock:
+            self.throttled_seconds += seconds
+            self.throttled_requests += 1
+        LOG.debug("Waiting %.1fs to keep within the rate limit", seconds)
+        self.sleep(seconds)
+
+    def _update_limits(self, response):
+        remaining = _header_int(response, 'X-RateLimit-Remaining')
+        if remaining is not None:
+            total = _header_int(response, 'X-RateLimit-Total')
+            self.bucket.update(remaining, total)
+
+    def request(self, method, url, *args, **kwargs):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self._wait(self.bucket.reserve())
+            response = super().request(method, url, *args, **kwargs)
+            self._update_limits(response)
+            if response.status_code != 429 or attempt == MAX_ATTEMPTS:
+                return response
+            retry_after = _header_int(response, 'Retry-After')
+            if retry_after is None:
+                retry_after = DEFAULT_RETRY_AFTER
+            with self._stats_lock:
+                self.rate_limited += 1
+            LOG.info("Rate limited by %s, retrying in %ss", url, retry_after)
+            self.bucket.pause(retry_after)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'throttled_seconds': self.throttled_seconds,
+                'throttled_requests': self.throttled_requests,
+                'rate_limited': self.rate_limited,
+            }
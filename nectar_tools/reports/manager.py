@@ -6,6 +6,7 @@ from nectar_tools.common import service_units
 from nectar_tools import exceptions
 from nectar_tools.expiry import expiry_states
 from nectar_tools.reports import notifier
+from nectar_tools import utils
 
 
 DATE_FORMAT = '%Y-%m-%d'
@@ -21,10 +22,14 @@ class SUReporter:
         self.ks_session = ks_session
         self.a_client = auth.get_allocation_client(self.ks_session)
         self.k_client = auth.get_keystone_client(self.ks_session)
+        self.user_index = None
 
     def send_over_budget_report(self, allocation):
         n = notifier.AllocationNotifier(
-            allocation=allocation, ks_session=self.ks_session, noop=self.noop
+            allocation=allocation,
+            ks_session=self.ks_session,
+            noop=self.noop,
+            user_index=self.user_index,
         )
         n.send_over_budget()
 
@@ -32,6 +37,7 @@ class SUReporter:
         allocations = self.a_client.allocations.list(
             status='A', parent_request__isnull=True
         )
+        self.user_index = utils.ProjectUserIndex(self.k_client)
 
         if skip_to:
             LOG.info(f"Skipping to allocation {skip_to}")
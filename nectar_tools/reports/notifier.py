@@ -9,12 +9,15 @@ CONF = config.CONFIG
 
 
 class AllocationNotifier(notifier.TaynacNotifier):
-    def __init__(self, allocation, ks_session=None, noop=False):
+    def __init__(
+        self, allocation, ks_session=None, noop=False, user_index=None
+    ):
         subject = f'Nectar Service Unit Report: {allocation.project_name}'
         template_dir = 'reports'
         self.ks_session = ks_session
         self.k_client = auth.get_keystone_client(ks_session)
         self.allocation = allocation
+        self.user_index = user_index
         super().__init__(
             ks_session, 'allocation', allocation, template_dir, subject, noop
         )
@@ -27,7 +30,7 @@ class AllocationNotifier(notifier.TaynacNotifier):
             'su_expected': f'{su_info.expected:.2f}',
         }
         email, cc_emails = utils.get_allocation_recipients(
-            self.k_client, self.allocation
+            self.k_client, self.allocation, index=self.user_index
         )
         self.send_message(
             stage="over-budget",
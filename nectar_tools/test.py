@@ -2,7 +2,9 @@ import contextlib
 import os
 import testtools
 
+from nectar_tools import auth
 from nectar_tools import config
+from nectar_tools import events
 
 filename = os.path.realpath(
     os.path.join(os.path.dirname(__file__), 'tests/nectar-tools.conf')
@@ -23,3 +25,6 @@ def nested(*contexts):
 class TestCase(testtools.TestCase):
     def setUp(self):
         super().setUp()
+        # Don't let cached clients leak between tests
+        auth.CLIENTS.clear()
+        events.reset()
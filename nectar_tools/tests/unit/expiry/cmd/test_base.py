@@ -0,0 +1,164 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from nectar_tools import exceptions
+from nectar_tools.expiry.cmd import allocation_expirer
+from nectar_tools.expiry import journal
+from nectar_tools import test
+from nectar_tools.tests import fakes
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class ProjectExpiryBaseCmdTests(test.TestCase):
+    def _make_cmd(self, projects, limit=0, offset=None, workers=1, shard=None):
+        cmd = allocation_expirer.AllocationExpiryCmd.__new__(
+            allocation_expirer.AllocationExpiryCmd
+        )
+        cmd.args = mock.Mock(
+            limit=limit, offset=offset, workers=workers, shard=shard
+        )
+        cmd.projects = projects
+        cmd.journal = None
+        return cmd
+
+    def _projects(self, count):
+        return [
+            fakes.FakeProject(id=str(i), name=f'proj-{i}')
+            for i in range(count)
+        ]
+
+    def _process_ids(self, cmd, results=None):
+        """Run process_projects and return the IDs of projects handled"""
+        lock = threading.Lock()
+        handled = []
+
+        def get_expirer(project):
+            with lock:
+                handled.append(project.id)
+            ex = mock.Mock()
+            if results and project.id in results:
+                result = results[project.id]
+                if isinstance(result, type):
+                    ex.process.side_effect = result
+                else:
+                    ex.process.return_value = result
+            else:
+                ex.process.return_value = True
+            return ex
+
+        with mock.patch.object(cmd, 'get_expirer', side_effect=get_expirer):
+            processed = cmd.process_projects()
+        return processed, handled
+
+    def test_process_projects(self):
+        projects = self._projects(5) + [fakes.FakeProject(name='pt-1')]
+        cmd = self._make_cmd(projects)
+        processed, handled = self._process_ids(cmd)
+        self.assertEqual(5, processed)
+        self.assertEqual(['0', '1', '2', '3', '4'], handled)
+
+    def test_process_projects_limit_offset(self):
+        cmd = self._make_cmd(self._projects(10), limit=3, offset=2)
+        processed, handled = self._process_ids(cmd, results={'3': False})
+        self.assertEqual(3, processed)
+        self.assertEqual(['2', '3', '4', '5'], handled)
+
+    def test_process_projects_prefilter(self):
+        cmd = self._make_cmd(self._projects(6), offset=1)
+        cmd.args.force_delete = False
+        with mock.patch.object(
+            cmd,
+            'may_need_action',
+            side_effect=lambda p: p.id in ('2', '4'),
+        ):
+            processed, handled = self._process_ids(cmd)
+        self.assertEqual(2, processed)
+        self.assertEqual(['2', '4'], handled)
+        self.assertEqual(3, cmd.prefiltered)
+
+    def test_process_projects_shard(self):
+        projects = self._projects(30)
+        handled = []
+        for index in range(3):
+            cmd = self._make_cmd(projects, shard=(index, 3))
+            processed, shard_handled = self._process_ids(cmd)
+            self.assertEqual(len(shard_handled), processed)
+            self.assertTrue(shard_handled)
+            handled.extend(shard_handled)
+        self.assertEqual(sorted(p.id for p in projects), sorted(handled))
+
+    def test_process_projects_journal_resume(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'journal.sqlite')
+
+        cmd = self._make_cmd(self._projects(5))
+        cmd.journal = journal.RunJournal(path)
+        self.addCleanup(cmd.journal.close)
+        results = {'1': False, '2': ValueError, '3': exceptions.InvalidProject}
+        processed, handled = self._process_ids(cmd, results=results)
+        self.assertEqual(2, processed)
+        self.assertEqual(
+            {'processed': 2, 'skipped': 2, 'error': 1}, cmd.journal.summary()
+        )
+
+        # Only the project that failed is tried again
+        run_id = cmd.journal.run_id
+        cmd = self._make_cmd(self._projects(5))
+        cmd.journal = journal.RunJournal(path, run_id=run_id)
+        self.addCleanup(cmd.journal.close)
+        processed, handled = self._process_ids(cmd)
+        self.assertEqual(1, processed)
+        self.assertEqual(['2'], handled)
+
+    def test_process_projects_workers(self):
+        cmd = self._make_cmd(self._projects(20), workers=4)
+        processed, handled = self._process_ids(cmd)
+        self.assertEqual(20, processed)
+        self.assertEqual(sorted(p.id for p in cmd.projects), sorted(handled))
+
+    def test_process_projects_workers_limit_exact(self):
+        cmd = self._make_cmd(self._projects(50), limit=7, offset=5, workers=4)
+        results = {
+            '6': False,
+            '8': exceptions.InvalidProject,
+            '9': ValueError,
+        }
+        processed, handled = self._process_ids(cmd, results=results)
+        self.assertEqual(7, processed)
+        # 7 processed plus the three that didn't count
+        self.assertEqual(10, len(handled))
+        self.assertNotIn('4', handled)
+
+    def test_process_projects_workers_log_order(self):
+        cmd = self._make_cmd(self._projects(8), workers=4)
+        logger = logging.getLogger('nectar_tools.test_log_order')
+        handler = ListHandler()
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        self.addCleanup(logger.removeHandler, handler)
+
+        def get_expirer(project):
+            def process():
+                # Make the early projects finish last
+                time.sleep(0.01 * (8 - int(project.id)))
+                logger.info('project %s', project.id)
+                return True
+
+            return mock.Mock(process=mock.Mock(side_effect=process))
+
+        with mock.patch.object(cmd, 'get_expirer', side_effect=get_expirer):
+            self.assertEqual(8, cmd.process_projects())
+        self.assertEqual([f'project {i}' for i in range(8)], handler.messages)
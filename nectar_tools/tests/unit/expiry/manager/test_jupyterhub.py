@@ -1,7 +1,11 @@
 import datetime
 from freezegun import freeze_time
+import os
+import tempfile
 from unittest import mock
 
+from kubernetes.client.rest import ApiException as kube_api_exc
+
 from nectar_tools import exceptions
 from nectar_tools import test
 
@@ -120,6 +124,24 @@ class JupyterHubVolumeExpiryTests(test.TestCase):
             actual = ex.get_last_active_date()
             self.assertEqual(expected, actual)
 
+    def test_get_last_active_date_map(self):
+        last_active = datetime.datetime(2024, 5, 1)
+        ex = expirer.JupyterHubVolumeExpirer(
+            self.pvc, last_activity={self.username: last_active}
+        )
+        with mock.patch.object(ex, '_jupyterhub_api') as mock_jhub_api:
+            self.assertEqual(last_active, ex.get_last_active_date())
+            mock_jhub_api.assert_not_called()
+
+    def test_get_last_active_date_map_miss(self):
+        ex = expirer.JupyterHubVolumeExpirer(self.pvc, last_activity={})
+        with mock.patch.object(ex, '_jupyterhub_api') as mock_jhub_api:
+            mock_jhub_api.return_value = fakes.JUPYTERHUB_USER
+            expected = datetime.datetime(2024, 6, 1)
+            self.assertEqual(expected, ex.get_last_active_date())
+            self.assertEqual(expected, ex.get_last_active_date())
+            mock_jhub_api.assert_called_once_with('/users/' + self.username)
+
     def test_get_warning_date(self):
         ex = expirer.JupyterHubVolumeExpirer(self.pvc)
         with mock.patch.object(ex, 'get_last_active_date') as mock_glad:
@@ -346,3 +368,189 @@ class JupyterHubVolumeExpiryTests(test.TestCase):
             mock_stop.assert_not_called()
             mock_finish.assert_not_called()
             mock_delete.assert_not_called()
+
+
+class JupyterHubApiTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(expirer, '_session', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_api_session(self):
+        session = expirer.get_api_session()
+        self.assertIs(session, expirer.get_api_session())
+        self.assertEqual('token t0k3n', session.headers['Authorization'])
+
+    @mock.patch('requests.Session.get')
+    def test_jupyterhub_api(self, mock_get):
+        self.assertEqual(
+            mock_get.return_value.json.return_value,
+            expirer.jupyterhub_api('users', params={'limit': 1}),
+        )
+        mock_get.assert_called_once_with(
+            'https://jupyterhub/hub/api/users',
+            params={'limit': 1},
+            headers=None,
+            timeout=expirer.API_TIMEOUT,
+        )
+        mock_get.return_value.raise_for_status.assert_called_once_with()
+
+    @mock.patch.object(expirer, 'jupyterhub_api')
+    def test_get_last_activity_map(self, mock_api):
+        mock_api.side_effect = [
+            {
+                'items': [
+                    fakes.JUPYTERHUB_USER,
+                    {'name': 'new@user.com', 'last_activity': None},
+                ],
+                '_pagination': {'next': {'offset': 2, 'limit': 2}},
+            },
+            {
+                'items': [
+                    {
+                        'name': 'other@user.com',
+                        'last_activity': '2024-02-03T04:05:06Z',
+                    }
+                ],
+                '_pagination': {'next': None},
+            },
+        ]
+        self.assertEqual(
+            {
+                'fake@user.com': datetime.datetime(2024, 6, 1),
+                'other@user.com': datetime.datetime(2024, 2, 3),
+            },
+            expirer.get_last_activity_map(page_size=2),
+        )
+        headers = {'Accept': expirer.PAGINATION_MEDIA_TYPE}
+        mock_api.assert_has_calls(
+            [
+                mock.call(
+                    'users', params={'offset': 0, 'limit': 2}, headers=headers
+                ),
+                mock.call(
+                    'users', params={'offset': 2, 'limit': 2}, headers=headers
+                ),
+            ]
+        )
+
+    @mock.patch.object(expirer, 'jupyterhub_api')
+    def test_get_last_activity_map_unpaginated(self, mock_api):
+        mock_api.return_value = [fakes.JUPYTERHUB_USER]
+        self.assertEqual(
+            {'fake@user.com': datetime.datetime(2024, 6, 1)},
+            expirer.get_last_activity_map(),
+        )
+        mock_api.assert_called_once()
+
+
+def _pvc(name, resource_version='1'):
+    return fakes.FakeK8sObject(
+        metadata=fakes.FakeK8sObject(
+            name=name, resource_version=resource_version
+        )
+    )
+
+
+def _page(pvcs, resource_version, _continue=None):
+    return fakes.FakeK8sObject(
+        items=pvcs,
+        metadata=fakes.FakeK8sObject(
+            resource_version=resource_version, _continue=_continue
+        ),
+    )
+
+
+class PVCSourceTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.state_path = os.path.join(tmp.name, 'state', 'pvcs')
+        self.kube_client = mock.Mock()
+        self.p1, self.p2, self.p3 = _pvc('p1'), _pvc('p2'), _pvc('p3')
+        kube = self.kube_client
+        self.list_pvcs = kube.list_namespaced_persistent_volume_claim
+        self.list_pvcs.side_effect = [
+            _page([self.p1, self.p2], '100', _continue='c1'),
+            _page([self.p3], '100'),
+        ]
+
+    def test_list(self):
+        source = expirer.PVCSource(self.kube_client, 'ns', page_size=2)
+        pvcs = iter(source)
+        self.assertEqual(self.p1, next(pvcs))
+        self.assertEqual(1, self.list_pvcs.call_count)
+        self.assertEqual([self.p2, self.p3], list(pvcs))
+        self.assertTrue(source.complete)
+        self.assertEqual('100', source.resource_version)
+        self.list_pvcs.assert_called_with(
+            'ns',
+            label_selector=expirer.PVC_LABEL_SELECTOR,
+            limit=2,
+            _continue='c1',
+        )
+
+    def test_save_state(self):
+        source = expirer.PVCSource(
+            self.kube_client, 'ns', state_path=self.state_path
+        )
+        for pvc in source:
+            # Not saved part way through
+            source.save_state()
+            self.assertFalse(os.path.exists(self.state_path))
+        source.save_state()
+        with open(self.state_path) as f:
+            self.assertEqual('100', f.read())
+
+    def _write_state(self, resource_version):
+        os.makedirs(os.path.dirname(self.state_path))
+        with open(self.state_path, 'w') as f:
+            f.write(resource_version)
+
+    @mock.patch('kubernetes.watch.Watch')
+    def test_watch(self, mock_watch):
+        self._write_state('100')
+        p1 = _pvc('p1', '101')
+        p1_again = _pvc('p1', '103')
+        mock_watch.return_value.stream.return_value = [
+            {'type': 'MODIFIED', 'object': p1},
+            {'type': 'ADDED', 'object': _pvc('p4', '102')},
+            {'type': 'MODIFIED', 'object': p1_again},
+            {'type': 'DELETED', 'object': _pvc('p4', '104')},
+            {'type': 'BOOKMARK', 'object': _pvc(None, '105')},
+        ]
+        source = expirer.PVCSource(
+            self.kube_client, 'ns', state_path=self.state_path
+        )
+        self.assertEqual([p1_again], list(source))
+        self.assertEqual('105', source.resource_version)
+        self.list_pvcs.assert_not_called()
+        mock_watch.return_value.stream.assert_called_once_with(
+            self.list_pvcs,
+            'ns',
+            label_selector=expirer.PVC_LABEL_SELECTOR,
+            resource_version='100',
+            allow_watch_bookmarks=True,
+            timeout_seconds=expirer.WATCH_TIMEOUT,
+        )
+
+    @mock.patch('kubernetes.watch.Watch')
+    def test_watch_expired(self, mock_watch):
+        self._write_state('1')
+        mock_watch.return_value.stream.side_effect = kube_api_exc(status=410)
+        source = expirer.PVCSource(
+            self.kube_client, 'ns', state_path=self.state_path
+        )
+        self.assertEqual([self.p1, self.p2, self.p3], list(source))
+        self.assertEqual('100', source.resource_version)
+
+    @mock.patch('kubernetes.watch.Watch')
+    def test_watch_error(self, mock_watch):
+        self._write_state('1')
+        mock_watch.return_value.stream.side_effect = kube_api_exc(status=500)
+        source = expirer.PVCSource(
+            self.kube_client, 'ns', state_path=self.state_path
+        )
+        self.assertRaises(kube_api_exc, list, source)
@@ -0,0 +1,69 @@
+import datetime
+import os
+import tempfile
+
+from nectar_tools.expiry import journal
+from nectar_tools import test
+
+
+NOW = datetime.datetime(2026, 10, 1, tzinfo=datetime.UTC)
+
+
+class RunJournalTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'state', 'journal.sqlite')
+
+    def _journal(self, **kwargs):
+        j = journal.RunJournal(self.path, command='TestCmd', **kwargs)
+        self.addCleanup(j.close)
+        return j
+
+    def test_new_run(self):
+        j = self._journal()
+        self.assertTrue(os.path.exists(self.path))
+        self.assertFalse(j.is_finished('p1'))
+        j.record('p1', journal.PROCESSED, NOW, 1.5)
+        j.record('p2', journal.SKIPPED, NOW, 0.1)
+        j.record('p3', journal.ERROR, NOW, 0.2, 'boom')
+        self.assertTrue(j.is_finished('p1'))
+        self.assertTrue(j.is_finished('p2'))
+        self.assertFalse(j.is_finished('p3'))
+        self.assertEqual(
+            {'processed': 1, 'skipped': 1, 'error': 1}, j.summary()
+        )
+
+    def test_resume(self):
+        first = self._journal()
+        first.record('p1', journal.PROCESSED, NOW, 1.5)
+        first.record('p2', journal.ERROR, NOW, 0.2, 'boom')
+        other = self._journal()
+        other.record('p3', journal.PROCESSED, NOW, 1.0)
+
+        resumed = self._journal(run_id=first.run_id)
+        self.assertEqual(first.run_id, resumed.run_id)
+        self.assertEqual({'p1'}, resumed.finished)
+
+        # A retried error replaces the earlier outcome
+        resumed.record('p2', journal.PROCESSED, NOW, 0.3)
+        self.assertEqual({'processed': 2}, resumed.summary())
+
+    def test_resume_unknown_run(self):
+        self._journal()
+        self.assertRaises(ValueError, self._journal, run_id='nope')
+
+    def test_resume_other_command(self):
+        first = self._journal()
+        self.assertRaises(
+            ValueError,
+            journal.RunJournal,
+            self.path,
+            run_id=first.run_id,
+            command='OtherCmd',
+        )
+
+    def test_get_journal_no_path(self):
+        self.assertIsNone(journal.get_journal(None))
+        self.assertRaises(ValueError, journal.get_journal, None, resume='r1')
@@ -0,0 +1,145 @@
+import os
+import tempfile
+from unittest import mock
+
+from nectar_tools.expiry import outbox
+from nectar_tools import test
+
+
+class OutboxTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'state', 'outbox.sqlite')
+        self.now = 1000.0
+        self.box = outbox.Outbox(self.path, clock=lambda: self.now)
+        self.addCleanup(self.box.close)
+
+    def test_claim_in_order(self):
+        self.box.enqueue('project/p1', {'n': 1})
+        self.box.enqueue('project/p2', {'n': 2})
+        self.box.enqueue('project/p1', {'n': 3})
+
+        first = self.box.claim()
+        self.assertEqual({'n': 1}, first.payload)
+        # p1's next message waits until its first is done
+        second = self.box.claim()
+        self.assertEqual({'n': 2}, second.payload)
+        self.assertIsNone(self.box.claim())
+
+        self.box.sent(first)
+        self.assertEqual({'n': 3}, self.box.claim().payload)
+        self.assertEqual(2, self.box.pending())
+
+    def test_retry(self):
+        self.box.enqueue('project/p1', {'n': 1})
+        self.box.enqueue('project/p1', {'n': 2})
+        message = self.box.claim()
+        self.box.retry(message, 'timed out', 30)
+
+        # Nothing of p1's is sent before the retry
+        self.assertIsNone(self.box.claim())
+        self.now += 30
+        retried = self.box.claim()
+        self.assertEqual(message.id, retried.id)
+        self.assertEqual(1, retried.attempts)
+
+        self.box.failed(retried, 'timed out')
+        self.assertEqual({'n': 2}, self.box.claim().payload)
+        self.assertEqual(1, self.box.pending())
+
+    def test_save(self):
+        self.box.enqueue('project/p1', {'ticket_id': 0})
+        message = self.box.claim()
+        message.payload['ticket_id'] = 32
+        self.box.save(message)
+        self.box.retry(message, 'error', 0)
+        self.assertEqual({'ticket_id': 32}, self.box.claim().payload)
+
+    def test_survives_restart(self):
+        self.box.enqueue('project/p1', {'n': 1})
+        self.box.close()
+
+        box = outbox.Outbox(self.path)
+        self.addCleanup(box.close)
+        self.assertEqual(1, box.pending())
+        self.assertEqual({'n': 1}, box.claim().payload)
+
+    def test_sent_since(self):
+        self.box.enqueue('project/p1', {'n': 1})
+        self.box.enqueue('project/p2', {'n': 2})
+        self.box.enqueue('project/p1', {'n': 3})
+        for i in range(2):
+            self.box.sent(self.box.claim())
+        message = self.box.claim()
+        self.assertEqual({'n': 3}, message.payload)
+        self.assertEqual([{'n': 1}], self.box.sent_since(message))
+
+    def test_queued_after(self):
+        self.box.enqueue('project/p1', {'n': 1})
+        self.box.enqueue('project/p2', {'n': 2})
+        self.box.enqueue('project/p1', {'n': 3})
+        message = self.box.claim()
+        self.assertEqual([{'n': 3}], self.box.queued_after(message))
+
+
+class OutboxSenderTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.box = mock.Mock()
+        self.deliver = mock.Mock()
+        self.sender = outbox.OutboxSender(
+            self.box, self.deliver, max_attempts=3, retry_delay=10
+        )
+
+    def test_send(self):
+        message = outbox.Message(1, 'project/p1', {}, 0, 0)
+        self.sender.send(message)
+        self.deliver.assert_called_once_with(self.box, message)
+        self.box.sent.assert_called_once_with(message)
+
+    def test_send_retry(self):
+        self.deliver.side_effect = Exception('helpdesk down')
+        self.sender.send(outbox.Message(1, 'project/p1', {}, 1, 0))
+        self.box.retry.assert_called_once_with(mock.ANY, 'helpdesk down', 20)
+        self.box.sent.assert_not_called()
+
+    def test_send_failed(self):
+        self.deliver.side_effect = Exception('helpdesk down')
+        message = outbox.Message(1, 'project/p1', {}, 2, 0)
+        self.sender.send(message)
+        self.box.failed.assert_called_once_with(message, 'helpdesk down')
+        self.box.retry.assert_not_called()
+
+
+class RunningTests(test.TestCase):
+    def test_no_path(self):
+        deliver = mock.Mock()
+        with outbox.running(deliver) as box:
+            self.assertIsNone(box)
+            self.assertIsNone(outbox.get_outbox())
+
+    def test_dry_run(self):
+        with outbox.running(mock.Mock(), path='unused', dry_run=True) as box:
+            self.assertIsNone(box)
+
+    def test_drains(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'outbox.sqlite')
+        deliver = mock.Mock()
+        session = mock.Mock()
+
+        with outbox.running(deliver, session=session, path=path) as box:
+            self.assertIs(box, outbox.get_outbox())
+            box.enqueue('project/p1', {'n': 1})
+            box.enqueue('project/p1', {'n': 2})
+
+        self.assertIsNone(outbox.get_outbox())
+        self.assertEqual(
+            [{'n': 1}, {'n': 2}],
+            [c[0][1].payload for c in deliver.call_args_list],
+        )
+        for c in deliver.call_args_list:
+            self.assertEqual(session, c[1]['session'])
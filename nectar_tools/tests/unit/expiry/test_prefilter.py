@@ -0,0 +1,80 @@
+import datetime
+from unittest import mock
+
+from nectarallocationclient import states as allocation_states
+
+from nectar_tools.expiry import expiry_states
+from nectar_tools.expiry import prefilter
+from nectar_tools import test
+from nectar_tools.tests import fakes
+
+
+NOW = datetime.datetime(2026, 10, 1, 12, 0)
+
+
+def allocation(end_date='2027-06-30', budget=None, **kwargs):
+    values = {
+        'status': allocation_states.APPROVED,
+        'start_date': '2026-07-01',
+        'end_date': end_date,
+    }
+    values.update(kwargs)
+    a = mock.Mock(**values)
+    quota = {'budget': budget} if budget else {}
+    a.get_allocated_cloudkitty_quota.return_value = quota
+    return a
+
+
+class PrefilterTests(test.TestCase):
+    def test_get_notice_period_days(self):
+        self.assertEqual(
+            30, prefilter.get_notice_period_days('2026-01-01', '2027-01-01')
+        )
+        self.assertEqual(
+            6, prefilter.get_notice_period_days('2026-01-01', '2026-01-31')
+        )
+
+    def test_project_may_need_action(self):
+        def check(status, next_step=''):
+            p = fakes.FakeProject(
+                expiry_status=status, expiry_next_step=next_step
+            )
+            return prefilter.project_may_need_action(p, NOW)
+
+        self.assertTrue(check(''))
+        self.assertTrue(check(expiry_states.ACTIVE))
+        self.assertFalse(check(expiry_states.DELETED))
+        self.assertFalse(check(expiry_states.STOPPED, '2026-10-02'))
+        self.assertTrue(check(expiry_states.STOPPED, '2026-10-01'))
+        self.assertTrue(check(expiry_states.RESTRICTED))
+        self.assertTrue(check(expiry_states.WARNING, 'bad'))
+        self.assertTrue(check(expiry_states.ARCHIVED, '2026-12-01'))
+        self.assertTrue(check(expiry_states.DELETING))
+
+    def test_allocation_may_need_action_active(self):
+        p = fakes.FakeProject(expiry_status='')
+        check = prefilter.allocation_may_need_action
+        self.assertFalse(check(p, allocation(), NOW))
+        # Within the notice period
+        self.assertTrue(check(p, allocation(end_date='2026-10-20'), NOW))
+        self.assertTrue(check(p, allocation(budget=100), NOW))
+        self.assertTrue(check(p, None, NOW))
+        pending = allocation(status=allocation_states.UPDATE_PENDING)
+        self.assertTrue(check(p, pending, NOW))
+
+    def test_allocation_may_need_action_warning(self):
+        p = fakes.FakeProject(
+            expiry_status=expiry_states.WARNING, expiry_next_step='2026-10-20'
+        )
+        check = prefilter.allocation_may_need_action
+        self.assertFalse(check(p, allocation(), NOW))
+        self.assertTrue(check(p, allocation(budget=100), NOW))
+        p.expiry_next_step = '2026-09-20'
+        self.assertTrue(check(p, allocation(), NOW))
+
+    def test_allocation_may_need_action_disabled(self):
+        check = prefilter.allocation_may_need_action
+        p = fakes.FakeProject(enabled=False, expiry_status='')
+        self.assertFalse(check(p, None, NOW))
+        p.expiry_status = expiry_states.DELETING
+        self.assertTrue(check(p, None, NOW))
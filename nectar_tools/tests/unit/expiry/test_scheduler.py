@@ -0,0 +1,158 @@
+import datetime
+from unittest import mock
+
+from nectar_tools.expiry import expiry_states
+from nectar_tools.expiry import scheduler
+from nectar_tools import test
+from nectar_tools.tests import fakes
+
+
+NOW = datetime.datetime(2026, 10, 1, 12, 0)
+HOUR = datetime.timedelta(hours=1)
+
+
+def project(id, status=None, next_step=None, updated_at=None):
+    return fakes.FakeProject(
+        id=id,
+        expiry_status=status,
+        expiry_next_step=next_step,
+        expiry_updated_at=updated_at,
+    )
+
+
+class GetDueDateTests(test.TestCase):
+    def test_unscheduled(self):
+        for status in ['', None, expiry_states.ACTIVE, expiry_states.DELETED]:
+            p = project('p1', status, '2026-10-05')
+            self.assertIsNone(scheduler.get_due_date(p, NOW))
+
+    def test_next_step(self):
+        p = project('p1', expiry_states.STOPPED, '2026-10-05')
+        self.assertEqual(
+            datetime.datetime(2026, 10, 5), scheduler.get_due_date(p, NOW)
+        )
+
+    def test_immediate(self):
+        p = project('p1', expiry_states.DELETING, '2026-10-05')
+        self.assertEqual(NOW, scheduler.get_due_date(p, NOW))
+
+    def test_missing_or_invalid_next_step(self):
+        p = project('p1', expiry_states.RESTRICTED, '')
+        self.assertEqual(NOW, scheduler.get_due_date(p, NOW))
+        p = project('p1', expiry_states.RESTRICTED, 'soon')
+        self.assertEqual(NOW, scheduler.get_due_date(p, NOW))
+
+    def test_other_keys(self):
+        p = fakes.FakeProject(
+            id='p1',
+            zone_expiry_status=expiry_states.STOPPED,
+            zone_expiry_next_step='2026-10-05',
+        )
+        self.assertIsNone(scheduler.get_due_date(p, NOW))
+        self.assertEqual(
+            datetime.datetime(2026, 10, 5),
+            scheduler.get_due_date(
+                p, NOW, 'zone_expiry_status', 'zone_expiry_next_step'
+            ),
+        )
+
+
+class DueQueueTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.queue = scheduler.DueQueue()
+        self.p1 = project('p1', expiry_states.STOPPED, '2026-10-03', 'a')
+        self.p2 = project('p2', expiry_states.WARNING, '2026-09-30', 'a')
+        self.p3 = project('p3', expiry_states.ACTIVE, '', 'a')
+        self.queue.rebuild([self.p1, self.p2, self.p3], NOW)
+
+    def test_rebuild(self):
+        self.assertEqual(2, len(self.queue))
+        self.assertEqual(datetime.datetime(2026, 9, 30), self.queue.next_due())
+
+    def test_pop_due(self):
+        self.assertEqual([self.p2], self.queue.pop_due(NOW))
+        self.assertEqual([], self.queue.pop_due(NOW))
+        later = datetime.datetime(2026, 10, 4)
+        self.assertEqual([self.p1], self.queue.pop_due(later))
+        self.assertIsNone(self.queue.next_due())
+
+    def test_refresh_only_changed(self):
+        p1 = project('p1', expiry_states.ARCHIVED, '2026-09-01', 'b')
+        p2 = project('p2', expiry_states.RESTRICTED, '2026-09-01', 'a')
+        p3 = project('p3', expiry_states.ACTIVE, '', 'a')
+        self.assertEqual(1, self.queue.refresh([p1, p2, p3], NOW))
+        # p2 kept its old schedule since expiry_updated_at didn't change
+        self.assertEqual([p1, self.p2], self.queue.pop_due(NOW))
+
+    def test_refresh_new_and_removed(self):
+        p4 = project('p4', expiry_states.DELETING, '', 'a')
+        self.assertEqual(1, self.queue.refresh([self.p1, self.p3, p4], NOW))
+        self.assertEqual([p4], self.queue.pop_due(NOW))
+
+    def test_refresh_unscheduled(self):
+        p2 = project('p2', expiry_states.ACTIVE, '', 'b')
+        self.queue.refresh([self.p1, p2, self.p3], NOW)
+        self.assertEqual(1, len(self.queue))
+        self.assertEqual([], self.queue.pop_due(NOW))
+
+    def test_defer(self):
+        self.queue.defer('p2', NOW + HOUR)
+        self.queue.update(self.p2, NOW)
+        self.assertEqual([], self.queue.pop_due(NOW))
+        self.assertEqual([self.p2], self.queue.pop_due(NOW + HOUR))
+
+
+class SchedulerTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cmd = mock.Mock(
+            STATUS_KEY='expiry_status',
+            NEXT_STEP_KEY='expiry_next_step',
+            UPDATED_AT_KEY='expiry_updated_at',
+        )
+        self.cmd.args.shard = None
+        self.cmd.valid_project.return_value = True
+        self.handled = []
+
+        def process_projects():
+            self.handled.append([p.id for p in self.cmd.projects])
+            for p in self.cmd.projects:
+                if p.expiry_status == expiry_states.STOPPED:
+                    p.expiry_status = expiry_states.ARCHIVING
+                    p.expiry_next_step = '2026-10-10'
+
+        self.cmd.process_projects.side_effect = process_projects
+        self.sched = scheduler.Scheduler(self.cmd, HOUR, 24 * HOUR)
+
+    def test_run_once(self):
+        p1 = project('p1', expiry_states.STOPPED, '2026-10-02', 'a')
+        p2 = project('p2', expiry_states.ACTIVE, '', 'a')
+        self.cmd.list_projects.return_value = [p1, p2]
+
+        # The first run is a full pass
+        self.sched.run_once(NOW)
+        self.assertEqual([['p1', 'p2']], self.handled)
+        self.assertEqual(NOW, self.sched.last_reconcile)
+
+        # Nothing due
+        self.sched.run_once(NOW + HOUR)
+        self.assertEqual(1, len(self.handled))
+
+        # p1 was processed during the full pass so it moved on
+        p1 = project('p1', expiry_states.STOPPED, '2026-10-02', 'b')
+        self.cmd.list_projects.return_value = [p1, p2]
+        self.sched.run_once(datetime.datetime(2026, 10, 2, 1))
+        self.assertEqual([['p1', 'p2'], ['p1']], self.handled)
+        self.assertEqual(
+            datetime.datetime(2026, 10, 10), self.sched.queue.next_due()
+        )
+        # The due batch reuses the full pass's listings
+        self.cmd.setup_run.assert_called_once_with()
+        self.cmd.start_journal.assert_called_once_with()
+
+    def test_run_once_reconcile(self):
+        self.cmd.list_projects.return_value = []
+        self.sched.run_once(NOW)
+        self.sched.run_once(NOW + 24 * HOUR)
+        self.assertEqual([[], []], self.handled)
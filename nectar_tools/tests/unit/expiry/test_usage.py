@@ -0,0 +1,77 @@
+import datetime
+import os
+import tempfile
+from unittest import mock
+
+from nectar_tools.expiry import usage
+from nectar_tools import test
+
+
+def _usage(tenant_id, hours, instances):
+    return mock.Mock(
+        tenant_id=tenant_id,
+        total_vcpus_usage=hours,
+        server_usages=[{'instance_id': i} for i in instances],
+    )
+
+
+class ListVcpuHoursTests(test.TestCase):
+    def test_pages(self):
+        n_client = mock.Mock()
+        n_client.usage.list.side_effect = [
+            [_usage('p1', 10, ['i1']), _usage('p2', 5, ['i2'])],
+            # p2's usage carries on into the next page
+            [_usage('p2', 2.5, ['i3'])],
+            [],
+        ]
+        start = datetime.datetime(2011, 1, 1)
+        end = datetime.datetime(2026, 10, 1)
+        self.assertEqual(
+            {'p1': 10, 'p2': 7.5},
+            usage.list_vcpu_hours(n_client, start, end, page_size=2),
+        )
+        n_client.usage.list.assert_has_calls(
+            [
+                mock.call(start, end, detailed=True, marker=None, limit=2),
+                mock.call(start, end, detailed=True, marker='i2', limit=2),
+                mock.call(start, end, detailed=True, marker='i3', limit=2),
+            ]
+        )
+
+
+class UsageIndexTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.n_client = mock.Mock()
+        self.n_client.usage.list.side_effect = [
+            [_usage('p1', 10, ['i1']), mock.Mock(tenant_id='p2', spec=[])],
+            [],
+        ]
+
+    def test_get_vcpu_hours(self):
+        index = usage.UsageIndex(self.n_client)
+        self.assertEqual(10, index.get_vcpu_hours('p1'))
+        self.assertIsNone(index.get_vcpu_hours('p2'))
+        self.assertIsNone(index.get_vcpu_hours('p3'))
+        self.assertEqual(2, self.n_client.usage.list.call_count)
+        self.assertEqual(usage.EPOCH, self.n_client.usage.list.call_args[0][0])
+
+    def test_cache(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'state', 'usage.sqlite')
+
+        first = usage.UsageIndex(self.n_client, cache_path=path)
+        self.assertEqual(10, first.get_vcpu_hours('p1'))
+        end = self.n_client.usage.list.call_args[0][1]
+
+        # The next run only lists the usage since the first one
+        self.n_client.usage.list.reset_mock()
+        self.n_client.usage.list.side_effect = [
+            [_usage('p1', 1.5, ['i1']), _usage('p3', 2, ['i3'])],
+            [],
+        ]
+        second = usage.UsageIndex(self.n_client, cache_path=path)
+        self.assertEqual(11.5, second.get_vcpu_hours('p1'))
+        self.assertEqual(2, second.get_vcpu_hours('p3'))
+        self.assertEqual(end, self.n_client.usage.list.call_args[0][0])
@@ -23,6 +23,7 @@ class ManagerTests(test.TestCase):
             allocation=allocation,
             ks_session=self.manager.ks_session,
             noop=self.manager.noop,
+            user_index=None,
         )
 
         notifier.send_over_budget.assert_called_once_with()
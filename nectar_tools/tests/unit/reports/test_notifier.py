@@ -20,7 +20,7 @@ class AllocationNotifierTests(test.TestCase):
         with mock.patch.object(n, 'send_message') as mock_send:
             n.send_over_budget()
             mock_get_recipients.assert_called_once_with(
-                n.k_client, n.allocation
+                n.k_client, n.allocation, index=None
             )
             mock_send.assert_called_once_with(
                 stage='over-budget',
@@ -1,3 +1,6 @@
+import datetime
+import threading
+import time
 from unittest import mock
 
 from designateclient import exceptions as designate_exc
@@ -456,6 +459,34 @@ class NovaArchiverTests(test.TestCase):
             self.assertEqual(2, mock_nova.servers.list.call_count)
             self.assertEqual([i1, i2], instances)
 
+    def test_all_instances_index(self):
+        index = mock.Mock()
+        index.get_project_instances.return_value = ['i1']
+        na = archiver.NovaArchiver(PROJECT, instance_index=index)
+        with mock.patch.object(na, 'n_client') as mock_nova:
+            self.assertEqual(['i1'], na._all_instances())
+            self.assertEqual(['i1'], na._all_instances())
+            index.get_project_instances.assert_called_once_with(PROJECT.id)
+            mock_nova.servers.list.assert_not_called()
+
+    def test_delete_resources_invalidates_index(self):
+        index = mock.Mock()
+        na = archiver.NovaArchiver(PROJECT, instance_index=index)
+        with test.nested(
+            mock.patch.object(na, '_all_instances', return_value=[]),
+        ):
+            na.delete_resources(force=True)
+        index.invalidate.assert_called_once_with(PROJECT.id)
+
+    def test_delete_resources_dry_run_keeps_index(self):
+        index = mock.Mock()
+        na = archiver.NovaArchiver(PROJECT, dry_run=True, instance_index=index)
+        with test.nested(
+            mock.patch.object(na, '_all_instances', return_value=[]),
+        ):
+            na.delete_resources(force=True)
+        index.invalidate.assert_not_called()
+
     def test_get_project_images(self):
         na = archiver.NovaArchiver(PROJECT)
         image1 = fakes.FakeImage()
@@ -520,6 +551,28 @@ class NovaArchiverTests(test.TestCase):
             )
             self.assertIsNone(na._get_image_by_instance_id(instance3.id))
 
+    def test_get_image_by_instance_id_index(self):
+        index = mock.Mock()
+        na = archiver.NovaArchiver(PROJECT, archive_index=index)
+        with mock.patch.object(na, 'g_client') as mock_glance:
+            self.assertEqual(
+                index.get_archive.return_value,
+                na._get_image_by_instance_id('fake1'),
+            )
+            index.get_archive.assert_called_once_with(PROJECT.id, 'fake1')
+            mock_glance.images.list.assert_not_called()
+
+    def test_delete_archives_invalidates_index(self):
+        index = mock.Mock()
+        index.get_project_images.return_value = [fakes.FakeImage()]
+        na = archiver.NovaArchiver(PROJECT, archive_index=index)
+        with mock.patch.object(na, 'g_client') as mock_glance:
+            na.delete_archives()
+            mock_glance.images.list.assert_not_called()
+            mock_glance.images.delete.assert_called_once_with('fake')
+        index.get_project_images.assert_called_once_with(PROJECT.id)
+        index.invalidate.assert_called_once_with(PROJECT.id)
+
 
 @mock.patch('nectar_tools.auth.get_session', new=mock.Mock())
 class ZoneInstanceArchiverTests(NovaArchiverTests):
@@ -570,6 +623,239 @@ class ZoneInstanceArchiverTests(NovaArchiverTests):
             self.assertEqual(2, mock_glance.images.list.call_count)
             self.assertEqual([image1, image2, image3], output)
 
+    @mock.patch('nectar_tools.auth.get_allocation_client')
+    def test_get_project_images_index(self, mock_a_client):
+        project = fakes.FakeProject(allocation_id='fake')
+        index = mock.Mock()
+        index.get_instance_images.side_effect = lambda owner, i: [f'{i}-img']
+        za = archiver.ZoneInstanceArchiver(project, archive_index=index)
+        instances = [fakes.FakeInstance(id='fake1'), fakes.FakeInstance()]
+        with test.nested(
+            mock.patch.object(za, 'g_client'),
+            mock.patch.object(za, '_all_instances', return_value=instances),
+        ) as (mock_glance, mock_instances):
+            output = za._get_project_images()
+            self.assertEqual(['fake1-img', 'fake-img'], output)
+            mock_glance.images.list.assert_not_called()
+
+
+class InstanceIndexTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.i1 = fakes.FakeInstance(
+            id='i1', tenant_id='p1', image={'id': 'a'}
+        )
+        self.i2 = fakes.FakeInstance(id='i2', tenant_id='p1', image='')
+        self.i3 = fakes.FakeInstance(
+            id='i3', tenant_id='p2', image={'id': 'a'}
+        )
+        self.n_client = mock.Mock()
+
+        def fake_list(search_opts):
+            if 'marker' in search_opts:
+                return []
+            if 'tenant_id' in search_opts:
+                return [self.i1]
+            return [self.i1, self.i2, self.i3]
+
+        self.n_client.servers.list.side_effect = fake_list
+        self.index = archiver.InstanceIndex(self.n_client)
+
+    def test_get_project_instances(self):
+        self.assertEqual(
+            [self.i1, self.i2], self.index.get_project_instances('p1')
+        )
+        self.assertEqual([self.i3], self.index.get_project_instances('p2'))
+        self.assertEqual([], self.index.get_project_instances('p3'))
+        # One page and the empty page after it
+        self.assertEqual(2, self.n_client.servers.list.call_count)
+        self.n_client.servers.list.assert_any_call(
+            search_opts={'all_tenants': True}
+        )
+
+    def test_get_image_instances(self):
+        self.assertEqual(
+            [self.i1, self.i3], self.index.get_image_instances('a')
+        )
+        self.assertEqual([], self.index.get_image_instances('b'))
+
+    def test_invalidate(self):
+        self.index.get_project_instances('p1')
+        self.index.invalidate('p1')
+        self.assertEqual([self.i1], self.index.get_project_instances('p1'))
+        self.n_client.servers.list.assert_any_call(
+            search_opts={'all_tenants': True, 'tenant_id': 'p1'}
+        )
+        self.assertEqual(
+            [self.i3, self.i1], self.index.get_image_instances('a')
+        )
+        self.assertEqual(4, self.n_client.servers.list.call_count)
+
+    def test_invalidate_before_load(self):
+        self.index.invalidate('p1')
+        self.index.get_project_instances('p1')
+        self.assertEqual(2, self.n_client.servers.list.call_count)
+
+    def test_get_image_instance_count(self):
+        self.assertEqual(2, self.index.get_image_instance_count('a'))
+        self.assertEqual(0, self.index.get_image_instance_count('b'))
+        self.assertEqual(2, self.n_client.servers.list.call_count)
+
+
+class ImageBootIndexTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.n_client = mock.Mock()
+        page1 = [
+            fakes.FakeInstance(
+                id='i1', image={'id': 'a'}, created='2018-01-01T00:00:00Z'
+            ),
+            fakes.FakeInstance(
+                id='i2', image={'id': 'a'}, created='2018-06-01T00:00:00Z'
+            ),
+        ]
+        page2 = [
+            fakes.FakeInstance(id='i3', image='', created='2018-07-01'),
+            fakes.FakeInstance(
+                id='i4', image={'id': 'b'}, created='2017-01-01T00:00:00Z'
+            ),
+        ]
+        self.n_client.servers.list.side_effect = [page1, page2, []]
+        self.since = datetime.datetime(2016, 1, 2)
+        self.index = archiver.ImageBootIndex(self.n_client, self.since)
+
+    def test_get_last_boot(self):
+        self.assertEqual('2018-06-01T00:00:00Z', self.index.get_last_boot('a'))
+        self.assertEqual('2017-01-01T00:00:00Z', self.index.get_last_boot('b'))
+        self.assertIsNone(self.index.get_last_boot('c'))
+        self.assertEqual(3, self.n_client.servers.list.call_count)
+        self.n_client.servers.list.assert_has_calls(
+            [
+                mock.call(
+                    search_opts={
+                        'all_tenants': True,
+                        'deleted': True,
+                        'changes-since': '2016-01-02T00:00:00',
+                    }
+                ),
+                mock.call(
+                    search_opts={
+                        'all_tenants': True,
+                        'deleted': True,
+                        'changes-since': '2016-01-02T00:00:00',
+                        'marker': 'i2',
+                    }
+                ),
+            ]
+        )
+
+    def test_retry_page(self):
+        self.n_client.servers.list.side_effect = [
+            nova_exc.ClientException(504),
+            [fakes.FakeInstance(id='i1', image={'id': 'a'}, created='x')],
+            [],
+        ]
+        self.assertEqual('x', self.index.get_last_boot('a'))
+        self.assertEqual(3, self.n_client.servers.list.call_count)
+
+
+class ClusterIndexTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.m_client = mock.Mock()
+        self.c1 = mock.Mock(project_id='p1')
+        self.c2 = mock.Mock(project_id='p1')
+        self.c3 = mock.Mock(project_id='p2')
+        self.m_client.clusters.list.return_value = [self.c1, self.c2, self.c3]
+        self.index = archiver.ClusterIndex(self.m_client)
+
+    def test_lazy(self):
+        self.m_client.clusters.list.assert_not_called()
+
+    def test_get_project_clusters(self):
+        self.assertEqual(
+            [self.c1, self.c2], self.index.get_project_clusters('p1')
+        )
+        self.assertEqual([self.c3], self.index.get_project_clusters('p2'))
+        self.assertEqual([], self.index.get_project_clusters('p3'))
+        self.m_client.clusters.list.assert_called_once_with(detail=True)
+
+    def test_get_all_clusters(self):
+        self.assertEqual(
+            [self.c1, self.c2, self.c3], self.index.get_all_clusters()
+        )
+        self.index.get_project_clusters('p1')
+        self.m_client.clusters.list.assert_called_once_with(detail=True)
+
+    def test_invalidate(self):
+        self.index.get_project_clusters('p1')
+        self.index.invalidate('p1')
+        self.m_client.clusters.list.return_value = [self.c3]
+        self.assertEqual([self.c3], self.index.get_project_clusters('p2'))
+        self.assertEqual(1, self.m_client.clusters.list.call_count)
+        self.assertEqual([], self.index.get_project_clusters('p1'))
+        self.assertEqual(2, self.m_client.clusters.list.call_count)
+        self.index.get_project_clusters('p1')
+        self.assertEqual(2, self.m_client.clusters.list.call_count)
+
+    def test_invalidate_before_load(self):
+        self.index.invalidate('p1')
+        self.index.get_project_clusters('p1')
+        self.index.get_project_clusters('p1')
+        self.m_client.clusters.list.assert_called_once_with(detail=True)
+
+
+class ArchiveImageIndexTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.image1 = fakes.FakeImage(
+            id='1', name='i1_archive', owner='p1', instance_uuid='i1'
+        )
+        self.image2 = fakes.FakeImage(
+            id='2', name='i1_archive', owner='p1', instance_uuid='i1'
+        )
+        self.image3 = fakes.FakeImage(id='3', name='i2_archive', owner='p2')
+        self.g_client = mock.Mock()
+        self.g_client.images.list.return_value = [
+            self.image1,
+            self.image2,
+            self.image3,
+        ]
+        self.index = archiver.ArchiveImageIndex(self.g_client)
+
+    def test_get_project_images(self):
+        self.assertEqual(
+            [self.image1, self.image2], self.index.get_project_images('p1')
+        )
+        self.assertEqual([], self.index.get_project_images('p3'))
+        self.g_client.images.list.assert_called_once_with(
+            filters={'nectar_archive': 'True'}
+        )
+
+    def test_get_instance_images(self):
+        self.assertEqual(
+            [self.image1, self.image2],
+            self.index.get_instance_images('p1', 'i1'),
+        )
+        self.assertEqual([], self.index.get_instance_images('p2', 'i1'))
+
+    def test_get_archive(self):
+        self.assertEqual(self.image1, self.index.get_archive('p1', 'i1'))
+        self.assertEqual(self.image3, self.index.get_archive('p2', 'i2'))
+        self.assertIsNone(self.index.get_archive('p1', 'i2'))
+        self.g_client.images.list.assert_called_once()
+
+    def test_invalidate(self):
+        self.index.get_project_images('p1')
+        self.index.invalidate('p1')
+        self.g_client.images.list.return_value = [self.image2]
+        self.assertEqual(self.image2, self.index.get_archive('p1', 'i1'))
+        self.g_client.images.list.assert_called_with(
+            filters={'owner_id': 'p1', 'nectar_archive': 'True'}
+        )
+        self.assertEqual([self.image3], self.index.get_project_images('p2'))
+        self.assertEqual(2, self.g_client.images.list.call_count)
+
 
 @mock.patch('nectar_tools.auth.get_session', new=mock.Mock())
 class CinderArchiverTests(test.TestCase):
@@ -936,31 +1222,48 @@ class MagnumArchiverTests(test.TestCase):
         c2.uuid = "c2"
         with test.nested(
             mock.patch.object(ma, 'm_client'),
-            mock.patch.object(ma, 'remove_resource'),
-        ) as (mock_magnum, mock_rr):
+            mock.patch.object(archiver, 'DeletionTracker'),
+        ) as (mock_magnum, mock_tracker):
             mock_magnum.clusters.list.return_value = [c1, c2]
 
             ma.delete_resources(force=True)
 
-            # TODO(ade): may be more than one once generator/marker fixed
             mock_magnum.clusters.list.assert_called_once_with(detail=True)
 
-            mock_rr.assert_has_calls(
-                [
-                    mock.call(
-                        mock_magnum.clusters.delete,
-                        mock_magnum.clusters.get,
-                        c1.uuid,
-                        magnum_exc.NotFound,
-                    ),
-                    mock.call(
-                        mock_magnum.clusters.delete,
-                        mock_magnum.clusters.get,
-                        c2.uuid,
-                        magnum_exc.NotFound,
-                    ),
-                ]
-            )
+            mock_tracker.assert_called_once_with(
+                mock_magnum.clusters.delete,
+                mock_magnum.clusters.get,
+                magnum_exc.NotFound,
+                label=PROJECT.id,
+            )
+            tracker = mock_tracker.return_value
+            tracker.delete.assert_has_calls(
+                [mock.call(c1.uuid), mock.call(c2.uuid)]
+            )
+            tracker.wait.assert_called_once_with()
+
+    def test_delete_resources_cluster_index(self):
+        c1 = mock.Mock(project_id=PROJECT.id, uuid='c1')
+        c2 = mock.Mock(project_id='other', uuid='c2')
+        m_client = mock.Mock()
+        m_client.clusters.list.return_value = [c1, c2]
+        index = archiver.ClusterIndex(m_client)
+        ma = archiver.MagnumArchiver(PROJECT, cluster_index=index)
+        other = archiver.MagnumArchiver(
+            mock.Mock(id='other'), cluster_index=index, dry_run=True
+        )
+        with mock.patch.object(archiver, 'DeletionTracker') as mock_tracker:
+            other.delete_resources(force=True)
+            ma.delete_resources(force=True)
+
+            m_client.clusters.list.assert_called_once_with(detail=True)
+            tracker = mock_tracker.return_value
+            tracker.delete.assert_called_once_with('c1')
+
+        # The deleted project is listed again, the other comes from memory
+        m_client.clusters.list.return_value = []
+        self.assertTrue(ma.is_delete_successful())
+        self.assertEqual(2, m_client.clusters.list.call_count)
 
 
 @mock.patch('nectar_tools.auth.get_manila_client', new=mock.Mock())
@@ -995,6 +1298,19 @@ class ManilaArchiverTests(test.TestCase):
                 [mock.call(s1), mock.call(s2)]
             )
 
+    def test_is_delete_successful_reuses_listing(self):
+        ma = archiver.ManilaArchiver(PROJECT, dry_run=True)
+        with mock.patch.object(ma, 'm_client') as mock_manila:
+            mock_manila.shares.list.return_value = [mock.Mock()]
+
+            ma.delete_resources(force=True)
+            self.assertFalse(ma.is_delete_successful())
+
+            mock_manila.shares.list.assert_called_once_with(
+                detailed=True,
+                search_opts={"all_tenants": "1", "project_id": PROJECT.id},
+            )
+
 
 @mock.patch('nectar_tools.auth.get_session', new=mock.Mock())
 class MuranoArchiverTests(test.TestCase):
@@ -1094,6 +1410,30 @@ class TroveArchiverTests(test.TestCase):
                 [mock.call(e1), mock.call(e2)]
             )
 
+    def test_listing_reused(self):
+        ta = archiver.TroveArchiver(PROJECT, dry_run=True)
+        with mock.patch.object(ta, 't_client') as mock_trove:
+            mock_trove.mgmt_instances.list.return_value = [mock.Mock()]
+
+            ta.stop_resources()
+            ta.delete_resources(force=True)
+            self.assertFalse(ta.is_delete_successful())
+
+            mock_trove.mgmt_instances.list.assert_called_once_with(
+                project_id=PROJECT.id
+            )
+            self.assertEqual(2, ta.listings_saved)
+
+    def test_listing_invalidated_by_delete(self):
+        ta = archiver.TroveArchiver(PROJECT)
+        with mock.patch.object(ta, 't_client') as mock_trove:
+            mock_trove.mgmt_instances.list.return_value = [mock.Mock()]
+            ta.delete_resources(force=True)
+
+            mock_trove.mgmt_instances.list.return_value = []
+            self.assertTrue(ta.is_delete_successful())
+            self.assertEqual(2, mock_trove.mgmt_instances.list.call_count)
+
 
 @mock.patch('nectar_tools.auth.get_session', new=mock.Mock())
 class HeatArchiverTests(test.TestCase):
@@ -1103,35 +1443,38 @@ class HeatArchiverTests(test.TestCase):
         e1.id = 'fake1'
         e2 = mock.Mock()
         e2.id = 'fake2'
-        with mock.patch.object(ha, 'h_client') as mock_heat:
-            with mock.patch.object(ha, 'remove_resource') as mock_rr:
-                mock_heat.stacks.list.return_value = [e1, e2]
+        with test.nested(
+            mock.patch.object(ha, 'h_client'),
+            mock.patch.object(archiver, 'DeletionTracker'),
+        ) as (mock_heat, mock_tracker):
+            mock_heat.stacks.list.return_value = [e1, e2]
 
-                ha.delete_resources(force=True)
+            ha.delete_resources(force=True)
 
-                mock_heat.stacks.list.assert_called_once_with(
-                    filters={'tenant': PROJECT.id}
-                )
-                mock_rr.assert_has_calls(
-                    [
-                        mock.call(
-                            mock_heat.stacks.delete,
-                            mock_heat.stacks.get,
-                            e1.id,
-                            heat_exc.HTTPNotFound,
-                            state_property='stack_status',
-                            status='DELETE_COMPLETE',
-                        ),
-                        mock.call(
-                            mock_heat.stacks.delete,
-                            mock_heat.stacks.get,
-                            e2.id,
-                            heat_exc.HTTPNotFound,
-                            state_property='stack_status',
-                            status='DELETE_COMPLETE',
-                        ),
-                    ]
-                )
+            mock_heat.stacks.list.assert_called_once_with(
+                filters={'tenant': PROJECT.id}
+            )
+            mock_tracker.assert_called_once_with(
+                mock_heat.stacks.delete,
+                mock_heat.stacks.get,
+                heat_exc.HTTPNotFound,
+                state_property='stack_status',
+                status='DELETE_COMPLETE',
+                list_method=mock.ANY,
+                label=PROJECT.id,
+            )
+            tracker = mock_tracker.return_value
+            tracker.delete.assert_has_calls(
+                [mock.call(e1.id), mock.call(e2.id)]
+            )
+            tracker.wait.assert_called_once_with()
+
+            # Polling lists the project's stacks rather than one at a time
+            list_method = mock_tracker.call_args.kwargs['list_method']
+            list_method()
+            mock_heat.stacks.list.assert_called_with(
+                filters={'tenant': PROJECT.id}
+            )
 
 
 @mock.patch('nectar_tools.auth.get_session', new=mock.Mock())
@@ -1152,45 +1495,126 @@ class SwiftArchiverTests(test.TestCase):
         sa = archiver.SwiftArchiver(PROJECT)
 
         containers = [{'name': 'public'}, {'name': 'private'}]
-        account = ('fake', containers)
+        obj1 = {'name': 'object1'}
+        obj2 = {'name': 'object2'}
 
-        def _get_container(value):
+        def _get_account(marker=None):
+            if marker is None:
+                return ('fake', containers)
+            return ('fake', [])
+
+        def _get_container(value, marker=None):
             if value == 'public':
-                return ({'x-container-read': 'r'}, ['fake-object'])
-            else:
-                return ({'fake': 'fake'}, ['fake-object1'])
+                return ({'x-container-read': 'r'}, [{'name': 'fake-object'}])
+            if marker is None:
+                return ({'fake': 'fake'}, [obj1])
+            if marker == 'object1':
+                return ({'fake': 'fake'}, [obj2])
+            return ({'fake': 'fake'}, [])
+
+        deleted = []
+
+        def _delete_container(container, objects):
+            deleted.append((container, list(objects)))
 
         with test.nested(
             mock.patch.object(sa, 's_client'),
-            mock.patch.object(sa, '_delete_container'),
+            mock.patch.object(
+                sa, '_delete_container', side_effect=_delete_container
+            ),
         ) as (mock_swift, mock_delete):
-            mock_swift.get_account.return_value = account
+            mock_swift.get_account.side_effect = _get_account
             mock_swift.get_container.side_effect = _get_container
 
             sa.delete_resources(force=True)
-            mock_swift.get_account.assert_called_once_with()
-            mock_delete.assert_called_once_with(
-                {'name': 'private'}, ['fake-object1']
+            mock_swift.get_account.assert_has_calls(
+                [mock.call(marker=None), mock.call(marker='private')]
+            )
+            self.assertEqual([({'name': 'private'}, [obj1, obj2])], deleted)
+
+    def test_delete_container_bulk(self):
+        sa = archiver.SwiftArchiver(PROJECT)
+        container = {'name': 'private'}
+        objects = [{'name': f'object{i}'} for i in range(5)]
+
+        with test.nested(
+            mock.patch.object(sa, 's_client'),
+            mock.patch.object(archiver.SwiftArchiver, 'BULK_DELETE_MAX', 2),
+        ) as (mock_swift, _):
+            mock_swift.get_capabilities.return_value = {
+                'bulk_delete': {'max_deletes_per_request': 10000}
+            }
+            mock_swift.post_account.return_value = (
+                {},
+                b'{"Number Deleted": 2, "Errors": []}',
+            )
+            sa._delete_container(container, iter(objects))
+            self.assertEqual(3, mock_swift.post_account.call_count)
+            mock_swift.post_account.assert_any_call(
+                headers={
+                    'Accept': 'application/json',
+                    'Content-Type': 'text/plain',
+                },
+                query_string='bulk-delete',
+                data=b'/private/object0\n/private/object1\n',
             )
+            mock_swift.delete_object.assert_not_called()
+            mock_swift.delete_container.assert_called_once_with('private')
 
-    def test_delete_container(self):
+    @mock.patch('nectar_tools.auth.get_swift_client')
+    def test_delete_container_no_bulk(self, mock_get_client):
         sa = archiver.SwiftArchiver(PROJECT)
         container = {'name': 'private'}
         obj1 = {'name': 'object1'}
         obj2 = {'name': 'object2'}
         objects = [obj1, obj2]
+        worker_client = mock_get_client.return_value
 
         with mock.patch.object(sa, 's_client') as mock_swift:
+            mock_swift.get_capabilities.return_value = {}
             sa._delete_container(container, objects)
+            mock_swift.post_account.assert_not_called()
             delete_calls = [
                 mock.call(container['name'], obj1['name']),
                 mock.call(container['name'], obj2['name']),
             ]
-            mock_swift.delete_object.assert_has_calls(delete_calls)
+            worker_client.delete_object.assert_has_calls(
+                delete_calls, any_order=True
+            )
+            mock_get_client.assert_called_with(
+                None, project_id=PROJECT.id, shared=False
+            )
             mock_swift.delete_container.assert_called_once_with(
                 container['name']
             )
 
+    @mock.patch('nectar_tools.auth.get_swift_client')
+    def test_delete_container_bulk_failure_falls_back(self, mock_get_client):
+        sa = archiver.SwiftArchiver(PROJECT)
+        container = {'name': 'private'}
+        objects = [{'name': 'object1'}]
+        worker_client = mock_get_client.return_value
+
+        with mock.patch.object(sa, 's_client') as mock_swift:
+            mock_swift.get_capabilities.return_value = {'bulk_delete': {}}
+            mock_swift.post_account.side_effect = (
+                archiver.swift_exc.ClientException('nope')
+            )
+            sa._delete_container(container, objects)
+            worker_client.delete_object.assert_called_once_with(
+                'private', 'object1'
+            )
+            self.assertEqual(0, sa._bulk_delete_limit)
+
+    def test_delete_container_dry_run(self):
+        sa = archiver.SwiftArchiver(PROJECT, dry_run=True)
+        container = {'name': 'private'}
+        with mock.patch.object(sa, 's_client') as mock_swift:
+            sa._delete_container(container, [{'name': 'object1'}])
+            mock_swift.post_account.assert_not_called()
+            mock_swift.delete_object.assert_not_called()
+            mock_swift.delete_container.assert_not_called()
+
 
 @mock.patch('nectar_tools.auth.get_session', new=mock.Mock())
 class DesignateArchiverTests(test.TestCase):
@@ -1656,6 +2080,24 @@ class ResourcerArchiverTests(test.TestCase):
         self.assertIs(archiver.CinderArchiver, type(ra.archivers[1]))
         self.assertIs(archiver.ProjectImagesArchiver, type(ra.archivers[2]))
 
+    def test_init_lazy(self):
+        with test.nested(
+            mock.patch.object(archiver, 'NovaArchiver'),
+            mock.patch.object(archiver, 'CinderArchiver'),
+        ) as (mock_nova, mock_cinder):
+            ra = archiver.ResourceArchiver(
+                PROJECT, archivers=['nova', 'cinder']
+            )
+            mock_nova.assert_not_called()
+            mock_cinder.assert_not_called()
+
+            ra.zero_quota()
+            ra.stop_resources()
+            mock_nova.assert_called_once()
+            mock_cinder.assert_called_once()
+            mock_nova.return_value.zero_quota.assert_called_once_with()
+            mock_nova.return_value.stop_resources.assert_called_once_with()
+
     def test_delete_quota(self):
         ra = archiver.ResourceArchiver(PROJECT, archivers=['nova', 'cinder'])
         with test.nested(
@@ -1701,6 +2143,105 @@ class ResourcerArchiverTests(test.TestCase):
             mock_cinder_dr.assert_called_once_with(force=False)
             mock_dq.assert_not_called()
 
+    def _fake_services(self, names, calls, lock=None):
+        lock = lock or threading.Lock()
+        services = {}
+        for name in names:
+            service = mock.Mock()
+
+            def record(name=name, **kwargs):
+                with lock:
+                    calls.append(name)
+
+            service.delete_resources.side_effect = record
+            services[name] = service
+        return services
+
+    def test_delete_resources_dependency_order(self):
+        ra = archiver.ResourceArchiver(PROJECT, archivers=[])
+        calls = []
+        names = ['neutron', 'nova', 'octavia', 'heat', 'magnum', 'cinder']
+        ra._services = self._fake_services(names, calls)
+        ra.delete_resources()
+        self.assertEqual(sorted(names), sorted(calls))
+
+        def before(first, second):
+            self.assertLess(calls.index(first), calls.index(second))
+
+        before('magnum', 'heat')
+        before('heat', 'nova')
+        before('heat', 'octavia')
+        before('nova', 'cinder')
+        before('nova', 'neutron')
+        before('octavia', 'neutron')
+
+    def test_delete_resources_dependency_order_transitive(self):
+        # Without nova, neutron and cinder still wait for what nova would
+        ra = archiver.ResourceArchiver(PROJECT, archivers=[])
+        calls = []
+        names = ['neutron', 'cinder', 'trove', 'heat']
+        ra._services = self._fake_services(names, calls)
+        record_trove = ra._services['trove'].delete_resources.side_effect
+
+        def slow_trove(**kwargs):
+            time.sleep(0.1)
+            record_trove(**kwargs)
+
+        ra._services['trove'].delete_resources.side_effect = slow_trove
+        ra.delete_resources()
+        self.assertEqual(sorted(names), sorted(calls))
+
+        def before(first, second):
+            self.assertLess(calls.index(first), calls.index(second))
+
+        before('trove', 'heat')
+        before('trove', 'neutron')
+        before('heat', 'neutron')
+        before('heat', 'cinder')
+
+    def test_delete_resources_concurrent(self):
+        # Each of these only returns once the other has started
+        ra = archiver.ResourceArchiver(PROJECT, archivers=[])
+        started = {'swift': threading.Event(), 'designate': threading.Event()}
+        ra._services = {name: mock.Mock() for name in started}
+
+        def wait_for(name, other):
+            def delete_resources(**kwargs):
+                started[name].set()
+                self.assertTrue(started[other].wait(timeout=5))
+
+            return delete_resources
+
+        ra._services['swift'].delete_resources.side_effect = wait_for(
+            'swift', 'designate'
+        )
+        ra._services['designate'].delete_resources.side_effect = wait_for(
+            'designate', 'swift'
+        )
+        ra.delete_resources()
+
+    def test_delete_resources_errors_collected(self):
+        ra = archiver.ResourceArchiver(PROJECT, archivers=[])
+        calls = []
+        ra._services = self._fake_services(
+            ['heat', 'nova', 'swift', 'cinder'], calls
+        )
+        ra._services['heat'].delete_resources.side_effect = ValueError()
+        ra._services[
+            'swift'
+        ].delete_resources.side_effect = NotImplementedError()
+        with mock.patch.object(ra, 'delete_quota') as mock_dq:
+            e = self.assertRaises(
+                exceptions.ArchiverFailure, ra.delete_resources, force=True
+            )
+            mock_dq.assert_not_called()
+        self.assertEqual('delete_resources', e.phase)
+        # nova depends on heat and cinder on nova, so both are skipped
+        self.assertEqual({'heat', 'nova', 'cinder'}, set(e.errors))
+        self.assertIsInstance(e.errors['heat'], ValueError)
+        self.assertIsNone(e.errors['nova'])
+        self.assertEqual([], calls)
+
 
 @mock.patch('nectar_tools.auth.get_session', new=mock.Mock())
 class ArchiverTests(test.TestCase):
@@ -1773,3 +2314,108 @@ class ArchiverTests(test.TestCase):
         )
         self.del_method.assert_called_with(self.myid)
         self.check_method.assert_called_with(self.myid)
+
+
+@mock.patch.object(archiver.time, 'sleep')
+class DeletionTrackerTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.del_method = mock.Mock()
+        self.del_method.__name__ = 'delete'
+        self.check_method = mock.Mock()
+
+    def test_deletes_up_front(self, mock_sleep):
+        calls = []
+        self.del_method.side_effect = lambda i: calls.append(('delete', i))
+
+        def check(resource_id):
+            calls.append(('check', resource_id))
+            raise exceptions.DeleteFailure()
+
+        self.check_method.side_effect = check
+        tracker = archiver.DeletionTracker(
+            self.del_method, self.check_method, exceptions.DeleteFailure
+        )
+        tracker.delete('a')
+        tracker.delete('b')
+        latencies = tracker.wait()
+        self.assertEqual(
+            [('delete', 'a'), ('delete', 'b'), ('check', 'a'), ('check', 'b')],
+            calls,
+        )
+        self.assertEqual({'a', 'b'}, set(latencies))
+        mock_sleep.assert_not_called()
+
+    def test_backoff(self, mock_sleep):
+        res = mock.Mock(state='deleting')
+        self.check_method.side_effect = [res] * 5 + [Exception()]
+        tracker = archiver.DeletionTracker(
+            self.del_method, self.check_method, Exception, timeout=1000
+        )
+        tracker.delete('a')
+        tracker.wait()
+        self.assertEqual(
+            [mock.call(d) for d in (1, 2, 4, 8, 16)],
+            mock_sleep.call_args_list,
+        )
+
+    def test_backoff_capped(self, mock_sleep):
+        res = mock.Mock(state='deleting')
+        self.check_method.side_effect = [res] * 7 + [Exception()]
+        tracker = archiver.DeletionTracker(
+            self.del_method, self.check_method, Exception, timeout=1000
+        )
+        tracker.delete('a')
+        tracker.wait()
+        self.assertEqual(30, mock_sleep.call_args_list[-1].args[0])
+
+    def test_list_method(self, mock_sleep):
+        remaining = [
+            mock.Mock(id='a', status='DELETE_IN_PROGRESS'),
+            mock.Mock(id='b', status='DELETE_IN_PROGRESS'),
+        ]
+        list_method = mock.Mock(
+            side_effect=[
+                remaining,
+                [remaining[1]],
+                [mock.Mock(id='b', status='DELETE_COMPLETE')],
+            ]
+        )
+        tracker = archiver.DeletionTracker(
+            self.del_method,
+            self.check_method,
+            Exception,
+            state_property='status',
+            status='DELETE_COMPLETE',
+            list_method=list_method,
+        )
+        tracker.delete('a')
+        tracker.delete('b')
+        self.assertEqual({'a', 'b'}, set(tracker.wait()))
+        self.assertEqual(3, list_method.call_count)
+        self.check_method.assert_not_called()
+
+    def test_failure_waits_for_others(self, mock_sleep):
+        failed = mock.Mock(state='error')
+
+        def check(resource_id):
+            if resource_id == 'a':
+                return failed
+            if self.check_method.call_count < 4:
+                return mock.Mock(state='deleting')
+            raise exceptions.DeleteFailure()
+
+        self.check_method.side_effect = check
+        tracker = archiver.DeletionTracker(
+            self.del_method,
+            self.check_method,
+            exceptions.DeleteFailure,
+            state_property='state',
+            status='deleted',
+            error_status='error',
+        )
+        tracker.delete('a')
+        tracker.delete('b')
+        e = self.assertRaises(exceptions.DeleteFailure, tracker.wait)
+        self.assertIn('a', str(e))
+        self.assertIn('b', tracker.latencies)
@@ -0,0 +1,137 @@
+from unittest import mock
+
+from nectar_tools import auth
+from nectar_tools import ratelimit
+from nectar_tools import test
+
+
+class ClientRegistryTests(test.TestCase):
+    def test_get_creates_once(self):
+        registry = auth.ClientRegistry()
+        factory = mock.Mock()
+        first = registry.get(('nova', '2.87', 'sess'), factory)
+        second = registry.get(('nova', '2.87', 'sess'), factory)
+        self.assertIs(first, second)
+        factory.assert_called_once_with()
+        self.assertEqual(
+            {'clients': 1, 'created': 1, 'reused': 1}, registry.stats()
+        )
+
+    def test_get_different_keys(self):
+        registry = auth.ClientRegistry()
+        first = registry.get(('nova', '2.87', 'sess1'), mock.Mock)
+        second = registry.get(('nova', '2.87', 'sess2'), mock.Mock)
+        self.assertIsNot(first, second)
+        self.assertEqual(2, registry.created)
+        self.assertEqual(0, registry.reused)
+
+    def test_get_evicts_least_recently_used(self):
+        registry = auth.ClientRegistry(max_clients=2)
+        first = registry.get(('nova', '2.87', 'sess1'), mock.Mock)
+        registry.get(('nova', '2.87', 'sess2'), mock.Mock)
+        self.assertIs(first, registry.get(('nova', '2.87', 'sess1'), None))
+        registry.get(('nova', '2.87', 'sess3'), mock.Mock)
+        self.assertEqual(2, registry.stats()['clients'])
+        # sess2 was the least recently used
+        self.assertIs(first, registry.get(('nova', '2.87', 'sess1'), None))
+        factory = mock.Mock()
+        registry.get(('nova', '2.87', 'sess2'), factory)
+        factory.assert_called_once_with()
+
+    def test_clear(self):
+        registry = auth.ClientRegistry()
+        registry.get(('nova', '2.87', 'sess'), mock.Mock)
+        registry.clear()
+        self.assertEqual(
+            {'clients': 0, 'created': 0, 'reused': 0}, registry.stats()
+        )
+
+
+class GetClientTests(test.TestCase):
+    @mock.patch('nectar_tools.auth.novaclient')
+    def test_get_nova_client_shared(self, mock_novaclient):
+        sess = mock.Mock()
+        first = auth.get_nova_client(sess)
+        second = auth.get_nova_client(sess)
+        self.assertIs(first, second)
+        mock_novaclient.Client.assert_called_once_with('2.87', session=sess)
+
+    @mock.patch('nectar_tools.auth.novaclient')
+    def test_get_nova_client_per_session(self, mock_novaclient):
+        auth.get_nova_client(mock.Mock())
+        auth.get_nova_client(mock.Mock())
+        self.assertEqual(2, mock_novaclient.Client.call_count)
+
+    @mock.patch('nectar_tools.auth.get_session')
+    @mock.patch('nectar_tools.auth.novaclient')
+    def test_default_session_shared(self, mock_novaclient, mock_get_session):
+        first = auth.get_nova_client()
+        second = auth.get_nova_client()
+        self.assertIs(first, second)
+        mock_get_session.assert_called_once_with()
+        mock_novaclient.Client.assert_called_once_with(
+            '2.87', session=mock_get_session.return_value
+        )
+
+    @mock.patch('nectar_tools.auth.get_session')
+    def test_default_session_system_scope(self, mock_get_session):
+        mock_get_session.side_effect = lambda **kwargs: mock.Mock()
+        system = auth.get_default_session(system_scope='all')
+        self.assertIs(system, auth.get_default_session(system_scope='all'))
+        self.assertIsNot(system, auth.get_default_session())
+        mock_get_session.assert_has_calls(
+            [mock.call(system_scope='all'), mock.call()]
+        )
+
+    @mock.patch('nectar_tools.auth.swiftclient')
+    def test_get_swift_client_per_project(self, mock_swiftclient):
+        sess = mock.Mock()
+        sess.get_endpoint.return_value = 'https://swift/v1/AUTH_admin'
+        sess.get_project_id.return_value = 'admin'
+        auth.get_swift_client(sess, project_id='p1')
+        auth.get_swift_client(sess, project_id='p1')
+        # Project clients aren't cached
+        self.assertEqual(2, mock_swiftclient.Connection.call_count)
+        mock_swiftclient.Connection.assert_called_with(
+            session=sess,
+            os_options={'object_storage_url': 'https://swift/v1/AUTH_p1'},
+        )
+        self.assertEqual(0, auth.CLIENTS.stats()['clients'])
+
+    @mock.patch('nectar_tools.auth.swiftclient')
+    def test_get_swift_client_not_shared(self, mock_swiftclient):
+        sess = mock.Mock()
+        shared = auth.get_swift_client(sess)
+        mock_swiftclient.Connection.side_effect = [mock.Mock()]
+        other = auth.get_swift_client(sess, shared=False)
+        self.assertIsNot(shared, other)
+        self.assertIs(shared, auth.get_swift_client(sess))
+
+    @mock.patch('nectar_tools.auth.designateclient')
+    def test_get_designate_client_per_project(self, mock_designateclient):
+        sess = mock.Mock()
+        auth.get_designate_client(sess, project_id='p1')
+        auth.get_designate_client(sess, project_id='p1')
+        self.assertEqual(2, mock_designateclient.Client.call_count)
+        self.assertEqual(0, auth.CLIENTS.stats()['clients'])
+
+    @mock.patch('nectar_tools.auth.designateclient')
+    def test_get_designate_client_restores_sudo(self, mock_designateclient):
+        sess = mock.Mock()
+        d_client = auth.get_designate_client(sess, all_projects=True)
+        d_client.session.sudo_project_id = 'p1'
+        d_client = auth.get_designate_client(sess, all_projects=True)
+        self.assertIsNone(d_client.session.sudo_project_id)
+        mock_designateclient.Client.assert_called_once()
+
+    @mock.patch('freshdesk.v2.api.API')
+    def test_get_freshdesk_client(self, mock_api):
+        first = auth.get_freshdesk_client('x.freshdesk.com', 'key')
+        second = auth.get_freshdesk_client('x.freshdesk.com', 'key')
+        self.assertIs(first, second)
+        mock_api.assert_called_once_with('x.freshdesk.com', 'key')
+        self.assertIsInstance(first._session, ratelimit.RateLimitedSession)
+        self.assertEqual(('key', 'unused_with_api_key'), first._session.auth)
+        self.assertEqual(
+            'application/json', first._session.headers['Content-Type']
+        )
@@ -0,0 +1,56 @@
+from unittest import mock
+
+from nectar_tools import events
+from nectar_tools.expiry import expirer
+from nectar_tools import test
+
+
+@mock.patch('nectar_tools.auth.get_session', new=mock.Mock())
+@mock.patch('nectar_tools.events.oslo_messaging')
+class EventsTests(test.TestCase):
+    def test_get_notifier_shared(self, mock_oslo_messaging):
+        first = events.get_notifier()
+        second = events.get_notifier()
+        self.assertIs(first, second)
+        mock_oslo_messaging.get_notification_transport.assert_called_once()
+        mock_oslo_messaging.Notifier.assert_called_once_with(
+            mock_oslo_messaging.get_notification_transport.return_value,
+            'expiry',
+        )
+
+    def test_get_notifier_declares_queues_once(self, mock_oslo_messaging):
+        transport = mock_oslo_messaging.get_notification_transport.return_value
+        events.get_notifier()
+        events.get_notifier()
+        # test1,test2 from the test config
+        self.assertEqual(
+            2, transport._driver.listen_for_notifications.call_count
+        )
+
+    def test_disable(self, mock_oslo_messaging):
+        events.disable()
+        self.assertIsNone(events.get_notifier())
+        events.send('foo', {})
+        mock_oslo_messaging.get_notification_transport.assert_not_called()
+
+    def test_send(self, mock_oslo_messaging):
+        events.send('foo', {'bar': 'baz'})
+        mock_oslo_messaging.Notifier.return_value.audit.assert_called_once_with(
+            events.OSLO_CONTEXT, 'foo', {'bar': 'baz'}
+        )
+
+    def test_expirer_construction_cost(self, mock_oslo_messaging):
+        # Building many expirers must not touch the message queue at all,
+        # and sending from all of them must only build one transport.
+        expirers = [
+            expirer.Expirer('fake_type', mock.Mock(id=i), notifier='fake')
+            for i in range(500)
+        ]
+        mock_oslo_messaging.get_notification_transport.assert_not_called()
+
+        for ex in expirers:
+            ex._send_event('foo', {})
+        mock_oslo_messaging.get_notification_transport.assert_called_once()
+        self.assertEqual(
+            500, mock_oslo_messaging.Notifier.return_value.audit.call_count
+        )
@@ -42,7 +42,10 @@ class ExpiryTests(test.TestCase):
             managers = ex._get_project_managers()
             managers = ex._get_project_managers()
             mock_get_project_users.assert_called_once_with(
-                ex.k_client, project, role=CONF.keystone.manager_role_id
+                ex.k_client,
+                project,
+                role=CONF.keystone.manager_role_id,
+                index=None,
             )
             self.assertEqual(fakes.MANAGERS, ex.managers)
             self.assertEqual(fakes.MANAGERS, managers)
@@ -58,7 +61,10 @@ class ExpiryTests(test.TestCase):
             members = ex._get_project_members()
             members = ex._get_project_members()
             mock_get_project_users.assert_called_once_with(
-                ex.k_client, project, role=CONF.keystone.member_role_id
+                ex.k_client,
+                project,
+                role=CONF.keystone.member_role_id,
+                index=None,
             )
             self.assertEqual(fakes.MEMBERS, ex.members)
             self.assertEqual(fakes.MEMBERS, members)
@@ -75,7 +81,9 @@ class ExpiryTests(test.TestCase):
         with mock.patch.object(ex, 'get_project', return_value=project):
             to, cc = ex._get_recipients()
 
-        mock_recipients.assert_called_once_with(ex.k_client, ex.project)
+        mock_recipients.assert_called_once_with(
+            ex.k_client, ex.project, index=None
+        )
         self.assertEqual('manager1@example.org', to)
         cc.sort()
         self.assertEqual(['manager2@example.org', 'member1@example.org'], cc)
@@ -133,7 +141,7 @@ class ExpiryTests(test.TestCase):
             ex._send_notification('fakestage', {'foo2': 'bar2'})
             mock_notifier.send_message.assert_not_called()
 
-    @mock.patch('nectar_tools.expiry.expirer.oslo_messaging')
+    @mock.patch('nectar_tools.events.oslo_messaging')
     def test_send_event(self, mock_oslo_messaging):
         mock_notifier = mock.Mock()
         mock_oslo_messaging.Notifier.return_value = mock_notifier
@@ -744,6 +752,22 @@ class AllocationExpiryTests(test.TestCase):
             )
             self.assertEqual(active, output)
 
+    def test_get_allocation_index(self):
+        project = fakes.FakeProject()
+        mock_allocations = fakes.FakeAllocationManager()
+        declined2 = mock_allocations.get_current('declined2')
+        active = mock_allocations.get_current('active')
+        index = mock.Mock()
+        index.get_current.return_value = declined2
+        index.get_last_approved.return_value = active
+
+        with mock.patch.object(expirer.auth, 'get_allocation_client') as m:
+            ex = expirer.AllocationExpirer(project, allocation_index=index)
+            self.assertEqual(active, ex.allocation)
+            index.get_current.assert_called_once_with(project.id)
+            index.get_last_approved.assert_called_once_with(project.id)
+            m.return_value.allocations.get_current.assert_not_called()
+
     def test_process_allocation_renewed(self):
         project = fakes.FakeProject(expiry_status=expiry_states.RENEWED)
         ex = expirer.AllocationExpirer(project)
@@ -1340,7 +1364,9 @@ class AllocationExpiryTests(test.TestCase):
 
         to, cc = ex._get_recipients()
 
-        mock_recipients.assert_called_once_with(ex.k_client, ex.allocation)
+        mock_recipients.assert_called_once_with(
+            ex.k_client, ex.allocation, index=None
+        )
         self.assertEqual('manager1@example.org', to)
         cc.sort()
         self.assertEqual(['manager2@example.org', 'member1@example.org'], cc)
@@ -1525,6 +1551,18 @@ class PTExpiryTests(test.TestCase):
 
         self.assertTrue(ex.is_pt_too_old())
 
+    @mock.patch('nectar_tools.auth.get_manuka_client')
+    def test_is_pt_too_old_index(self, mock_get_manuka):
+        mock_manuka = mock_get_manuka.return_value
+        index = mock.Mock()
+        index.get.return_value.registered_at = datetime.datetime(2015, 1, 1)
+        project = fakes.FakeProjectWithOwner()
+        ex = expirer.PTExpirer(project, account_index=index)
+
+        self.assertTrue(ex.is_pt_too_old())
+        index.get.assert_called_once_with(project.owner.id)
+        mock_manuka.users.get.assert_not_called()
+
     def _test_check_cpu_usage(self, usage, expect):
         project = fakes.FakeProjectWithOwner()
         ex = expirer.PTExpirer(project)
@@ -1554,6 +1592,18 @@ class PTExpiryTests(test.TestCase):
             mock_nova.usage.get.return_value = mock_usage
             self.assertRaises(exceptions.NoUsageError, ex.check_cpu_usage)
 
+    def test_check_cpu_usage_index(self):
+        project = fakes.FakeProjectWithOwner()
+        index = mock.Mock()
+        ex = expirer.PTExpirer(project, usage_index=index)
+        with mock.patch.object(ex, 'n_client') as mock_nova:
+            index.get_vcpu_hours.return_value = 4384
+            self.assertEqual(CPULimit.OVER_LIMIT, ex.check_cpu_usage())
+            index.get_vcpu_hours.assert_called_once_with(project.id)
+            index.get_vcpu_hours.return_value = None
+            self.assertRaises(exceptions.NoUsageError, ex.check_cpu_usage)
+            mock_nova.usage.get.assert_not_called()
+
     def test_get_notification_context(self):
         project = fakes.FakeProjectWithOwner()
         ex = expirer.PTExpirer(project)
@@ -2243,6 +2293,32 @@ class ImageExpiryTests(test.TestCase):
             )
             self.assertFalse(actual)
 
+    def test_has_no_running_instance_index(self):
+        image = fakes.FakeImage(owner='fake')
+        index = mock.Mock()
+        index.get_image_instance_count.return_value = 1
+        ex = expirer.ImageExpirer(image, instance_index=index)
+        with mock.patch.object(ex, 'n_client') as mock_nova:
+            self.assertFalse(ex._has_no_running_instance())
+            index.get_image_instance_count.assert_called_once_with(image.id)
+            mock_nova.servers.list.assert_not_called()
+
+    def test_has_no_recent_boot_index(self):
+        image = fakes.FakeImage(owner='fake')
+        index = mock.Mock()
+        ex = expirer.ImageExpirer(image, boot_index=index)
+        with mock.patch.object(ex, 'n_client') as mock_nova:
+            index.get_last_boot.return_value = '2018-06-01T00:00:00Z'
+            self.assertFalse(ex._has_no_recent_boot())
+            index.get_last_boot.return_value = None
+            self.assertTrue(ex._has_no_recent_boot())
+            index.get_last_boot.assert_called_with(image.id)
+            mock_nova.servers.list.assert_not_called()
+            # Other windows aren't covered by the index
+            mock_nova.servers.list.return_value = []
+            self.assertTrue(ex._has_no_recent_boot(30))
+            mock_nova.servers.list.assert_called_once()
+
     @freeze_time("2019-01-01")
     def test_has_no_recent_boot_no_instance(self):
         image = fakes.FakeImage(owner='fake')
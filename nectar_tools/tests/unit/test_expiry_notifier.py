@@ -1,7 +1,10 @@
+import os
+import tempfile
 from unittest import mock
 
 from nectar_tools import config
 from nectar_tools.expiry import notifier
+from nectar_tools.expiry import outbox
 from nectar_tools import test
 from nectar_tools.tests import fakes
 
@@ -281,3 +284,194 @@ class ExpiryNotifierTests(test.TestCase):
             subject='subject',
         )
         self.assertEqual(0, n._get_ticket_id())
+
+
+@mock.patch('freshdesk.v2.api.API')
+@mock.patch('nectar_tools.auth.get_session', new=mock.Mock())
+class ExpiryNotifierOutboxTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.box = outbox.Outbox(os.path.join(tmp.name, 'outbox.sqlite'))
+        self.addCleanup(self.box.close)
+        patcher = mock.patch.object(outbox, '_outbox', self.box)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _notifier(self, project, dry_run=False):
+        return notifier.ExpiryNotifier(
+            resource_type='project',
+            resource=project,
+            template_dir='tests',
+            group_id=1,
+            subject='subject',
+            dry_run=dry_run,
+        )
+
+    def _deliver(self):
+        message = self.box.claim()
+        notifier.deliver(self.box, message)
+        self.box.sent(message)
+
+    def test_send_message_queued(self, mock_api):
+        n = self._notifier(fakes.FakeProject())
+        with mock.patch.object(n, '_create_ticket') as mock_create:
+            n.send_message(
+                'stop',
+                'owner@fake.org',
+                extra_context={'foo': 'bar'},
+                extra_recipients=['manager1@fake.org'],
+                tags=['allocation-1'],
+            )
+            mock_create.assert_not_called()
+
+        payload = self.box.claim().payload
+        self.assertEqual('message', payload['action'])
+        self.assertEqual(0, payload['ticket_id'])
+        self.assertEqual(
+            n.render_template('stop.tmpl', {'foo': 'bar'}), payload['text']
+        )
+        self.assertEqual(
+            n.render_template('project-details.tmpl', {'foo': 'bar'}),
+            payload['details'],
+        )
+        self.assertEqual(['expiry', 'allocation-1'], payload['tags'])
+
+    def test_send_message_dry_run(self, mock_api):
+        n = self._notifier(fakes.FakeProject(), dry_run=True)
+        n.send_message('stop', 'owner@fake.org')
+        self.assertEqual(0, self.box.pending())
+
+    def test_deliver_new_ticket(self, mock_api):
+        n = self._notifier(fakes.FakeProject())
+        n.send_message('stop', 'owner@fake.org', extra_recipients=['m@a.b'])
+        n.send_message('restrict', 'owner@fake.org')
+
+        cls = notifier.ExpiryNotifier
+        with test.nested(
+            mock.patch.object(cls, '_create_ticket', return_value=32),
+            mock.patch.object(cls, '_set_ticket_id'),
+            mock.patch.object(cls, '_add_note_to_ticket'),
+            mock.patch.object(cls, '_update_ticket_requester'),
+            mock.patch.object(cls, '_update_ticket'),
+        ) as (
+            mock_create,
+            mock_id,
+            mock_note,
+            mock_update_requester,
+            mock_update,
+        ):
+            # Setting the ticket ID fails the first time, the retry
+            # carries on with the ticket already created
+            mock_id.side_effect = [ConnectionError('keystone down'), None]
+            message = self.box.claim()
+            self.assertRaises(
+                ConnectionError, notifier.deliver, self.box, message
+            )
+            self.box.retry(message, 'keystone down', 0)
+            self._deliver()
+
+            mock_create.assert_called_once_with(
+                email='owner@fake.org',
+                cc_emails=['m@a.b'],
+                description=n.render_template('stop.tmpl'),
+                tags=['expiry'],
+            )
+            mock_id.assert_called_with(32)
+            mock_note.assert_called_once_with(
+                32, n.render_template('project-details.tmpl')
+            )
+
+            # The next message goes to the ticket the first one created
+            self._deliver()
+            mock_create.assert_called_once()
+            mock_update_requester.assert_called_once_with(32, 'owner@fake.org')
+            mock_update.assert_called_once_with(
+                32, n.render_template('restrict.tmpl'), cc_emails=[]
+            )
+
+    def test_deliver_created_retry(self, mock_api):
+        n = self._notifier(fakes.FakeProject())
+        n.send_message('stop', 'owner@fake.org')
+        # An earlier attempt created the ticket, then failed
+        message = self.box.claim()
+        message.payload.update(ticket_id=32, created=True)
+        self.box.save(message)
+        self.box.retry(message, 'keystone down', 0)
+
+        cls = notifier.ExpiryNotifier
+        with test.nested(
+            mock.patch.object(cls, '_create_ticket'),
+            mock.patch.object(cls, '_set_ticket_id'),
+            mock.patch.object(cls, '_add_note_to_ticket'),
+            mock.patch.object(cls, '_update_ticket'),
+        ) as (mock_create, mock_id, mock_note, mock_update):
+            self._deliver()
+            mock_create.assert_not_called()
+            mock_update.assert_not_called()
+            mock_id.assert_called_once_with(32)
+            mock_note.assert_called_once_with(
+                32, n.render_template('project-details.tmpl')
+            )
+
+    def test_deliver_reply(self, mock_api):
+        n = self._notifier(fakes.FakeProject(expiry_ticket_id=45))
+        n.send_message('restrict', 'owner@fake.org', extra_recipients=['m'])
+
+        cls = notifier.ExpiryNotifier
+        with test.nested(
+            mock.patch.object(cls, '_create_ticket'),
+            mock.patch.object(cls, '_set_ticket_id'),
+            mock.patch.object(cls, '_add_note_to_ticket'),
+            mock.patch.object(cls, '_update_ticket_requester'),
+            mock.patch.object(cls, '_update_ticket'),
+        ) as (
+            mock_create,
+            mock_id,
+            mock_note,
+            mock_update_requester,
+            mock_update,
+        ):
+            self._deliver()
+            mock_create.assert_not_called()
+            mock_id.assert_not_called()
+            mock_note.assert_not_called()
+            mock_update_requester.assert_called_once_with(45, 'owner@fake.org')
+            mock_update.assert_called_once_with(
+                45, n.render_template('restrict.tmpl'), cc_emails=['m']
+            )
+
+    def test_deliver_new_ticket_then_finish(self, mock_api):
+        n = self._notifier(fakes.FakeProject())
+        n.send_message('first-warning', 'owner@fake.org')
+        n.finish(message='note-message')
+
+        cls = notifier.ExpiryNotifier
+        with test.nested(
+            mock.patch.object(cls, '_create_ticket', return_value=32),
+            mock.patch.object(cls, '_set_ticket_id'),
+            mock.patch.object(cls, '_add_note_to_ticket'),
+        ) as (mock_create, mock_id, mock_note):
+            self._deliver()
+            # Finishing has reset the resource's ticket ID already
+            mock_id.assert_not_called()
+            self._deliver()
+            mock_note.assert_called_with(32, 'note-message')
+        mock_api.return_value.tickets.update_ticket.assert_called_once_with(
+            32, status=5
+        )
+
+    def test_deliver_finish(self, mock_api):
+        n = self._notifier(fakes.FakeProject(expiry_ticket_id=22))
+        n.finish(message='note-message')
+        mock_api.return_value.tickets.update_ticket.assert_not_called()
+
+        with mock.patch.object(
+            notifier.ExpiryNotifier, '_add_note_to_ticket'
+        ) as mock_note:
+            self._deliver()
+            mock_note.assert_called_once_with(22, 'note-message')
+        mock_api.return_value.tickets.update_ticket.assert_called_once_with(
+            22, status=5
+        )
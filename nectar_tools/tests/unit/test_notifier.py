@@ -1,3 +1,5 @@
+import os
+import tempfile
 from unittest import mock
 
 from nectar_tools import config
@@ -37,6 +39,46 @@ class NotifierTests(test.TestCase):
         self.assertIn('some-fake-date', template)
 
 
+class TemplateEnvironmentTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(notifier, '_environments', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_template_environment(self):
+        env = notifier.get_template_environment('expiry/tests')
+        self.assertIs(env, notifier.get_template_environment('expiry/tests'))
+        self.assertIsNot(
+            env, notifier.get_template_environment('expiry/allocations')
+        )
+        self.assertIsNone(env.bytecode_cache)
+
+    def test_render_template_compiles_once(self):
+        n = notifier.Notifier(
+            resource_type='project',
+            resource=PROJECT,
+            template_dir='expiry/tests',
+            subject='fake',
+        )
+        env = notifier.get_template_environment('expiry/tests')
+        with mock.patch.object(env, 'compile', wraps=env.compile) as compile:
+            n.render_template('first-warning.tmpl')
+            n.render_template('first-warning.tmpl')
+            self.assertEqual(1, compile.call_count)
+
+    def test_bytecode_cache(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cache_dir = os.path.join(tmp.name, 'templates')
+        with mock.patch.dict(
+            CONF, {'templates': {'bytecode_cache_dir': cache_dir}}
+        ):
+            count = notifier.precompile_templates('expiry/tests')
+        self.assertGreater(count, 0)
+        self.assertEqual(count, len(os.listdir(cache_dir)))
+
+
 @mock.patch('nectar_tools.auth.get_session', new=mock.Mock())
 class TaynacNotifierTests(test.TestCase):
     def test_send_message(self):
@@ -535,7 +535,7 @@ class ProvisionerTests(test.TestCase):
         )
         mock_notifier.send_message.assert_not_called()
 
-    @mock.patch('nectar_tools.provisioning.manager.oslo_messaging')
+    @mock.patch('nectar_tools.events.oslo_messaging')
     def test_send_event(self, mock_oslo_messaging):
         mock_notifier = mock.Mock()
         mock_oslo_messaging.Notifier.return_value = mock_notifier
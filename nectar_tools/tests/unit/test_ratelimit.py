@@ -0,0 +1,103 @@
+from unittest import mock
+
+import requests
+
+from nectar_tools import ratelimit
+from nectar_tools import test
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.bucket = ratelimit.TokenBucket(1, 2, clock=self.clock)
+
+    def test_burst_then_pace(self):
+        self.assertEqual(0, self.bucket.reserve())
+        self.assertEqual(0, self.bucket.reserve())
+        self.assertEqual(1, self.bucket.reserve())
+        # Reserved ahead, so the next caller queues behind
+        self.assertEqual(2, self.bucket.reserve())
+        self.clock.now = 10
+        self.assertEqual(0, self.bucket.reserve())
+
+    def test_update(self):
+        self.bucket.update(0, total=120)
+        self.assertEqual(2, self.bucket.rate)
+        self.assertEqual(120, self.bucket.capacity)
+        self.assertEqual(0.5, self.bucket.reserve())
+
+    def test_pause(self):
+        self.bucket.pause(30)
+        self.assertEqual(30, self.bucket.reserve())
+        self.clock.now = 31
+        self.assertEqual(0, self.bucket.reserve())
+
+
+def _response(status_code=200, **headers):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    return response
+
+
+class RateLimitedSessionTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.session = ratelimit.RateLimitedSession(60, sleep=self.clock.sleep)
+        self.session.bucket = ratelimit.TokenBucket(1, 60, clock=self.clock)
+        patcher = mock.patch('requests.Session.request')
+        self.mock_request = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_follows_remaining(self):
+        self.mock_request.return_value = _response(
+            **{'X-RateLimit-Remaining': '0', 'X-RateLimit-Total': '60'}
+        )
+        self.session.get('https://x.freshdesk.com/api/v2/tickets')
+        self.session.get('https://x.freshdesk.com/api/v2/tickets')
+        self.assertEqual(1, self.clock.now)
+        self.assertEqual(
+            {
+                'throttled_seconds': 1,
+                'throttled_requests': 1,
+                'rate_limited': 0,
+            },
+            self.session.stats(),
+        )
+
+    def test_retry_429(self):
+        ok = _response()
+        self.mock_request.side_effect = [
+            _response(429, **{'Retry-After': '20'}),
+            ok,
+        ]
+        self.assertIs(ok, self.session.post('https://x', data='{}'))
+        self.assertEqual(2, self.mock_request.call_count)
+        self.mock_request.assert_called_with(
+            'POST', 'https://x', data='{}', json=None
+        )
+        self.assertEqual(20, self.clock.now)
+        self.assertEqual(1, self.session.stats()['rate_limited'])
+
+    def test_retry_429_gives_up(self):
+        self.mock_request.return_value = _response(429)
+        response = self.session.get('https://x')
+        self.assertEqual(429, response.status_code)
+        self.assertEqual(ratelimit.MAX_ATTEMPTS, self.mock_request.call_count)
+        self.assertEqual(
+            ratelimit.DEFAULT_RETRY_AFTER * (ratelimit.MAX_ATTEMPTS - 1),
+            self.clock.now,
+        )
@@ -1,5 +1,9 @@
+import argparse
+import datetime
 from unittest import mock
 
+from manukaclient.v1 import users as manuka_users
+
 from nectar_tools import auth
 from nectar_tools import config
 from nectar_tools import test
@@ -177,7 +181,7 @@ class UtilsTests(test.TestCase):
 
     @mock.patch("nectar_tools.utils.get_project_users")
     def test_get_project_recipients(self, mock_get):
-        def get_users_side_effect(client, project, role):
+        def get_users_side_effect(client, project, role, index=None):
             if role == CONF.keystone.manager_role_id:
                 return [
                     fakes.FakeUser(id="tm1", email="tm1@fake.com"),
@@ -202,7 +206,7 @@ class UtilsTests(test.TestCase):
 
     @mock.patch("nectar_tools.utils.get_project_users")
     def test_get_project_recipients_mixed(self, mock_get):
-        def get_users_side_effect(client, project, role):
+        def get_users_side_effect(client, project, role, index=None):
             if role == CONF.keystone.manager_role_id:
                 return [
                     fakes.FakeUser(id="tm1", email="tm1@fake.com"),
@@ -236,7 +240,7 @@ class UtilsTests(test.TestCase):
 
     @mock.patch("nectar_tools.utils.get_project_users")
     def test_get_project_recipients_no_tm(self, mock_get):
-        def get_users_side_effect(client, project, role):
+        def get_users_side_effect(client, project, role, index=None):
             if role == CONF.keystone.manager_role_id:
                 return []
             else:
@@ -257,7 +261,7 @@ class UtilsTests(test.TestCase):
 
     @mock.patch("nectar_tools.utils.get_project_users")
     def test_get_project_recipients_none(self, mock_get):
-        def get_users_side_effect(client, project, role):
+        def get_users_side_effect(client, project, role, index=None):
             return []
 
         mock_get.side_effect = get_users_side_effect
@@ -271,7 +275,7 @@ class UtilsTests(test.TestCase):
 
     @mock.patch("nectar_tools.utils.get_project_users")
     def test_get_project_recipients_too_many(self, mock_get):
-        def get_users_side_effect(client, project, role):
+        def get_users_side_effect(client, project, role, index=None):
             if role == CONF.keystone.manager_role_id:
                 return [
                     fakes.FakeUser(id="tm1", email="tm1@fake.com"),
@@ -296,7 +300,7 @@ class UtilsTests(test.TestCase):
 
     @mock.patch("nectar_tools.utils.get_project_users")
     def test_get_allocation_recipients(self, mock_get):
-        def get_users_side_effect(client, project, role):
+        def get_users_side_effect(client, project, role, index=None):
             if role == CONF.keystone.manager_role_id:
                 return [
                     fakes.FakeUser(id="tm1", email="tm1@fake.com"),
@@ -338,11 +342,13 @@ class UtilsTests(test.TestCase):
                     mock_client,
                     mock_project,
                     role=CONF.keystone.manager_role_id,
+                    index=None,
                 ),
                 mock.call(
                     mock_client,
                     mock_project,
                     role=CONF.keystone.member_role_id,
+                    index=None,
                 ),
             ]
         )
@@ -424,3 +430,212 @@ class ListResourcesTests(test.TestCase):
         self.assertEqual(items, result)
         # One initial call + one probe that yields no new items, then stop.
         self.assertEqual(2, list_method.call_count)
+
+    def test_parse_shard(self):
+        self.assertEqual((0, 3), utils.parse_shard('0/3'))
+        self.assertEqual((2, 3), utils.parse_shard('2/3'))
+        for value in ['3/3', '-1/3', '0/0', '1', 'a/b']:
+            self.assertRaises(
+                argparse.ArgumentTypeError, utils.parse_shard, value
+            )
+
+    def test_in_shard(self):
+        ids = [f'project-{i}' for i in range(100)]
+        shards = [
+            [i for i in ids if utils.in_shard(i, (n, 4))] for n in range(4)
+        ]
+        self.assertEqual(sorted(ids), sorted(sum(shards, [])))
+        for shard in shards:
+            self.assertTrue(shard)
+        # Stable between calls
+        self.assertEqual(
+            shards[1], [i for i in ids if utils.in_shard(i, (1, 4))]
+        )
+
+    def test_in_shard_none(self):
+        self.assertTrue(utils.in_shard('project-1', None))
+
+
+def _assignment(project_id, role_id, user_id=None):
+    assignment = mock.Mock(role={'id': role_id}, scope={})
+    if project_id:
+        assignment.scope = {'project': {'id': project_id}}
+    assignment.user = {'id': user_id} if user_id else None
+    return assignment
+
+
+class ProjectUserIndexTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = mock.Mock()
+        self.client.role_assignments.list.return_value = [
+            _assignment('p1', 'manager', 'u1'),
+            _assignment('p1', 'member', 'u1'),
+            _assignment('p1', 'member', 'u2'),
+            # Effective listings can repeat a user via several groups
+            _assignment('p1', 'member', 'u2'),
+            _assignment('p2', 'member', 'u3'),
+            # Group and domain assignments are skipped
+            _assignment('p2', 'member'),
+            _assignment(None, 'member', 'u1'),
+        ]
+        self.users = {u: mock.Mock(id=u) for u in ['u1', 'u2']}
+        self.client.users.list.side_effect = [list(self.users.values()), []]
+        self.index = utils.ProjectUserIndex(self.client)
+
+    def test_get_project_users(self):
+        self.assertEqual(
+            [self.users['u1']], self.index.get_project_users('p1', 'manager')
+        )
+        self.assertEqual(
+            [self.users['u1'], self.users['u2']],
+            self.index.get_project_users(mock.Mock(id='p1'), 'member'),
+        )
+        self.assertEqual([], self.index.get_project_users('p3', 'member'))
+        self.client.role_assignments.list.assert_called_once_with(
+            effective=True, include_names=True
+        )
+
+    def test_get_project_users_unknown_user(self):
+        self.client.users.get.return_value = mock.Mock(id='u3')
+        users = self.index.get_project_users('p2', 'member')
+        users = self.index.get_project_users('p2', 'member')
+        self.assertEqual(['u3'], [u.id for u in users])
+        self.client.users.get.assert_called_once_with('u3')
+
+    def test_get_project_users_uses_index(self):
+        client = mock.Mock()
+        index = mock.Mock()
+        users = utils.get_project_users(client, 'p1', 'member', index=index)
+        self.assertEqual(index.get_project_users.return_value, users)
+        index.get_project_users.assert_called_once_with('p1', 'member')
+        client.role_assignments.list.assert_not_called()
+
+
+class AllocationIndexTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = mock.Mock()
+        self.a1 = mock.Mock(id=1, project_id='p1')
+        self.a2 = mock.Mock(id=2, project_id='p2')
+        self.a3 = mock.Mock(id=3, project_id='p2')
+        self.new = mock.Mock(id=4, project_id=None)
+        self.h1 = mock.Mock(id=5, project_id='p1')
+        self.h2 = mock.Mock(id=6, project_id='p1')
+
+        def list_allocations(**kwargs):
+            if kwargs.get('parent_request__isnull'):
+                return [self.a1, self.a2, self.a3, self.new]
+            return [self.h1, self.h2]
+
+        self.client.allocations.list.side_effect = list_allocations
+        self.index = utils.AllocationIndex(self.client)
+
+    def test_get_current(self):
+        self.assertEqual(self.a1, self.index.get_current('p1'))
+        self.assertEqual(self.a1, self.index.get_current('p1'))
+        self.assertEqual(2, self.client.allocations.list.call_count)
+        self.client.allocations.list.assert_any_call(
+            parent_request__isnull=True
+        )
+        self.client.allocations.list.assert_any_call(status='A')
+        self.client.allocations.get_current.assert_not_called()
+
+    def test_peek_current(self):
+        self.assertEqual(self.a1, self.index.peek_current('p1'))
+        self.assertIsNone(self.index.peek_current('p2'))
+        self.assertIsNone(self.index.peek_current('p3'))
+        self.client.allocations.get_current.assert_not_called()
+
+    def test_get_current_miss(self):
+        # Missing and duplicated projects are left to the API
+        self.assertEqual(
+            self.client.allocations.get_current.return_value,
+            self.index.get_current('p2'),
+        )
+        self.index.get_current('p3')
+        self.client.allocations.get_current.assert_has_calls(
+            [mock.call(project_id='p2'), mock.call(project_id='p3')]
+        )
+
+    def test_get_last_approved(self):
+        self.assertEqual(self.h1, self.index.get_last_approved('p1'))
+        self.client.allocations.get_last_approved.assert_not_called()
+        self.assertEqual(
+            self.client.allocations.get_last_approved.return_value,
+            self.index.get_last_approved('p2'),
+        )
+        self.client.allocations.get_last_approved.assert_called_once_with(
+            project_id='p2'
+        )
+
+
+class AccountIndexTests(test.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = mock.Mock()
+        manager = self.client.users
+        manager.base_url = 'v1/users'
+        manager.resource_class = manuka_users.User
+        pages = {
+            '/v1/users/': {
+                'results': [
+                    {
+                        'id': 'u1',
+                        'registered_at': '2015-01-01T00:00:00',
+                        'last_login': '2026-01-01T00:00:00',
+                        'expiry_status': 'active',
+                        'email': 'one@example.com',
+                    }
+                ],
+                'next': 'https://manuka/v1/users/?page=2',
+            },
+            'https://manuka/v1/users/?page=2': {
+                'results': [{'id': 'u2', 'registered_at': '2026-01-01'}],
+                'next': None,
+            },
+        }
+
+        def get(url, params=None):
+            return mock.Mock(), pages[url]
+
+        manager.api.get.side_effect = get
+        self.index = utils.AccountIndex(self.client)
+
+    def test_iter_accounts(self):
+        accounts = utils.iter_accounts(self.client, expiry_status='active')
+        self.client.users.api.get.assert_not_called()
+        self.assertEqual('u1', next(accounts).id)
+        self.assertEqual(1, self.client.users.api.get.call_count)
+        self.assertEqual(['u2'], [a.id for a in accounts])
+        self.client.users.api.get.assert_has_calls(
+            [
+                mock.call('/v1/users/', params={'expiry_status': 'active'}),
+                mock.call('https://manuka/v1/users/?page=2', params=None),
+            ]
+        )
+
+    def test_get(self):
+        self.assertEqual(
+            utils.AccountSummary(
+                datetime.datetime(2015, 1, 1),
+                datetime.datetime(2026, 1, 1),
+                'active',
+            ),
+            self.index.get('u1'),
+        )
+        self.assertEqual(
+            utils.AccountSummary(datetime.datetime(2026, 1, 1), None, None),
+            self.index.get('u2'),
+        )
+        self.assertEqual(2, self.client.users.api.get.call_count)
+        self.client.users.get.assert_not_called()
+
+    def test_get_miss(self):
+        account = self.client.users.get.return_value
+        account.registered_at = datetime.datetime(2020, 1, 1)
+        self.assertEqual(
+            datetime.datetime(2020, 1, 1),
+            self.index.get('u3').registered_at,
+        )
+        self.client.users.get.assert_called_once_with('u3')
@@ -1,5 +1,11 @@
+import argparse
 import collections
+import hashlib
+import logging
 import re
+import threading
+
+from nectarallocationclient import states as allocation_states
 
 from nectar_tools import auth
 from nectar_tools import config
@@ -7,6 +13,7 @@ from nectar_tools.expiry import archiver
 
 
 CONF = config.CONFIG
+LOG = logging.getLogger(__name__)
 PT_RE = re.compile(r'^pt-\d+$')
 
 
@@ -36,14 +43,21 @@ def get_compute_zones(session, allocation):
         return []
 
 
-def get_out_of_zone_instances(session, allocation, project):
+def get_out_of_zone_instances(
+    session, allocation, project, instance_index=None
+):
     """Returns list of instances that a project has running in
     zones that it shouldn't based on its allocation home.
+
+    :param instance_index: archiver.InstanceIndex to read the project's
+                           instances from instead of listing them
     """
     zones = get_compute_zones(session, allocation)
     if not zones:
         return []
-    nova_archiver = archiver.NovaArchiver(project, session)
+    nova_archiver = archiver.NovaArchiver(
+        project, session, instance_index=instance_index
+    )
     instances = nova_archiver._all_instances()
     out_of_zone = []
     for instance in instances:
@@ -90,6 +104,41 @@ def list_resources(list_method, marker_name='id', **list_method_kwargs):
     return results
 
 
+def parse_shard(value):
+    """Parse an INDEX/COUNT shard argument into an (index, count) tuple
+
+    Shards are numbered from 0, so a run split over three hosts would use
+    0/3, 1/3 and 2/3.
+    """
+    try:
+        index, count = (int(i) for i in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Invalid shard '{value}', expected INDEX/COUNT"
+        )
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            f"Invalid shard '{value}', INDEX must be between 0 and COUNT-1"
+        )
+    return index, count
+
+
+def in_shard(resource_id, shard):
+    """Returns True if the resource belongs to the given shard
+
+    Uses a stable hash of the ID so that every host agrees on the split
+    no matter what order it lists the resources in.
+
+    :param str resource_id: ID of the resource
+    :param tuple shard: (index, count) as returned by parse_shard, or None
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.sha256(str(resource_id).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % count == index
+
+
 def read_file(uuid_file):
     """Get a list of UUIDs from a file.
 
@@ -117,8 +166,207 @@ def get_emails(users):
     return emails
 
 
-def get_project_users(client, project, role):
-    """Returns a list of users of a project based on role"""
+class ProjectUserIndex:
+    """Cloud-wide index of project users by role
+
+    Loaded on first use from a single effective role assignment listing and
+    one user listing, so that the users of any project can then be looked
+    up without further API calls.  Safe to share between threads.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._assignments = None
+        self._users = None
+
+    def _load(self):
+        with self._lock:
+            if self._assignments is not None:
+                return
+            LOG.debug("Loading role assignments and users")
+            assignments = collections.defaultdict(list)
+            for assignment in self.client.role_assignments.list(
+                effective=True, include_names=True
+            ):
+                user = getattr(assignment, 'user', None)
+                project = getattr(assignment, 'scope', {}).get('project')
+                if not user or not project:
+                    continue
+                key = (project['id'], assignment.role['id'])
+                if user['id'] not in assignments[key]:
+                    assignments[key].append(user['id'])
+            users = {u.id: u for u in list_resources(self.client.users.list)}
+            LOG.debug(
+                "Indexed %d project roles and %d users",
+                len(assignments),
+                len(users),
+            )
+            self._users = users
+            self._assignments = assignments
+
+    def _get_user(self, user_id):
+        user = self._users.get(user_id)
+        if user is None:
+            # Created since the index was loaded, or in another domain
+            user = self.client.users.get(user_id)
+            with self._lock:
+                self._users[user_id] = user
+        return user
+
+    def get_project_users(self, project, role):
+        self._load()
+        project_id = getattr(project, 'id', project)
+        user_ids = self._assignments.get((project_id, role), [])
+        return [self._get_user(user_id) for user_id in user_ids]
+
+
+class AllocationIndex:
+    """Index of current and last approved allocations by project
+
+    Loaded on first use from one listing of current allocation records and
+    one of approved records (both paginated by the client), replacing the
+    per-project ``get_current`` and ``get_last_approved`` calls.  Projects
+    missing from the index fall back to those calls.  Safe to share between
+    threads.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._current = None
+        self._approved = None
+
+    def _load(self):
+        with self._lock:
+            if self._current is not None:
+                return
+            LOG.debug("Loading current and approved allocations")
+            current = collections.defaultdict(list)
+            for allocation in self.client.allocations.list(
+                parent_request__isnull=True
+            ):
+                if allocation.project_id:
+                    current[allocation.project_id].append(allocation)
+            approved = {}
+            for allocation in self.client.allocations.list(
+                status=allocation_states.APPROVED
+            ):
+                # Keep the API ordering, as get_last_approved does
+                if allocation.project_id:
+                    approved.setdefault(allocation.project_id, allocation)
+            LOG.debug(
+                "Indexed %d current and %d approved allocations",
+                len(current),
+                len(approved),
+            )
+            self._approved = approved
+            self._current = current
+
+    def get_current(self, project_id):
+        self._load()
+        allocations = self._current.get(project_id, [])
+        if len(allocations) == 1:
+            return allocations[0]
+        # Let the API raise AllocationDoesNotExist or report duplicates
+        return self.client.allocations.get_current(project_id=project_id)
+
+    def peek_current(self, project_id):
+        """The indexed current allocation, or None, without an API call"""
+        self._load()
+        allocations = self._current.get(project_id, [])
+        if len(allocations) == 1:
+            return allocations[0]
+        return None
+
+    def get_last_approved(self, project_id):
+        self._load()
+        allocation = self._approved.get(project_id)
+        if allocation is not None:
+            return allocation
+        return self.client.allocations.get_last_approved(project_id=project_id)
+
+
+AccountSummary = collections.namedtuple(
+    'AccountSummary', ['registered_at', 'last_login', 'expiry_status']
+)
+
+
+def iter_accounts(client, **filters):
+    """Yield Manuka accounts, fetching one page at a time
+
+    ``users.list`` follows every next link before returning, so holds all
+    accounts at once.  This only holds the current page.
+
+    :param client: Manuka client
+    :param kwargs (optional) **filters: users.list filters
+    """
+    manager = client.users
+    url = f'/{manager.base_url}/'
+    params = filters
+    while url:
+        resp, body = manager.api.get(url, params=params)
+        if isinstance(body, list):
+            results, url = body, None
+        else:
+            results, url = body.get('results', []), body.get('next')
+        for info in results:
+            yield manager.resource_class(manager, info, loaded=True)
+        # The next link already has the filters
+        params = None
+
+
+class AccountIndex:
+    """Index of Manuka account dates and expiry status by user ID
+
+    Loaded on first use by streaming every account and keeping only an
+    AccountSummary of each, so it stays small for large clouds.  Accounts
+    missing from the index fall back to ``users.get``.  Safe to share
+    between threads.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._accounts = None
+
+    @staticmethod
+    def _summarise(account):
+        return AccountSummary(
+            getattr(account, 'registered_at', None),
+            getattr(account, 'last_login', None),
+            getattr(account, 'expiry_status', None),
+        )
+
+    def _load(self):
+        with self._lock:
+            if self._accounts is not None:
+                return
+            LOG.debug("Loading accounts")
+            accounts = {
+                account.id: self._summarise(account)
+                for account in iter_accounts(self.client)
+            }
+            LOG.debug("Indexed %d accounts", len(accounts))
+            self._accounts = accounts
+
+    def get(self, user_id):
+        self._load()
+        summary = self._accounts.get(user_id)
+        if summary is None:
+            # Registered since the index was loaded
+            summary = self._summarise(self.client.users.get(user_id))
+        return summary
+
+
+def get_project_users(client, project, role, index=None):
+    """Returns a list of users of a project based on role
+
+    :param index: ProjectUserIndex to answer from instead of calling the
+                  keystone API for this project
+    """
+    if index is not None:
+        return index.get_project_users(project, role)
     members = client.role_assignments.list(project=project, role=role)
     users = []
     for member in members:
@@ -130,7 +378,7 @@ def get_project_users(client, project, role):
 MAX_CC_COUNT = 49
 
 
-def get_project_recipients(client, project):
+def get_project_recipients(client, project, index=None):
     """Returns emails for a project
 
     Will return a tuple with the first item
@@ -140,10 +388,10 @@ def get_project_recipients(client, project):
     will be (None, []).
     """
 
-    return _do_get_recipients(client, project)
+    return _do_get_recipients(client, project, index=index)
 
 
-def get_allocation_recipients(client, allocation):
+def get_allocation_recipients(client, allocation, index=None):
     """Returns emails for a allocation
 
     Will return a tuple with the first item
@@ -167,17 +415,18 @@ def get_allocation_recipients(client, allocation):
         allocation.project_id,
         owner=owner_email,
         approver=approver_email,
+        index=index,
     )
 
 
 def _do_get_recipients(
-    client, project, owner=None, approver=None, limit=MAX_CC_COUNT
+    client, project, owner=None, approver=None, limit=MAX_CC_COUNT, index=None
 ):
     managers = get_project_users(
-        client, project, role=CONF.keystone.manager_role_id
+        client, project, role=CONF.keystone.manager_role_id, index=index
     )
     members = get_project_users(
-        client, project, role=CONF.keystone.member_role_id
+        client, project, role=CONF.keystone.member_role_id, index=index
     )
     manager_emails = get_emails(managers)
     member_emails = get_emails(members)